@@ -0,0 +1,195 @@
+import argparse
+import json
+import mnf_archive
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+"""
+Long-lived local server that keeps MNF file tables, archive maps and decompressed blobs warm between requests.
+
+    GET /lookup?mnf=eso&path=...   entry metadata as JSON (path, id=<hex FileID> or index=<table index>)
+    GET /read?mnf=eso&path=...     raw asset bytes
+    GET /stats                     per-endpoint latency and blob cache stats
+"""
+
+
+class LatencyStats:
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.counts = {}
+        self.window = window
+
+    def record(self, endpoint, seconds):
+        with self.lock:
+            if endpoint not in self.samples:
+                self.samples[endpoint] = deque(maxlen=self.window)
+                self.counts[endpoint] = 0
+            self.samples[endpoint].append(seconds)
+            self.counts[endpoint] += 1
+
+    def snapshot(self):
+        with self.lock:
+            stats = {}
+            for endpoint, samples in self.samples.items():
+                ordered = sorted(samples)
+                stats[endpoint] = {
+                    "requests": self.counts[endpoint],
+                    "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+                    "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+                    "p95_ms": round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000, 3),
+                    "max_ms": round(ordered[-1] * 1000, 3),
+                }
+            return stats
+
+
+class AssetServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, archives, verbose=True):
+        super().__init__(address, AssetRequestHandler)
+        self.archives = archives
+        self.latency = LatencyStats()
+        self.verbose = verbose
+
+
+class AssetRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        endpoint = url.path.rstrip("/") or "/"
+        try:
+            if endpoint == "/stats":
+                status, content_type, body = 200, "application/json", json.dumps(self.stats()).encode()
+            elif endpoint in ("/lookup", "/read"):
+                archive = self.server.archives.get(query.get("mnf", "eso"))
+                if archive is None:
+                    raise KeyError(f"Unknown mnf {query.get('mnf')}")
+                row = self.find_row(archive, query)
+                if endpoint == "/lookup":
+                    status, content_type, body = 200, "application/json", json.dumps(self.describe(archive, row)).encode()
+                else:
+                    try:
+                        data = archive.read_row(row)
+                    except Exception as e:
+                        # A missing archive or a failing codec is a broken setup or entry, not a missing asset
+                        raise RuntimeError(f"Entry {row} could not be read: {type(e).__name__}: {e}") from e
+                    if data is None:
+                        raise FileNotFoundError(f"Entry {row} could not be read from its archive")
+                    status, content_type, body = 200, "application/octet-stream", data
+            else:
+                status, content_type, body = 404, "text/plain", b"Unknown endpoint"
+        except (FileNotFoundError, KeyError) as e:
+            status, content_type, body = 404, "text/plain", str(e).encode()
+        except ValueError as e:
+            status, content_type, body = 400, "text/plain", str(e).encode()
+        except Exception as e:
+            # Anything else still gets an answer, and its latency recorded, instead of a dropped connection
+            status, content_type, body = 500, "text/plain", str(e).encode()
+        elapsed = time.perf_counter() - start
+        self.server.latency.record(endpoint, elapsed)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Elapsed-Ms", f"{elapsed*1000:.3f}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def find_row(self, archive, query):
+        if "path" in query:
+            row = archive.find(query["path"])
+        elif "id" in query:
+            row = archive.find_by_id(int(query["id"], 16))
+        elif "index" in query:
+            row = int(query["index"])
+            if not 0 <= row < len(archive):
+                row = None
+        else:
+            raise ValueError("Give one of path, id or index")
+        if row is None:
+            raise FileNotFoundError(f"No entry for {query}")
+        return row
+
+    def describe(self, archive, row):
+        entry = archive.entry(row)
+        return {
+            "index": entry.Index,
+            "file_id": f"{entry.FileID:016X}",
+            "file_index": entry.FileIndex,
+            "name": entry.ZosftEntry.FileName if entry.ZosftEntry else "",
+            "size": entry.Size,
+            "compressed_size": entry.CompressedSize,
+            "hash": entry.Hash,
+            "archive_index": entry.ArchiveIndex,
+            "offset": entry.Offset,
+            "compress_type": entry.CompressType,
+        }
+
+    def stats(self):
+        caches = {name: {"bytes": x.blobs.size, "blobs": len(x.blobs.blobs), "hits": x.blobs.hits, "misses": x.blobs.misses}
+                  for name, x in self.server.archives.items()}
+        return {"latency": self.server.latency.snapshot(), "cache": caches}
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class AssetClient:
+    def __init__(self, base_url="http://127.0.0.1:8765"):
+        self.base_url = base_url.rstrip("/")
+        # Server-side time of the last request
+        self.last_elapsed_ms = None
+
+    def get(self, endpoint, **query):
+        url = f"{self.base_url}{endpoint}?{urllib.parse.urlencode(query)}"
+        try:
+            with urllib.request.urlopen(url) as response:
+                self.last_elapsed_ms = float(response.headers["X-Elapsed-Ms"])
+                return response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                raise FileNotFoundError(e.read().decode()) from None
+            raise
+
+    def lookup(self, mnf="eso", **key):
+        return json.loads(self.get("/lookup", mnf=mnf, **key))
+
+    def read(self, mnf="eso", **key):
+        return self.get("/read", mnf=mnf, **key)
+
+    def stats(self):
+        return json.loads(self.get("/stats"))
+
+
+def serve(mnf_paths, host="127.0.0.1", port=8765, cache_bytes=1024 * 1024 * 1024, verbose=True):
+    archives = {}
+    for mnf_path in mnf_paths:
+        name = mnf_path.replace("\\", "/").split("/")[-1].split(".")[0]
+        archives[name] = mnf_archive.MnfArchive(mnf_path, cache_bytes)
+    server = AssetServer((host, port), archives, verbose)
+    print(f"Serving {', '.join(archives)} on http://{host}:{server.server_address[1]}")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve ESO assets from .mnf archives over local HTTP")
+    parser.add_argument("mnf", nargs="+")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache-mb", type=int, default=1024)
+    args = parser.parse_args()
+    server = serve(args.mnf, args.host, args.port, args.cache_mb * 1024 * 1024)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    for archive in server.archives.values():
+        archive.close()
@@ -0,0 +1,456 @@
+import argparse
+import contextlib
+import gf
+import game_mnf
+import glob
+import io
+import json
+import numpy as np
+import os
+import pkg_db
+import synth
+import tempfile
+import time
+
+"""
+Timings for the hot paths of the extractor against synthetic data from synth.py, no game install needed.
+Parsers keep the old implementation next to them so the speedup is measured, not guessed,
+the pipeline benchmarks are absolute numbers to compare between commits (--json keeps them).
+
+    python benchmark.py --scale 0.1 --json baseline.json
+"""
+
+# Every timing of this run, written out with --json
+results = {}
+
+
+def timed(func, *args, repeat=3):
+    best = None
+    result = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def add_result(name, result):
+    # Names are the keys of the --json output, two timings under one name would silently drop the first
+    if name in results:
+        raise Exception(f"Benchmark result {name!r} recorded twice, its name needs to say what differs")
+    results[name] = result
+
+
+def report(name, old_time, new_time):
+    print(f"{name}: old {old_time*1000:.1f}ms, new {new_time*1000:.1f}ms, {old_time/new_time:.1f}x")
+    add_result(name, {"old_seconds": old_time, "seconds": new_time})
+
+
+def record(name, seconds, **rates):
+    """
+    One absolute timing, rates are per second figures like files=1000 for files/s.
+    """
+    per_second = {unit: count / seconds for unit, count in rates.items()}
+    print(f"{name}: {seconds*1000:.1f}ms" + "".join(f", {x:,.0f} {unit}/s" for unit, x in per_second.items()))
+    add_result(name, {"seconds": seconds, **{f"{unit}_per_s": x for unit, x in per_second.items()}})
+
+
+@contextlib.contextmanager
+def quiet():
+    # The extractors print progress per file
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def legacy_parse_table(block3):
+    m_FileTable = []
+    MNF_BLOCK1_RECORDSIZE = 4
+    MNF_BLOCK2_RECORDSIZE = 8
+    MNF_BLOCK3_RECORDSIZE = 20
+    offset1 = 0
+    offset2 = 0
+    offset3 = 0
+    for i in range(block3.record23_count):
+        entry = game_mnf.TableEntry()
+        entry.Index = i
+        if offset1 + MNF_BLOCK1_RECORDSIZE <= len(block3.data[0]):
+            while offset1 + MNF_BLOCK1_RECORDSIZE <= len(block3.data[0]) and block3.data[0][offset1+3] != 0x80:
+                offset1 += MNF_BLOCK1_RECORDSIZE
+            entry.ID1 = gf.get_uint32(block3.data[0], offset1)
+            offset1 += MNF_BLOCK1_RECORDSIZE
+
+        if offset2 + MNF_BLOCK2_RECORDSIZE <= len(block3.data[1]):
+            entry.FileIndex = gf.get_uint32(block3.data[1], offset2)
+            entry.Unk1 = gf.get_uint32(block3.data[1], offset2+4)
+            entry.FileID = gf.get_uint64(block3.data[1], offset2)
+            offset2 += MNF_BLOCK2_RECORDSIZE
+
+        if offset3 + MNF_BLOCK3_RECORDSIZE <= len(block3.data[2]):
+            entry.Size = gf.get_uint32(block3.data[2], offset3)
+            entry.CompressedSize = gf.get_uint32(block3.data[2], offset3+4)
+            entry.Hash = gf.get_uint32(block3.data[2], offset3+8)
+            entry.Offset = gf.get_uint32(block3.data[2], offset3+12)
+            entry.CompressType = block3.data[2][offset3+16]
+            entry.ArchiveIndex = block3.data[2][offset3+17]
+            entry.Unk2 = gf.get_uint16(block3.data[2], offset3+18)
+            offset3 += MNF_BLOCK3_RECORDSIZE
+
+            # Header version 3
+            tmp = entry.CompressType
+            entry.CompressType = entry.ArchiveIndex
+            entry.ArchiveIndex = tmp
+
+        m_FileTable.append(entry)
+    return m_FileTable
+
+
+def legacy_create_file_maps(file_table):
+    file_hash_map = {}
+    file_index_map = {}
+    file_internal_index_map = {}
+    for x in file_table:
+        file_hash_map[x.Hash] = x
+        file_index_map[x.FileIndex] = x
+        file_internal_index_map[x.Index] = x
+    return file_hash_map, file_index_map, file_internal_index_map
+
+
+def bench_parse_table(count=300000):
+    block3 = synth.make_block3(count)
+    old_time, _ = timed(lambda: legacy_create_file_maps(legacy_parse_table(block3)), repeat=1)
+    new_time, _ = timed(lambda: game_mnf.create_file_maps(game_mnf.parse_table(block3)))
+    report(f"parse_table + create_file_maps ({count} entries)", old_time, new_time)
+
+    # Columns must match the object-per-entry path exactly
+    old_table = legacy_parse_table(block3)
+    new_table = game_mnf.parse_table(block3)
+    for name in game_mnf.MNF_TABLE_DTYPE.names:
+        if [getattr(x, name) for x in old_table] != new_table.column(name).tolist():
+            raise Exception(f"parse_table column {name} differs from the legacy parser")
+
+
+def legacy_parse_zosft(zosft_data):
+    record_count = gf.get_uint32(zosft_data, 0xF)
+    blocks = []
+    offset = 0x13
+    for i in range(3):
+        block_type = gf.get_uint16(zosft_data, offset)
+        block, offset = game_mnf.read_block_3_f(zosft_data, offset+2)
+        if block:
+            blocks.append(block)
+        else:
+            offset += 0x10
+    file_names_length = gf.get_uint32(zosft_data, offset)
+    offset += 4
+    filenames = {}
+    string = ''
+    i = 0
+    start_offset = 0
+    while i < file_names_length:
+        char = zosft_data[offset+i]
+        if char == 0:
+            i += 1
+            filenames[start_offset] = string
+            string = ''
+            start_offset = i
+        else:
+            string += chr(char)
+            i += 1
+
+    offset11 = 0
+    offset13 = 0
+    offset23 = 0
+    MNF_BLOCK1_RECORDSIZE = 4
+    filetable = []
+    for i in range(record_count):
+        ft_entry = game_mnf.FileTableEntry()
+        ft_entry.UserData = 0
+        ft_entry.Index = i
+        if offset11 < len(blocks[0].data[0]):
+            while offset11 + MNF_BLOCK1_RECORDSIZE <= len(blocks[0].data[0]) and blocks[0].data[0][offset11 + 3] != 0x80:
+                offset11 += MNF_BLOCK1_RECORDSIZE
+            ft_entry.Index11 = gf.get_uint32(blocks[0].data[0], offset11)
+            offset11 += MNF_BLOCK1_RECORDSIZE
+
+        if offset13 < len(blocks[0].data[2]):
+            ft_entry.Index13 = gf.get_uint32(blocks[0].data[2], offset13)
+            offset13 += MNF_BLOCK1_RECORDSIZE
+
+        if offset23 < len(blocks[1].data[2]):
+            ft_entry.FileIndex = gf.get_uint32(blocks[1].data[2], offset23)
+            offset23 += MNF_BLOCK1_RECORDSIZE
+            ft_entry.FilenameOffset = gf.get_uint32(blocks[1].data[2], offset23)
+            offset23 += MNF_BLOCK1_RECORDSIZE
+            ft_entry.FileID = gf.get_uint32(blocks[1].data[2], offset23)
+            offset23 += MNF_BLOCK1_RECORDSIZE*2
+            if ft_entry.FilenameOffset in filenames.keys():
+                ft_entry.FileName = filenames[ft_entry.FilenameOffset]
+            else:
+                ft_entry.FileName = ""
+        filetable.append(ft_entry)
+
+    file_index_map = {}
+    for x in filetable:
+        file_index_map[x.FileIndex] = x
+    return file_index_map
+
+
+def bench_zosft(count=300000):
+    zosft_data = synth.make_random_zosft(count)
+    old_time, old_map = timed(legacy_parse_zosft, zosft_data, repeat=1)
+    new_time, new_table = timed(game_mnf.parse_zosft, zosft_data)
+    report(f"load_zosft_file ({count} records, {len(zosft_data)/1e6:.1f}MB)", old_time, new_time)
+
+    file_indices = list(old_map.keys())
+    rows = new_table.rows_for_file_indices(np.array(file_indices, dtype=np.uint32)).tolist()
+    for file_index, row in zip(file_indices, rows):
+        old_entry = old_map[file_index]
+        new_entry = new_table.entry(row)
+        for name in ("Index", "Index11", "Index13", "FileIndex", "FilenameOffset", "FileID", "FileName"):
+            if getattr(old_entry, name) != getattr(new_entry, name):
+                raise Exception(f"ZOSFT {name} differs from the legacy parser for FileIndex {file_index}")
+
+
+def bench_binary_view(count=200000):
+    """
+    gf slice helpers against BinaryView on relocation-like records of 3 uint32 and vertex-like runs of 3 floats.
+    """
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 2**32, count * 3, dtype=np.uint32).tobytes()
+    floats = rng.standard_normal(count * 3).astype("<f4").tobytes()
+    view = gf.BinaryView(data)
+    float_view = gf.BinaryView(floats)
+
+    def old_absolute():
+        return [[gf.get_uint32(data, i + k*4) for k in range(3)] for i in range(0, len(data), 12)]
+
+    def new_absolute():
+        return [[view.uint32(i + k*4) for k in range(3)] for i in range(0, len(data), 12)]
+
+    def old_file():
+        fb = io.BytesIO(data)
+        return [[gf.get_uint32(fb.read(4), 0) for k in range(3)] for i in range(count)]
+
+    def new_cursor():
+        view.seek(0)
+        return [[view.uint32() for k in range(3)] for i in range(count)]
+
+    def new_records():
+        return [list(x) for x in view.iter_unpack("III", count, 0)]
+
+    def old_floats():
+        return [[gf.get_float32(floats, i + k*4) for k in range(3)] for i in range(0, len(floats), 12)]
+
+    def new_floats():
+        return [list(float_view.unpack("3f", i)) for i in range(0, len(floats), 12)]
+
+    for name, old_func, new_func in (("absolute uint32", old_absolute, new_absolute), ("file read uint32", old_file, new_cursor),
+                                     ("uint32 records", old_absolute, new_records), ("float32 records", old_floats, new_floats)):
+        old_time, old_result = timed(old_func)
+        new_time, new_result = timed(new_func)
+        if old_result != new_result:
+            raise Exception(f"BinaryView {name} differs from the gf helpers")
+        report(f"BinaryView {name} ({count} records)", old_time, new_time)
+
+
+def legacy_decode_vertices(fb, vertex_offset, vertex_count, stride):
+    fb.seek(vertex_offset, 0)
+    vert_pos = []
+    for w in range(vertex_count):
+        vert_pos.append([gf.get_float32(fb.read(4), 0) for k in range(3)])
+        fb.seek(stride - 12, 1)
+    return vert_pos
+
+
+def bench_vertex_decode(count=200000, stride=40):
+    try:
+        import gr2_extract
+    except ImportError as e:
+        print(f"vertex decode: skipped, {e}")
+        return
+    data = np.random.default_rng(0).standard_normal(count * stride // 4).astype("<f4").tobytes()
+    old_time, old_pos = timed(lambda: legacy_decode_vertices(io.BytesIO(data), 0, count, stride), repeat=1)
+    new_time, new_pos = timed(lambda: gr2_extract.vertex_attribute(data, 0, count, stride).copy())
+    if not np.array_equal(np.array(old_pos, dtype=np.float32), new_pos):
+        raise Exception("vertex_attribute differs from the per-vertex reads")
+    report(f"vertex decode ({count} vertices, stride {stride})", old_time, new_time)
+
+
+def legacy_remap_submesh(faces, verts):
+    dsort = set()
+    for face in faces:
+        for f in face:
+            dsort.add(f)
+    dsort = sorted(dsort)
+    d = dict(zip(dsort, range(max(dsort) + 1)))
+    for j in range(len(faces)):
+        for k in range(3):
+            faces[j][k] = d[faces[j][k]]
+    return faces, [verts[i] for i in dsort]
+
+
+def bench_submesh_remap(tri_count=1000000):
+    try:
+        import gr2_extract
+    except ImportError as e:
+        print(f"submesh remap: skipped, {e}")
+        return
+    rng = np.random.default_rng(0)
+    # A submesh using half of a mesh's vertices, like one part of a bigger model
+    vertex_count = tri_count
+    verts = rng.standard_normal((vertex_count, 3)).astype(np.float32)
+    used = np.sort(rng.choice(vertex_count, vertex_count // 2, replace=False))
+    faces = used[rng.integers(0, len(used), (tri_count, 3))].astype("<u4")
+    old_time, (old_faces, old_verts) = timed(lambda: legacy_remap_submesh(faces.tolist(), verts.tolist()), repeat=1)
+    new_time, (new_faces, new_verts) = timed(gr2_extract.remap_submesh, faces, verts)
+    if new_faces.tolist() != old_faces or not np.array_equal(np.array(old_verts, dtype=np.float32), new_verts):
+        raise Exception("remap_submesh differs from the set and dict remap")
+    report(f"submesh remap ({tri_count} triangles)", old_time, new_time)
+
+
+def bench_extract_files(directory, depot, workers):
+    game_mnf.path = depot["mnf"]
+    with quiet():
+        load_time, file_table = timed(lambda: game_mnf.load_file_table(use_cache=False)[0], repeat=1)
+        # The first cached load parses and writes the cache, the timed ones map it
+        game_mnf.load_file_table(f"{directory}/cache")
+        warm_time, _ = timed(lambda: game_mnf.load_file_table(f"{directory}/cache")[0])
+    record(f"load_file_table parse ({len(file_table)} entries)", load_time, entries=len(file_table))
+    record(f"load_file_table cached ({len(file_table)} entries)", warm_time, entries=len(file_table))
+
+    for worker_count in sorted({1, workers}):
+        output_dir = f"{directory}/extract_{worker_count}"
+        with quiet():
+            elapsed, (files, written, skipped) = timed(
+                lambda: game_mnf.extract_files(file_table, worker_count, output_dir=output_dir), repeat=1)
+        record(f"extract_files ({worker_count} workers, {files} files, {written/1e6:.0f}MB)", elapsed, files=files, MB=written/1e6)
+    return file_table, f"{directory}/extract_1"
+
+
+def bench_gr2(depot, output_dir, file_table):
+    try:
+        import gr2_extract
+    except ImportError as e:
+        print(f"GR2.extract: skipped, {e}")
+        return
+    paths = [f"{output_dir}/{gf.fill_hex_with_zeros(str(file_table[row].ArchiveIndex), 4)}/{gf.fill_hex_with_zeros(str(row), 8)}.gr2"
+             for row in depot["models"]]
+
+    def extract_all():
+        triangles = 0
+        for file_path in paths:
+            with gr2_extract.GR2(file_path) as gr2:
+                gr2.extract(mesh_only=True, save=False)
+            triangles += sum(s.tri_count for m in gr2.meshes for s in m.submeshes)
+        return triangles
+    with quiet():
+        elapsed, triangles = timed(extract_all, repeat=1)
+    record(f"GR2.extract ({len(paths)} models)", elapsed, models=len(paths), triangles=triangles)
+
+
+def bench_mesh_decode(directory, workers, count=48, vertex_count=32768):
+    """
+    MeshCache.get_many on models big enough to pass its parallel cutoff, serial against a pool of workers.
+    """
+    import mesh_cache
+    rng = np.random.default_rng(0)
+    paths = []
+    os.makedirs(f"{directory}/meshes", exist_ok=True)
+    for i in range(count):
+        file_path = f"{directory}/meshes/{i:08}.gr2"
+        with open(file_path, "wb") as f:
+            f.write(synth.make_gr2(rng, vertex_count=vertex_count, tri_count=vertex_count // 2))
+        paths.append(file_path)
+    size = sum(os.path.getsize(x) for x in paths)
+    # Fresh memory-only caches, so both runs decode every model
+    serial_time, _ = timed(lambda: mesh_cache.MeshCache(b_disk=False).get_many(paths, workers=1), repeat=1)
+    parallel_time, _ = timed(lambda: mesh_cache.MeshCache(b_disk=False, parallel_bytes=0).get_many(paths, workers=workers),
+                             repeat=1)
+    report(f"MeshCache.get_many ({count} models, {size/1e6:.0f}MB, serial vs {workers} workers)", serial_time, parallel_time)
+
+
+def bench_extract_map(directory, depot, output_dir, file_table, workers):
+    try:
+        import map_extraction
+        import mesh_cache
+    except ImportError as e:
+        print(f"extract_map: skipped, {e}")
+        return
+    cwd = os.getcwd()
+    # The MNF db and the maps/ output are relative to the working directory
+    os.chdir(directory)
+    try:
+        with quiet():
+            pkg_db.save_mnf_table(file_table, True)
+            pkg_db.start_mnf_connection()
+        os.makedirs("maps", exist_ok=True)
+        for row in depot["maps"]:
+            map_path = glob.glob(f"{output_dir}/*/{gf.fill_hex_with_zeros(str(row), 8)}.bin")[0]
+            placements = gf.get_uint32(open(map_path, "rb").read(8), 4)
+            # Fresh memory-only caches, so both runs decode every model
+            with quiet():
+                serial_time, _ = timed(lambda: map_extraction.extract_map(
+                    map_path, output_dir, mesh_cache.MeshCache(b_disk=False), workers=1), repeat=1)
+                parallel_time, _ = timed(lambda: map_extraction.extract_map(
+                    map_path, output_dir, mesh_cache.MeshCache(b_disk=False), workers=workers), repeat=1)
+            report(f"extract_map {os.path.basename(map_path)} ({placements} placements, serial vs {workers} workers)",
+                   serial_time, parallel_time)
+    finally:
+        os.chdir(cwd)
+
+
+def bench_gr2_batch(directory, output_dir, workers):
+    try:
+        import gr2_batch
+    except ImportError as e:
+        print(f"gr2_batch.convert: skipped, {e}")
+        return
+    cwd = os.getcwd()
+    # models/ and the manifest are written relative to the working directory
+    os.chdir(directory)
+    try:
+        with quiet():
+            elapsed, run_metrics = timed(lambda: gr2_batch.convert([output_dir], "gr2_manifest.csv", workers=workers), repeat=1)
+        files = sum(run_metrics.failures.values()) + run_metrics.counters["models"]
+        record(f"gr2_batch.convert ({files} files, {workers} workers)", elapsed, files=files,
+               triangles=run_metrics.counters["triangles"])
+    finally:
+        os.chdir(cwd)
+
+
+def bench_pipeline(scale=1.0, workers=4, directory=None):
+    """
+    Generates one synthetic depot and runs the whole pipeline over it: load, extract, GR2 and map export.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = directory or tmp
+        start = time.perf_counter()
+        depot = synth.generate(f"{directory}/depot", count=int(20000 * scale), models=max(int(200 * scale), 1),
+                               maps=2, placements=max(int(5000 * scale), 1))
+        print(f"Generated {depot['bytes']/1e6:.0f}MB of synthetic data in {time.perf_counter() - start:.1f}s")
+        file_table, output_dir = bench_extract_files(directory, depot, workers)
+        bench_gr2(depot, output_dir, file_table)
+        bench_gr2_batch(directory, output_dir, workers)
+        bench_extract_map(directory, depot, output_dir, file_table, workers)
+        bench_mesh_decode(directory, workers, max(int(48 * scale), 2))
+        game_mnf.get_archives().close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the extractor on synthetic data")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every entry count")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--keep", metavar="DIR", help="generate into DIR and keep it instead of a temporary directory")
+    parser.add_argument("--json", metavar="PATH", help="write every timing to PATH")
+    args = parser.parse_args()
+    bench_parse_table(int(300000 * args.scale))
+    bench_zosft(int(300000 * args.scale))
+    bench_binary_view(int(200000 * args.scale))
+    bench_vertex_decode(int(200000 * args.scale))
+    bench_submesh_remap(int(1000000 * args.scale))
+    bench_pipeline(args.scale, args.workers, args.keep)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,81 @@
+import os
+import shutil
+
+"""
+Content-addressed store for deduplicated extraction. Every unique payload is kept once under
+{output_dir}/.objects/<digest[:2]>/<digest> and each output path is a hardlink or reflink to its object.
+"""
+
+# linux/fs.h FICLONE, clones the extents of one file into another on btrfs, xfs and friends
+FICLONE = 0x40049409
+
+LINK_MODES = ("hardlink", "reflink", "manifest")
+
+
+def reflink(source_path, target_path):
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("Reflinks need fcntl, falling back to a copy") from None
+    with open(source_path, "rb") as src, open(target_path, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+class ContentStore:
+    def __init__(self, output_dir, link_mode="hardlink"):
+        if link_mode not in LINK_MODES:
+            raise Exception(f"Unknown link mode {link_mode}, expected one of {', '.join(LINK_MODES)}")
+        self.root = f"{output_dir}/.objects"
+        self.link_mode = link_mode
+        # Links that fell back to a full copy because the filesystem couldn't share the data
+        self.copies = 0
+
+    def object_path(self, digest):
+        return f"{self.root}/{digest[:2]}/{digest}"
+
+    def link(self, source_path, target_path):
+        """
+        Makes target_path share source_path's data, replacing whatever is there.
+        Reflinks fall back to hardlinks where the filesystem can't clone, and either falls back to a copy.
+        Returns False if it had to copy.
+        """
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_path = target_path + ".link"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        b_shared = True
+        try:
+            if self.link_mode == "reflink":
+                try:
+                    reflink(source_path, tmp_path)
+                except OSError:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    os.link(source_path, tmp_path)
+            else:
+                os.link(source_path, tmp_path)
+        except OSError:
+            shutil.copyfile(source_path, tmp_path)
+            self.copies += 1
+            b_shared = False
+        os.replace(tmp_path, target_path)
+        return b_shared
+
+    def add(self, file_path, digest):
+        """
+        Files a freshly extracted path under its digest. If the object is already stored, file_path is swapped
+        for a link to it and True is returned, the bytes of file_path were a duplicate.
+        """
+        if self.link_mode == "manifest":
+            return False
+        object_path = self.object_path(digest)
+        if os.path.exists(object_path):
+            return self.link(object_path, file_path)
+        self.link(file_path, object_path)
+        return False
+
+    def materialize(self, digest, file_path):
+        """
+        Creates file_path from a stored object, returns False if the data had to be copied.
+        """
+        return self.link(self.object_path(digest), file_path)
@@ -0,0 +1,67 @@
+import gf
+import mmap
+import os
+import threading
+
+
+class ArchiveSet:
+    """
+    The eso00NN.dat/game00NN.dat archives that sit next to an .mnf.
+    Each archive is memory-mapped once on first use and reads are zero-copy memoryview slices.
+    """
+
+    def __init__(self, mnf_path):
+        self.mnf_path = mnf_path
+        self.base_path = os.path.splitext(mnf_path)[0]
+        self.maps = {}
+        self.lock = threading.Lock()
+
+    def archive_path(self, archive_index):
+        return self.base_path + f"{gf.fill_hex_with_zeros(str(archive_index), 4)}.dat"
+
+    def get_map(self, archive_index):
+        archive_map = self.maps.get(archive_index)
+        if archive_map is not None:
+            return archive_map
+        with self.lock:
+            if archive_index in self.maps:
+                return self.maps[archive_index]
+            with open(self.archive_path(archive_index), "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    archive_map = b""
+                else:
+                    archive_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[archive_index] = archive_map
+        return archive_map
+
+    def archive_size(self, archive_index):
+        return len(self.get_map(archive_index))
+
+    def read(self, archive_index, offset, size):
+        """
+        Returns a memoryview of size bytes at offset, or None if that runs past the end of the archive.
+        """
+        archive_map = self.get_map(archive_index)
+        if offset + size > len(archive_map):
+            return None
+        return memoryview(archive_map)[offset:offset+size]
+
+    def read_entry(self, entry):
+        return self.read(entry.ArchiveIndex, entry.Offset, entry.CompressedSize)
+
+    def close(self):
+        with self.lock:
+            for archive_map in self.maps.values():
+                if isinstance(archive_map, mmap.mmap):
+                    try:
+                        archive_map.close()
+                    except BufferError:
+                        # Slices are still alive somewhere, the map closes once they are collected
+                        pass
+            self.maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,382 @@
+import contextlib
+import os
+import threading
+import time
+import zlib
+from ctypes import c_char, c_void_p, cdll
+import numpy as np
+
+"""
+Decompression codecs for MNF entries, looked up by CompressType and by the magic bytes at the start of the payload.
+Backends are loaded lazily, once per process, and every codec keeps throughput counters.
+"""
+
+oodle_library_path = os.environ.get("OODLE_LIBRARY", "I:/oo2core_8_win64.dll")
+# Most decompressed bytes a streaming codec holds at once
+stream_chunk_size = 1024 * 1024
+
+
+class OodleDecompressor:
+    """
+    Oodle decompression implementation.
+    Requires Windows and the external Oodle library.
+    """
+
+    def __init__(self, library_path: str) -> None:
+        """
+        Initialize instance and try to load the library.
+        """
+        if not os.path.exists(library_path):
+            raise Exception("Could not open Oodle DLL, make sure it is configured correctly.")
+
+        try:
+            self.handle = cdll.LoadLibrary(library_path)
+        except OSError as e:
+            raise Exception(
+                "Could not load Oodle DLL, requires Windows and 64bit python to run."
+            ) from e
+
+    def decompress(self, payload, output_size: int, out=None):
+        """
+        Decompress the payload using the given size, into out if given.
+        """
+        if out is None:
+            out = bytearray(output_size)
+        # Read-only payloads (mmap slices) can't go through from_buffer, numpy gives us the address without a copy
+        src = np.frombuffer(payload, dtype=np.uint8)
+        dst = (c_char * output_size).from_buffer(out)
+        written = self.handle.OodleLZ_Decompress(
+            c_void_p(src.ctypes.data), len(payload), dst, output_size,
+            0, 0, 0, None, None, None, None, None, None, 3)
+        if written <= 0:
+            raise Exception(f"Oodle decompression failed for {len(payload)} byte payload")
+        return memoryview(out)[:written]
+
+
+class MemoryBudget:
+    """
+    Caps the decompressed bytes held at once by every worker sharing this budget.
+    A reservation bigger than the whole budget waits until nothing else is reserved.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.peak = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size):
+        size = min(size, self.max_bytes)
+        with self.condition:
+            while self.used and self.used + size > self.max_bytes:
+                self.condition.wait()
+            self.used += size
+            self.peak = max(self.peak, self.used)
+        return size
+
+    def release(self, size):
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def reserve(self, size):
+        size = self.acquire(size)
+        try:
+            yield
+        finally:
+            self.release(size)
+
+
+class Codec:
+    name = ""
+    # Streaming codecs only ever hold stream_chunk_size decompressed bytes, the rest need the whole output at once
+    b_streams = False
+
+    def __init__(self):
+        self.loaded = False
+        self.load_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.calls = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self.load_lock:
+            if not self.loaded:
+                self.load()
+                self.loaded = True
+
+    def load(self):
+        pass
+
+    def decompress(self, payload, output_size, out=None):
+        """
+        Decompress payload, writing into the caller's buffer when out is given.
+        Returns the decompressed bytes or a memoryview over out.
+        """
+        self.ensure_loaded()
+        start = time.perf_counter()
+        data = self.run(payload, output_size, out)
+        self.record(len(payload), len(data), time.perf_counter() - start)
+        return data
+
+    def decompress_stream(self, payload, output_size, write, out=None):
+        """
+        Decompress payload and pass it to write in pieces of at most stream_chunk_size for streaming codecs,
+        or in one piece decompressed into out otherwise. Returns the number of bytes written.
+        """
+        self.ensure_loaded()
+        start = time.perf_counter()
+        write_seconds = 0.0
+        written = 0
+        for data in self.run_stream(payload, output_size, out):
+            write_start = time.perf_counter()
+            write(data)
+            write_seconds += time.perf_counter() - write_start
+            written += len(data)
+        # Time spent writing is the caller's, not the codec's
+        self.record(len(payload), written, time.perf_counter() - start - write_seconds)
+        return written
+
+    def record(self, bytes_in, bytes_out, seconds):
+        with self.stats_lock:
+            self.calls += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.seconds += seconds
+
+    def run(self, payload, output_size, out):
+        raise NotImplementedError
+
+    def run_stream(self, payload, output_size, out):
+        yield self.run(payload, output_size, out)
+
+    def throughput(self):
+        mb_per_s = self.bytes_out / self.seconds / 1e6 if self.seconds else 0.0
+        return {"calls": self.calls, "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+                "seconds": round(self.seconds, 6), "mb_per_s": round(mb_per_s, 2)}
+
+
+def copy_into(data, out):
+    if out is None:
+        return data
+    out[:len(data)] = data
+    return memoryview(out)[:len(data)]
+
+
+class RawCodec(Codec):
+    name = "raw"
+    b_streams = True
+
+    def run(self, payload, output_size, out):
+        return copy_into(payload, out)
+
+    def run_stream(self, payload, output_size, out):
+        # Slices of the archive map, nothing is copied
+        payload = memoryview(payload)
+        for start in range(0, len(payload), stream_chunk_size):
+            yield payload[start:start+stream_chunk_size]
+
+
+class ZlibCodec(Codec):
+    name = "zlib"
+    b_streams = True
+
+    def run(self, payload, output_size, out):
+        return copy_into(zlib.decompress(payload, bufsize=max(output_size, zlib.DEF_BUF_SIZE)), out)
+
+    def run_stream(self, payload, output_size, out):
+        return inflate_chunks(payload)
+
+
+def inflate_chunks(payload, chunk_size=None):
+    """
+    Yields the inflated payload in pieces of at most chunk_size bytes.
+    Input is fed in slices too, so unconsumed_tail never copies more than one slice of the payload.
+    Raises zlib.error if the payload ends before the stream does.
+    """
+    if chunk_size is None:
+        chunk_size = stream_chunk_size
+    payload = memoryview(payload)
+    inflater = zlib.decompressobj()
+    for start in range(0, len(payload), chunk_size):
+        pending = payload[start:start+chunk_size]
+        while pending:
+            data = inflater.decompress(pending, chunk_size)
+            pending = inflater.unconsumed_tail
+            if data:
+                yield data
+        if inflater.eof:
+            return
+    data = inflater.flush()
+    if data:
+        yield data
+    # zlib.decompress raises for a cut off stream, the streaming path has to ask
+    if not inflater.eof:
+        raise zlib.error("Error -5 while decompressing data: incomplete or truncated stream")
+
+
+class OodleCodec(Codec):
+    name = "oodle"
+
+    def __init__(self):
+        super().__init__()
+        self.decompressor = None
+
+    def load(self):
+        self.decompressor = OodleDecompressor(oodle_library_path)
+
+    def run(self, payload, output_size, out):
+        return self.decompressor.decompress(payload, output_size, out)
+
+
+class SnappyCodec(Codec):
+    """
+    Raw (unframed) snappy. Uses the python-snappy bindings when installed, otherwise a pure python decoder.
+    """
+    name = "snappy"
+
+    def __init__(self):
+        super().__init__()
+        self.native = None
+
+    def load(self):
+        try:
+            import snappy
+            self.native = snappy.uncompress
+        except ImportError:
+            self.native = None
+
+    def run(self, payload, output_size, out):
+        if self.native:
+            return copy_into(self.native(bytes(payload)), out)
+        return snappy_decompress(payload, out)
+
+
+def snappy_decompress(payload, out=None):
+    src = memoryview(payload).cast("B")
+    length = 0
+    shift = 0
+    pos = 0
+    while True:
+        if pos >= len(src):
+            raise Exception("Snappy stream is truncated")
+        b = src[pos]
+        pos += 1
+        length |= (b & 0x7F) << shift
+        shift += 7
+        if b < 0x80:
+            break
+    if out is None:
+        out = bytearray(length)
+    dst = memoryview(out)
+    o = 0
+    while pos < len(src):
+        tag = src[pos]
+        pos += 1
+        tag_type = tag & 3
+        if tag_type == 0:
+            n = tag >> 2
+            if n >= 60:
+                extra = n - 59
+                if pos + extra > len(src):
+                    raise Exception("Snappy stream is truncated")
+                n = int.from_bytes(src[pos:pos+extra], "little")
+                pos += extra
+            n += 1
+            if pos + n > len(src):
+                raise Exception("Snappy stream is truncated")
+            if o + n > length:
+                raise Exception(f"Snappy stream decodes past its {length} bytes")
+            dst[o:o+n] = src[pos:pos+n]
+            pos += n
+            o += n
+            continue
+        # Offset bytes after the tag, by copy type
+        extra = (0, 1, 2, 4)[tag_type]
+        if pos + extra > len(src):
+            raise Exception("Snappy stream is truncated")
+        if tag_type == 1:
+            n = ((tag >> 2) & 7) + 4
+            offset = ((tag >> 5) << 8) | src[pos]
+        else:
+            n = (tag >> 2) + 1
+            offset = int.from_bytes(src[pos:pos+extra], "little")
+        pos += extra
+        if offset == 0 or offset > o:
+            raise Exception("Snappy copy offset is out of range")
+        if o + n > length:
+            raise Exception(f"Snappy stream decodes past its {length} bytes")
+        if offset >= n:
+            dst[o:o+n] = dst[o-offset:o-offset+n]
+        else:
+            # Overlapping copy repeats the last offset bytes
+            for k in range(n):
+                dst[o+k] = dst[o-offset+k]
+        o += n
+    if o != length:
+        raise Exception(f"Snappy stream decoded to {o} bytes, expected {length}")
+    return dst[:length]
+
+
+codecs = {}
+compress_type_codecs = {1: "zlib", 2: "snappy"}
+magic_codecs = {
+    b"\x78\x9C": "zlib",
+    b"\x8C\x06": "oodle",
+    b"\xCC\x0A": "oodle",
+    b"\xCC\x06": "oodle",
+    b"\x8C\x0A": "oodle",
+}
+
+
+def register_codec(codec, compress_type=None, magics=()):
+    codecs[codec.name] = codec
+    if compress_type is not None:
+        compress_type_codecs[compress_type] = codec.name
+    for magic in magics:
+        magic_codecs[bytes(magic)] = codec.name
+
+
+def get_codec(name):
+    return codecs[name]
+
+
+def codec_for_magic(payload):
+    name = magic_codecs.get(bytes(payload[:2]))
+    if name is None:
+        return None
+    return codecs[name]
+
+
+def codec_for_entry(compress_type, payload):
+    """
+    CompressType 0 means the payload's magic decides, anything without a known magic is stored raw.
+    Returns None for unknown compress types.
+    """
+    if compress_type == 0:
+        codec = codec_for_magic(payload)
+        if codec is None:
+            return codecs["raw"]
+        return codec
+    name = compress_type_codecs.get(compress_type)
+    if name is None:
+        return None
+    return codecs[name]
+
+
+def throughput():
+    return {name: codec.throughput() for name, codec in codecs.items() if codec.calls}
+
+
+def print_throughput():
+    for name, stats in throughput().items():
+        print(f"{name}: {stats['calls']} files, {stats['bytes_in']/1e6:.1f}MB -> {stats['bytes_out']/1e6:.1f}MB, {stats['mb_per_s']}MB/s")
+
+
+for _codec in (RawCodec(), ZlibCodec(), OodleCodec(), SnappyCodec()):
+    register_codec(_codec)
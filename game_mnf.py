@@ -1,39 +1,24 @@
 import gf
 import zlib
-from ctypes import cdll, c_char_p, create_string_buffer
+import numpy as np
 import os
 import pkg_db
-
-
-class OodleDecompressor:
-    """
-    Oodle decompression implementation.
-    Requires Windows and the external Oodle library.
-    """
-
-    def __init__(self, library_path: str) -> None:
-        """
-        Initialize instance and try to load the library.
-        """
-        if not os.path.exists(library_path):
-            raise Exception("Could not open Oodle DLL, make sure it is configured correctly.")
-
-        try:
-            self.handle = cdll.LoadLibrary(library_path)
-        except OSError as e:
-            raise Exception(
-                "Could not load Oodle DLL, requires Windows and 64bit python to run."
-            ) from e
-
-    def decompress(self, payload: bytes, output_size: int) -> bytes:
-        """
-        Decompress the payload using the given size.
-        """
-        output = create_string_buffer(output_size)
-        self.handle.OodleLZ_Decompress(
-            c_char_p(payload), len(payload), output, output_size,
-            0, 0, 0, None, None, None, None, None, None, 3)
-        return output.raw
+import content_store
+import dat_archive
+import decompression
+import journal
+import manifest_cache
+import metrics
+import sniff
+import argparse
+import collections
+import csv
+import glob
+import hashlib
+import concurrent.futures
+import multiprocessing
+import threading
+import time
 
 
 class MnfBlock:
@@ -46,22 +31,25 @@ class MnfBlock:
 
 
 def read_header(fb):
+    """
+    fb is a gf.BinaryView over the whole .mnf, read from its cursor.
+    """
     mnf_magic = fb.read(4)
     if mnf_magic != b"\x4D\x45\x53\x32":
         TypeError("Incorrect data file given")
     version = fb.read(2)
     if version != 3:
         TypeError("Incorrect version given")
-    data_file_count = gf.get_uint16(fb.read(2), 0)
+    data_file_count = fb.uint16()
     fb.seek(data_file_count*2, 1)
     q = fb.tell()
     unk1 = fb.read(4)
-    data_length = gf.get_uint32(fb.read(4), 0)
-    block_type = gf.get_uint32(fb.read(2), 0, le=False)
+    data_length = fb.uint32()
+    block_type = fb.uint16(le=False)
     block3 = None
     if block_type == 0:
         read_block_0(fb)
-        block_type = gf.get_uint32(fb.read(2), 0, le=False)
+        block_type = fb.uint16(le=False)
 
     if block_type == 3:
         block3 = read_block_3(fb)
@@ -78,46 +66,45 @@ def read_block_0(fb):
     # NOT ZLIB COMPRESSION
     # SOMETHING ELSE
     for i in range(data_count):
-        comp_size = gf.get_uint32(fb.read(4), 0, le=False)
+        comp_size = fb.uint32(le=False)
         fb.seek(comp_size, 1)
 
 
 def read_block_3(fb):
     block3 = MnfBlock()
-    unk1 = gf.get_uint32(fb.read(4), 0)
-    block3.record1a_count = gf.get_uint32(fb.read(4), 0, le=False)
-    block3.record1b_count = gf.get_uint32(fb.read(4), 0, le=False)
-    block3.record23_count = gf.get_uint32(fb.read(4), 0, le=False)
+    unk1 = fb.uint32()
+    block3.record1a_count, block3.record1b_count, block3.record23_count = fb.unpack("III", le=False)
     data_count = 3
     q = fb.tell()
     for i in range(data_count):
-        decomp_size = gf.get_uint32(fb.read(4), 0, le=False)
-        comp_size = gf.get_uint32(fb.read(4), 0, le=False)
+        decomp_size, comp_size = fb.unpack("II", le=False)
         comp_data = fb.read(comp_size)
         decomp_data = zlib.decompress(comp_data)
         block3.data.append(decomp_data)
-        with open(f"eso/mnf_{i}.bin", "wb") as f:
-            f.write(decomp_data)
+        if dump_debug:
+            os.makedirs("eso", exist_ok=True)
+            with open(f"eso/mnf_{i}.bin", "wb") as f:
+                f.write(decomp_data)
     return block3
 
 
 def read_block_3_f(f, offset):
+    if not isinstance(f, gf.BinaryView):
+        f = gf.BinaryView(f)
     block3 = MnfBlock()
-    unk1 = gf.get_uint32(f, offset)
-    block3.record1a_count = gf.get_uint32(f, offset+4)
-    block3.record1b_count = gf.get_uint32(f, offset+8)
-    block3.record23_count = gf.get_uint32(f, offset+0xC)
+    unk1, block3.record1a_count, block3.record1b_count, block3.record23_count = f.unpack("IIII", offset)
     if block3.record23_count == 0:
         return None, offset
     data_count = 3
     for i in range(data_count):
-        decomp_size = gf.get_uint32(f, offset+0x10)
-        comp_size = gf.get_uint32(f, offset+0x14)
-        decomp_data = zlib.decompress(f[offset+0x18:offset+0x18+comp_size])
+        decomp_size, comp_size = f.unpack("II", offset+0x10)
+        decomp_data = zlib.decompress(f.read(comp_size, offset+0x18))
         block3.data.append(decomp_data)
         offset += comp_size + 8
-        with open(f"eso/zosft_{i}_{offset}.bin", "wb") as qq:
-            qq.write(decomp_data)
+        if dump_debug:
+            os.makedirs("eso", exist_ok=True)
+            with open(f"eso/zosft_{i}_{offset}.bin", "wb") as qq:
+                qq.write(decomp_data)
     return block3, offset+0x10
 
 
@@ -138,72 +125,123 @@ class TableEntry:
         self.FileID = None
 
 
-def parse_table(block3):
-    m_FileTable = []
-    MNF_BLOCK1_RECORDSIZE = 4
-    MNF_BLOCK2_RECORDSIZE = 8
-    MNF_BLOCK3_RECORDSIZE = 20
-    offset1 = 0
-    offset2 = 0
-    offset3 = 0
-    for i in range(block3.record23_count):
+MNF_BLOCK1_RECORDSIZE = 4
+MNF_BLOCK2_RECORDSIZE = 8
+MNF_BLOCK3_RECORDSIZE = 20
+
+MNF_BLOCK2_DTYPE = np.dtype([("FileIndex", "<u4"), ("Unk1", "<u4")])
+# Header version 3 stores the archive index before the compress type
+MNF_BLOCK3_DTYPE = np.dtype([
+    ("Size", "<u4"),
+    ("CompressedSize", "<u4"),
+    ("Hash", "<u4"),
+    ("Offset", "<u4"),
+    ("ArchiveIndex", "u1"),
+    ("CompressType", "u1"),
+    ("Unk2", "<u2"),
+])
+MNF_TABLE_DTYPE = np.dtype([
+    ("Index", "<u4"),
+    ("ID1", "<u4"),
+    ("FileIndex", "<u4"),
+    ("Unk1", "<u4"),
+    ("FileID", "<u8"),
+    ("Size", "<u4"),
+    ("CompressedSize", "<u4"),
+    ("Hash", "<u4"),
+    ("Offset", "<u4"),
+    ("CompressType", "u1"),
+    ("ArchiveIndex", "u1"),
+    ("Unk2", "<u2"),
+])
+
+
+class FileTable:
+    """
+    Columnar MNF file table, one row of MNF_TABLE_DTYPE per file.
+    Indexing or iterating gives TableEntry objects built on demand.
+    """
+
+    def __init__(self, records):
+        self.records = records
+        self.zosft = None
+        # Linked ZOSFT row per entry, -1 for none
+        self.zosft_rows = np.full(len(records), -1, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        row = self.records[i]
         entry = TableEntry()
-        entry.Index = i
-        if offset1 + MNF_BLOCK1_RECORDSIZE <= len(block3.data[0]):
-            while offset1 + MNF_BLOCK1_RECORDSIZE <= len(block3.data[0]) and block3.data[0][offset1+3] != 0x80:
-                offset1 += MNF_BLOCK1_RECORDSIZE
-            entry.ID1 = gf.get_uint32(block3.data[0], offset1)
-            offset1 += MNF_BLOCK1_RECORDSIZE
-
-        if offset2 + MNF_BLOCK2_RECORDSIZE <= len(block3.data[1]):
-            entry.FileIndex = gf.get_uint32(block3.data[1], offset2)
-            entry.Unk1 = gf.get_uint32(block3.data[1], offset2+4)
-            entry.FileID = gf.get_uint64(block3.data[1], offset2)
-            offset2 += MNF_BLOCK2_RECORDSIZE
-
-        if offset3 + MNF_BLOCK3_RECORDSIZE <= len(block3.data[2]):
-            entry.Size = gf.get_uint32(block3.data[2], offset3)
-            entry.CompressedSize = gf.get_uint32(block3.data[2], offset3+4)
-            entry.Hash = gf.get_uint32(block3.data[2], offset3+8)
-            entry.Offset = gf.get_uint32(block3.data[2], offset3+12)
-            entry.CompressType = block3.data[2][offset3+16]
-            entry.ArchiveIndex = block3.data[2][offset3+17]
-            entry.Unk2 = gf.get_uint16(block3.data[2], offset3+18)
-            offset3 += MNF_BLOCK3_RECORDSIZE
-
-            # Header version 3
-            tmp = entry.CompressType
-            entry.CompressType = entry.ArchiveIndex
-            entry.ArchiveIndex = tmp
-
-        m_FileTable.append(entry)
-    pkg_db.save_mnf_table(m_FileTable, "eso.mnf" in path)
-    return m_FileTable
+        for name in MNF_TABLE_DTYPE.names:
+            setattr(entry, name, row[name].item())
+        if self.zosft_rows[i] >= 0:
+            entry.ZosftEntry = self.zosft.entry(self.zosft_rows[i])
+        return entry
+
+    def __iter__(self):
+        for i in range(len(self.records)):
+            yield self[i]
+
+    def column(self, name):
+        return self.records[name]
+
+    def file_names(self):
+        """
+        Linked ZOSFT name per entry, empty for entries without one.
+        """
+        if self.zosft is None:
+            return [""] * len(self.records)
+        return [self.zosft.name(x) or "" if x >= 0 else "" for x in self.zosft_rows.tolist()]
+
+
+def scan_block1_ids(data, count):
+    # Each entry takes the next record whose top byte is 0x80, skipping the continuation records in between
+    words = np.frombuffer(data, dtype="<u4", count=len(data) // MNF_BLOCK1_RECORDSIZE)
+    markers = np.flatnonzero((words >> 24) == 0x80)
+    ids = np.zeros(count, dtype="<u4")
+    n = min(len(markers), count)
+    ids[:n] = words[markers[:n]]
+    return ids
+
+
+def parse_table(block3):
+    count = block3.record23_count
+    records = np.zeros(count, dtype=MNF_TABLE_DTYPE)
+    records["Index"] = np.arange(count, dtype="<u4")
+    records["ID1"] = scan_block1_ids(block3.data[0], count)
+
+    n2 = min(count, len(block3.data[1]) // MNF_BLOCK2_RECORDSIZE)
+    block2 = np.frombuffer(block3.data[1], dtype=MNF_BLOCK2_DTYPE, count=n2)
+    records["FileIndex"][:n2] = block2["FileIndex"]
+    records["Unk1"][:n2] = block2["Unk1"]
+    records["FileID"][:n2] = np.frombuffer(block3.data[1], dtype="<u8", count=n2)
+
+    n3 = min(count, len(block3.data[2]) // MNF_BLOCK3_RECORDSIZE)
+    block3_records = np.frombuffer(block3.data[2], dtype=MNF_BLOCK3_DTYPE, count=n3)
+    for name in MNF_BLOCK3_DTYPE.names:
+        records[name][:n3] = block3_records[name]
+    return FileTable(records)
 
 
 def create_file_maps(file_table):
-    file_hash_map = {}
-    file_index_map = {}
-    file_internal_index_map = {}
-    for x in file_table:
-        file_hash_map[x.Hash] = x
-        file_index_map[x.FileIndex] = x
-        file_internal_index_map[x.Index] = x
+    # Maps point at row indices into the file table, later rows win like the old per-entry dicts
+    rows = range(len(file_table))
+    file_hash_map = dict(zip(file_table.column("Hash").tolist(), rows))
+    file_index_map = dict(zip(file_table.column("FileIndex").tolist(), rows))
+    file_internal_index_map = dict(zip(file_table.column("Index").tolist(), rows))
     return file_hash_map, file_index_map, file_internal_index_map
 
 
-def find_zosft_entry(path, file_index_map):
-    if "eso.mnf" in path:
-        if 0x00FFFFFF in file_index_map.keys():
-            return file_index_map[0x00FFFFFF]
-        else:
-            raise Exception("Support the other ZOSFT for eso.mnf")
-    elif "game.mnf" in path:
-        if 0 in file_index_map.keys():
-            return file_index_map[0]
-        else:
-            raise Exception("Support the other ZOSFT for game.mnf")
-    return ""
+def find_zosft_entry(b_game, file_table, file_index_map):
+    """
+    The entry holding the ZOSFT, FileIndex 0x00FFFFFF in eso.mnf and 0 in game data, which is any other manifest.
+    """
+    file_index = 0 if b_game else 0x00FFFFFF
+    if file_index not in file_index_map:
+        raise ValueError(f"No ZOSFT entry (FileIndex {file_index:#x}) in this {'game' if b_game else 'eso'} manifest")
+    return file_table[file_index_map[file_index]]
 
 
 class File:
@@ -225,262 +263,841 @@ class FileTableEntry:
         self.UserData = None
 
 
-def load_zosft_file(entry):
-    zosft_data, f = read_game_data_file(entry)
+ZOSFT_DTYPE = np.dtype([
+    ("Index", "<u4"),
+    ("Index11", "<u4"),
+    ("Index13", "<u4"),
+    ("Index21", "<u4"),
+    ("FileIndex", "<u4"),
+    ("FilenameOffset", "<u4"),
+    ("FileID", "<u4"),
+    ("UserData", "<u4"),
+])
+ZOSFT_RECORD_DTYPE = np.dtype([("FileIndex", "<u4"), ("FilenameOffset", "<u4"), ("FileID", "<u4"), ("Unk", "<u4")])
+
+
+class ZosftTable:
+    """
+    Columnar ZOSFT file table. Names stay in the raw name blob and are decoded when asked for.
+    Only the first named_count rows have a file record, the rest have no FileIndex or name.
+    """
+
+    def __init__(self, records, named_count, name_blob, name_starts, name_ends, name_ids):
+        self.records = records
+        self.named_count = named_count
+        self.name_blob = name_blob
+        self.name_starts = name_starts
+        self.name_ends = name_ends
+        # Row -> index into name_starts, -1 when the FilenameOffset is not the start of a name
+        self.name_ids = name_ids
+        self.file_indices = None
+        self.file_index_rows = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def column(self, name):
+        return self.records[name]
+
+    def name(self, row):
+        if row >= self.named_count:
+            return None
+        name_id = self.name_ids[row]
+        if name_id < 0:
+            return ""
+        return bytes(self.name_blob[self.name_starts[name_id]:self.name_ends[name_id]]).decode("latin-1")
+
+    def names(self):
+        return [self.name(i) for i in range(len(self.records))]
+
+    def entry(self, row):
+        ft_entry = FileTableEntry()
+        for name in ZOSFT_DTYPE.names:
+            setattr(ft_entry, name, self.records[row][name].item())
+        if row >= self.named_count:
+            ft_entry.FileIndex = None
+            ft_entry.FilenameOffset = None
+            ft_entry.FileID = None
+        ft_entry.FileName = self.name(row)
+        return ft_entry
+
+    def rows_for_file_indices(self, file_indices):
+        """
+        ZOSFT row for each FileIndex, -1 where there is none. Later rows win, like the old dict did.
+        """
+        if self.file_indices is None:
+            named = self.records["FileIndex"][:self.named_count]
+            # Unique over the reversed column keeps the last row for every FileIndex
+            self.file_indices, first_reversed = np.unique(named[::-1], return_index=True)
+            self.file_index_rows = (self.named_count - 1 - first_reversed).astype(np.int32)
+        file_indices = np.asarray(file_indices)
+        rows = np.full(len(file_indices), -1, dtype=np.int32)
+        if not len(self.file_indices):
+            return rows
+        pos = np.minimum(np.searchsorted(self.file_indices, file_indices), len(self.file_indices) - 1)
+        found = self.file_indices[pos] == file_indices
+        rows[found] = self.file_index_rows[pos[found]]
+        return rows
+
+
+def split_names(name_blob):
+    # Only NUL terminated names count, a trailing unterminated name is dropped
+    name_ends = np.flatnonzero(np.frombuffer(name_blob, dtype=np.uint8) == 0)
+    name_starts = np.concatenate(([0], name_ends[:-1] + 1)).astype(np.int64)[:len(name_ends)]
+    return name_starts, name_ends
+
+
+def parse_zosft(zosft_data):
     if zosft_data[:5] != b"\x5A\x4F\x53\x46\x54":
         raise Exception("ZOSFT file is invalid")
+    view = gf.BinaryView(zosft_data)
     # Reading header
-    record_count = gf.get_uint32(zosft_data, 0xF)
+    record_count = view.uint32(0xF)
     # Reading block data
     blocks = []
     offset = 0x13
     for i in range(3):
-        block_type = gf.get_uint16(zosft_data, offset)
-        block, offset = read_block_3_f(zosft_data, offset+2)
+        block_type = view.uint16(offset)
+        block, offset = read_block_3_f(view, offset+2)
         if block:
             blocks.append(block)
         else:
             offset += 0x10
     # Reading file data
-    file_names_length = gf.get_uint32(zosft_data, offset)
+    file_names_length = view.uint32(offset)
     offset += 4
-    filenames = {}
-    string = ''
-    i = 0
-    start_offset = 0
-    while i < file_names_length:
-        char = zosft_data[offset+i]
-        if char == 0:
-            i += 1
-            filenames[start_offset] = string
-            string = ''
-            start_offset = i
-        else:
-            string += chr(char)
-            i += 1
+    name_blob = bytes(view.read(file_names_length, offset))
+    name_starts, name_ends = split_names(name_blob)
 
     # Creating file table
-    offset11 = 0
-    offset13 = 0
-    offset21 = 0
-    offset23 = 0
-    MNF_BLOCK1_RECORDSIZE = 4
-    filetable = []
-    for i in range(record_count):
-        ft_entry = FileTableEntry()
-        ft_entry.UserData = 0
-        ft_entry.Index = i
-        if offset11 < len(blocks[0].data[0]):
-            ft_entry.Index11 = gf.get_uint32(blocks[0].data[0], offset11)
-            while offset11 + MNF_BLOCK1_RECORDSIZE <= len(blocks[0].data[0]) and blocks[0].data[0][offset11 + 3] != 0x80:
-                offset11 += MNF_BLOCK1_RECORDSIZE
-            ft_entry.Index11 = gf.get_uint32(blocks[0].data[0], offset11)
-            offset11 += MNF_BLOCK1_RECORDSIZE
-
-        if offset13 < len(blocks[0].data[2]):
-            ft_entry.Index13 = gf.get_uint32(blocks[0].data[2], offset13)
-            offset13 += MNF_BLOCK1_RECORDSIZE
-
-        if offset21 < len(blocks[1].data[0]):
-            ft_entry.Index21 = gf.get_uint32(blocks[1].data[0], offset11)
-            while offset21 + MNF_BLOCK1_RECORDSIZE <= len(blocks[1].data[0]) and blocks[1].data[0][offset11 + 3] != 0x80:
-                offset21 += MNF_BLOCK1_RECORDSIZE
-            ft_entry.Index21 = gf.get_uint32(blocks[1].data[0], offset11)
-            offset21 += MNF_BLOCK1_RECORDSIZE
-
-        if offset23 < len(blocks[1].data[2]):
-            ft_entry.FileIndex = gf.get_uint32(blocks[1].data[2], offset23)
-            offset23 += MNF_BLOCK1_RECORDSIZE
-
-            ft_entry.FilenameOffset = gf.get_uint32(blocks[1].data[2], offset23)
-            offset23 += MNF_BLOCK1_RECORDSIZE
-
-            ft_entry.FileID = gf.get_uint32(blocks[1].data[2], offset23)
-            offset23 += MNF_BLOCK1_RECORDSIZE*2
-
-            if ft_entry.FilenameOffset in filenames.keys():
-                ft_entry.FileName = filenames[ft_entry.FilenameOffset]
-            else:
-                ft_entry.FileName = ""
-        filetable.append(ft_entry)
+    records = np.zeros(record_count, dtype=ZOSFT_DTYPE)
+    records["Index"] = np.arange(record_count, dtype="<u4")
+    records["Index11"] = scan_block1_ids(blocks[0].data[0], record_count)
+    n13 = min(record_count, len(blocks[0].data[2]) // MNF_BLOCK1_RECORDSIZE)
+    records["Index13"][:n13] = np.frombuffer(blocks[0].data[2], dtype="<u4", count=n13)
+    records["Index21"] = scan_block1_ids(blocks[1].data[0], record_count)
+
+    named_count = min(record_count, len(blocks[1].data[2]) // ZOSFT_RECORD_DTYPE.itemsize)
+    file_records = np.frombuffer(blocks[1].data[2], dtype=ZOSFT_RECORD_DTYPE, count=named_count)
+    for name in ("FileIndex", "FilenameOffset", "FileID"):
+        records[name][:named_count] = file_records[name]
 
-    file_index_map = {}
-    for x in filetable:
-        file_index_map[x.FileIndex] = x
-    a = 0
-    pkg_db.save_zosft_table(filetable, "eso.mnf" in path)
-    return file_index_map
+    name_ids = np.full(record_count, -1, dtype=np.int32)
+    if len(name_starts):
+        offsets = records["FilenameOffset"][:named_count].astype(np.int64)
+        pos = np.minimum(np.searchsorted(name_starts, offsets), len(name_starts) - 1)
+        found = name_starts[pos] == offsets
+        name_ids[:named_count][found] = pos[found]
+    return ZosftTable(records, named_count, name_blob, name_starts, name_ends, name_ids)
+
+
+def load_zosft_file(entry, archive_set=None):
+    return parse_zosft(read_game_data_file(entry, archive_set))
+
+
+def get_archives():
+    """
+    The shared archive set for the current mnf path, every reader in here goes through it.
+    """
+    global archives
+    if archives is None or archives.mnf_path != path:
+        if archives is not None:
+            archives.close()
+        archives = dat_archive.ArchiveSet(path)
+    return archives
 
 
-def read_data_file(entry: TableEntry):
-    f = open(path.split('.')[0] + f"{gf.fill_hex_with_zeros(str(entry.ArchiveIndex), 4)}.dat", "rb")
-    file_size = f.seek(0, 2)
-    if entry.Offset + entry.CompressedSize > file_size:
+def read_data_file(entry: TableEntry, archive_set=None, out=None):
+    if archive_set is None:
+        archive_set = get_archives()
+    raw_data = archive_set.read_entry(entry)
+    if raw_data is None:
         return None
-    f.seek(entry.Offset, 0)
-    raw_data = f.read(entry.CompressedSize)
-    decomp_data = None
-    if entry.CompressType == 0:
-        if raw_data[:2] == b"\x8C\x06" or raw_data[:2] == b"\xCC\x0A" or raw_data[:2] == b"\xCC\x06" or raw_data[:2] == b"\x8C\x0A":
-            decompressor = OodleDecompressor('I:/oo2core_8_win64.dll')
-            decomp_data = decompressor.decompress(raw_data, entry.Size)
-        elif raw_data[:2] == b"\x78\x9C":
-            decomp_data = zlib.decompress(raw_data)
-        else:
-            decomp_data = raw_data
-    elif entry.CompressType == 1:
-        decomp_data = zlib.decompress(raw_data)
-    elif entry.CompressType == 2:
-        print("Implement snappy compress")
-    else:
+    codec = decompression.codec_for_entry(entry.CompressType, raw_data)
+    if codec is None:
         print("Unk compression")
-    return decomp_data
+        return None
+    return codec.decompress(raw_data, entry.Size, out)
 
 
 # Only for game data, uses a different format
-def read_game_data_file(entry: TableEntry):
-    f = open(path.split('.')[0] + f"{gf.fill_hex_with_zeros(str(entry.ArchiveIndex), 4)}.dat", "rb")
-    t = f.seek(entry.Offset, 0)
-
-    comp_data = f.read(entry.CompressedSize)
-    if comp_data[:2] != b"\x8C\x06" and comp_data[:2] != b"\xCC\x0A" and comp_data[:2] != b"\xCC\x06" and comp_data[:2] != b"\x8C\x0A":
-        #trying zlib
-        if comp_data[:2] == b"\x78\x9C":
-            decomp_data = zlib.decompress(comp_data)
-        else:
-            raise Exception("game fail wrong head")
-    else:
-        decompressor = OodleDecompressor('I:/oo2core_8_win64.dll')
-        decomp_data = decompressor.decompress(comp_data, entry.Size)
-    if decomp_data[:5] == b"\x5A\x4F\x53\x46\x54":
-        return decomp_data, f
-    header_offset1 = gf.get_uint16(decomp_data, 6, le=False) + 8
+def read_game_data_file(entry: TableEntry, archive_set=None, out=None):
+    if archive_set is None:
+        archive_set = get_archives()
+    comp_data = archive_set.read_entry(entry)
+    if comp_data is None:
+        return None
+    codec = decompression.codec_for_magic(comp_data)
+    if codec is None:
+        raise Exception("game fail wrong head")
+    decomp_data = codec.decompress(comp_data, entry.Size, out)
+    return decomp_data[game_header_size(decomp_data):]
+
+
+def game_header_size(data):
+    """
+    Length of the header in front of a decompressed game.mnf file, or None if data is too short to tell yet.
+    """
+    if data[:5] == b"\x5A\x4F\x53\x46\x54":
+        return 0
+    if len(data) < 8:
+        return None
+    view = gf.BinaryView(data, le=False)
+    header_offset1 = view.uint16(6) + 8
     # header_offset1 += 3
-    header_offset2 = gf.get_uint32(decomp_data, header_offset1, le=False) + 4 + header_offset1
-    f.seek(entry.Offset + header_offset2 + 11, 0)
-    return decomp_data[header_offset2:], f
+    if len(data) < header_offset1 + 4:
+        return None
+    return view.uint32(header_offset1) + 4 + header_offset1
 
 
-def link_to_zosft(file_table, zosft_file_index_map):
-    for x in file_table:
-        if "eso.mnf" in path and x.Unk1 != 0:
-            continue
-        if x.FileIndex in zosft_file_index_map.keys():
-            e = zosft_file_index_map[x.FileIndex]
-            if e == None:
-                a = 0
-        else:
-            continue
-        e.UserData += 1
-        x.ZosftEntry = e
+def link_to_zosft(file_table, zosft_table, mnf_path=None):
+    if mnf_path is None:
+        mnf_path = path
+    rows = zosft_table.rows_for_file_indices(file_table.column("FileIndex"))
+    if "eso.mnf" in mnf_path:
+        rows[file_table.column("Unk1") != 0] = -1
+    linked = rows[rows >= 0]
+    zosft_table.records["UserData"] += np.bincount(linked, minlength=len(zosft_table)).astype("<u4")
+    file_table.zosft = zosft_table
+    file_table.zosft_rows = rows
 
 
-def extract_files(file_table):
-    q = "game"
+def get_output_prefix():
     if "eso.mnf" in path:
-        q = "eso"
-    ignore1 = 0
-    ignore2 = 0
-    for i, x in enumerate(file_table):
-        # if x.ArchiveIndex > 5:
-        #     continue
-        if i % 100 == 0:
-            print(f"Subfile {i}/{len(file_table)}")
-        # Reading data
-        # if not x.ZosftEntry:
-        #     ignore1 += 1
-        #     continue
-        if q == "game":
-            data, _ = read_game_data_file(x)
-        else:
-            data = read_data_file(x)
+        return "eso"
+    return "game"
+
+
+def fallback_stem(entry):
+    return f"{gf.fill_hex_with_zeros(str(entry.ArchiveIndex), 4)}/{gf.fill_hex_with_zeros(str(entry.Index), 8)}"
+
+
+class EntrySink:
+    """
+    Takes the decompressed stream of one entry piece by piece and writes it to f, dropping the game header first.
+    The head and the last few bytes are kept for sniffing the extension of unnamed entries,
+    and with b_digest the content is hashed on the way through.
+    """
+
+    def __init__(self, f, b_game, b_digest=False):
+        self.f = f
+        self.hasher = hashlib.blake2b(digest_size=16) if b_digest else None
+        self.header = bytearray() if b_game else None
+        self.header_size = None
+        self.head = b""
+        self.tail = b""
+        self.size = 0
+        # Time spent in f.write, so it can be told apart from decompression
+        self.write_wall = 0.0
+        self.write_cpu = 0.0
+
+    def write(self, data):
+        if self.header is not None:
+            self.header += data
+            if self.header_size is None:
+                self.header_size = game_header_size(self.header)
+            if self.header_size is None or len(self.header) < self.header_size:
+                return
+            data = bytes(self.header[self.header_size:])
+            self.header = None
         if not data:
-            ignore2 += 1
+            return
+        if len(self.head) < sniff.HEAD_SIZE:
+            self.head += bytes(data[:sniff.HEAD_SIZE-len(self.head)])
+        self.tail = (self.tail + bytes(data[-sniff.TAIL_SIZE:]))[-sniff.TAIL_SIZE:]
+        if self.hasher:
+            self.hasher.update(data)
+        wall, cpu = metrics.clock()
+        self.f.write(data)
+        self.write_wall += time.perf_counter() - wall
+        self.write_cpu += time.thread_time() - cpu
+        self.size += len(data)
+
+    def extension(self):
+        return sniff.classify(self.head, lambda: self.tail)
+
+    def digest(self):
+        return self.hasher.hexdigest() if self.hasher else None
+
+
+def scratch_buffer(size):
+    """
+    Reusable per-thread output buffer for codecs that can't stream, None for sizes that should get their own.
+    """
+    if size > scratch_limit:
+        return None
+    buffer = getattr(scratch, "buffer", None)
+    if buffer is None or len(buffer) < size:
+        # A new buffer rather than a resize, a view of the old one may still be alive
+        buffer = scratch.buffer = bytearray(max(size, decompression.stream_chunk_size))
+    return buffer
+
+
+def touch_pages(data):
+    # Fault the mapped payload in up front, so waiting on the disk shows up as read time rather than inside decompress
+    if len(data):
+        np.frombuffer(data, dtype=np.uint8)[::4096].max()
+
+
+def extract_entry(entry, name, output_dir, b_game, b_digest=False, stats=None):
+    """
+    Streams one entry from its archive through the decompressor into its file, named by its ZOSFT name if it has one.
+    zlib and stored entries go through in stream_chunk_size pieces, others are decompressed whole into a scratch buffer,
+    either way the bytes held are reserved from memory_budget first.
+    Time per stage, throughput and failures go to stats.
+    Returns the bytes written, the name used, the content digest (with b_digest) and the sniffed extension,
+    or None if the entry could not be read.
+    """
+    if stats is None:
+        stats = metrics.Metrics()
+    with stats.stage("read") as read_timer:
+        raw_data = get_archives().read_entry(entry)
+        if raw_data is not None:
+            touch_pages(raw_data)
+    if raw_data is None:
+        stats.fail("outside_archive")
+        return None
+    if b_game:
+        codec = decompression.codec_for_magic(raw_data)
+        if codec is None:
+            stats.fail("unknown_magic")
+            return None
+    else:
+        codec = decompression.codec_for_entry(entry.CompressType, raw_data)
+        if codec is None:
+            stats.fail("unknown_compression")
+            return None
+    # Unnamed entries are written under a temporary name until the whole file has been seen and can be sniffed
+    file_path = f"{output_dir}/{name}" if name else f"{output_dir}/{fallback_stem(entry)}.partial"
+    io_start = metrics.clock()
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    try:
+        # The path may be a hardlink into a dedupe store, writing through it would change every linked copy
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    f = open(file_path, "wb")
+    io_wall, io_cpu = metrics.elapsed(io_start)
+    sink = EntrySink(f, b_game, b_digest)
+    decompress_start = metrics.clock()
+    try:
+        if codec.b_streams:
+            with memory_budget.reserve(min(entry.Size, decompression.stream_chunk_size)):
+                written = codec.decompress_stream(raw_data, entry.Size, sink.write)
+        else:
+            with memory_budget.reserve(entry.Size):
+                written = codec.decompress_stream(raw_data, entry.Size, sink.write, scratch_buffer(entry.Size))
+    except OSError:
+        f.close()
+        raise
+    except Exception:
+        f.close()
+        os.remove(file_path)
+        stats.fail(f"{codec.name}_error")
+        return None
+    # Stored entries are whatever the archive holds, anything decoded has to come out at the table's size
+    if codec.name != "raw" and written != entry.Size:
+        f.close()
+        os.remove(file_path)
+        stats.fail(f"{codec.name}_size")
+        return None
+    decompress_wall, decompress_cpu = metrics.elapsed(decompress_start)
+    stats.add_stage("decompress", decompress_wall - sink.write_wall, decompress_cpu - sink.write_cpu)
+    stats.throughput("codecs", codec.name, len(raw_data), sink.size, decompress_wall - sink.write_wall)
+    stats.throughput("archives", entry.ArchiveIndex, len(raw_data), sink.size, read_timer.wall)
+
+    io_start = metrics.clock()
+    f.close()
+    if not sink.size:
+        os.remove(file_path)
+        stats.fail("empty")
+        return None
+    wall, cpu = metrics.elapsed(io_start)
+    io_wall += wall
+    io_cpu += cpu
+    with stats.stage("sniff"):
+        extension = sink.extension()
+    io_start = metrics.clock()
+    if not name:
+        name = f"{fallback_stem(entry)}.{extension}"
+        os.replace(file_path, f"{output_dir}/{name}")
+    wall, cpu = metrics.elapsed(io_start)
+    stats.add_stage("write", io_wall + wall + sink.write_wall, io_cpu + cpu + sink.write_cpu)
+    stats.count("entries")
+    stats.count("bytes_in", len(raw_data))
+    stats.count("bytes_out", sink.size)
+    return sink.size, name, sink.digest(), extension
+
+
+def extract_chunk(records, names, output_dir, b_game, b_digest=False, extraction_journal=None):
+    """
+    Returns the (Index, ArchiveIndex, Offset, Hash, size, name, digest, extension) of every written entry,
+    the number skipped and the chunk's metrics for Metrics.merge.
+    Each entry is journaled as soon as its file is written, in worker processes through the worker's QueueJournal.
+    """
+    if extraction_journal is None:
+        extraction_journal = worker_journal
+    completed = []
+    skipped = 0
+    stats = metrics.Metrics()
+    entry = TableEntry()
+    for row, name in zip(records.tolist(), names):
+        for field, value in zip(MNF_TABLE_DTYPE.names, row):
+            setattr(entry, field, value)
+        result = extract_entry(entry, name, output_dir, b_game, b_digest, stats)
+        if result is None:
+            skipped += 1
             continue
-        # Saving file
-        if not x.ZosftEntry:
-            x.ZosftEntry = FileTableEntry()
-            extension = guess_extension(data)
-            x.ZosftEntry.FileName = f"{gf.fill_hex_with_zeros(str(x.ArchiveIndex), 4)}/{gf.fill_hex_with_zeros(str(x.Index), 8)}.{extension}"
-            os.makedirs(f"{q}/{gf.fill_hex_with_zeros(str(x.ArchiveIndex), 4)}/", exist_ok=True)
+        if extraction_journal is not None:
+            extraction_journal.record(entry.ArchiveIndex, entry.Offset, entry.Hash, result[0], result[1])
+        completed.append((entry.Index, entry.ArchiveIndex, entry.Offset, entry.Hash) + result)
+    return completed, skipped, stats.raw()
+
+
+def plan_dedupe(file_table, rows):
+    """
+    Splits rows into the ones to extract and {leader row: [duplicate rows]}. Rows are duplicates when they share
+    the MNF Hash and Size and their stored bytes have the same digest, so only the leader needs decompressing.
+    """
+    records = file_table.records[rows]
+    order = np.lexsort((rows, records["Size"], records["Hash"]))
+    rows = rows[order]
+    records = records[order]
+    b_new_group = (np.diff(records["Hash"]) != 0) | (np.diff(records["Size"]) != 0)
+    starts = np.concatenate(([0], np.flatnonzero(b_new_group) + 1))
+    ends = np.concatenate((starts[1:], [len(rows)]))
+    b_single = np.ones(len(rows), dtype=bool)
+    leaders = []
+    followers = {}
+    archive_set = get_archives()
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if end - start == 1:
+            continue
+        b_single[start:end] = False
+        seen = {}
+        payload_digests = {}
+        for row, record in zip(rows[start:end].tolist(), records[start:end].tolist()):
+            entry = dict(zip(MNF_TABLE_DTYPE.names, record))
+            location = (entry["ArchiveIndex"], entry["Offset"], entry["CompressedSize"])
+            if location not in payload_digests:
+                payload = archive_set.read(*location)
+                payload_digests[location] = None if payload is None else hashlib.blake2b(payload, digest_size=16).digest()
+            if payload_digests[location] is None:
+                # Unreadable, extract_entry will skip it
+                leaders.append(row)
+                continue
+            key = (entry["CompressType"], payload_digests[location])
+            if key in seen:
+                followers[seen[key]].append(row)
+            else:
+                seen[key] = row
+                followers[row] = []
+                leaders.append(row)
+    leaders = np.sort(np.concatenate((rows[b_single], np.array(leaders, dtype=rows.dtype))))
+    return leaders, {leader: x for leader, x in followers.items() if x}
+
+
+def init_worker(mnf_path, memory_limit=None, journal_queue=None):
+    global path, memory_budget, worker_journal
+    path = mnf_path
+    if memory_limit:
+        memory_budget = decompression.MemoryBudget(memory_limit)
+    if journal_queue is not None:
+        worker_journal = journal.QueueJournal(journal_queue)
+
+
+def plan_extraction(file_table, chunk_size=2000, done=None, rows=None, b_dedupe_names=True):
+    """
+    Splits the table into chunks that each cover one archive in Offset order, so every worker reads sequentially.
+    """
+    return chunk_rows(file_table, select_rows(file_table, done, rows, b_dedupe_names), chunk_size)
+
+
+def select_rows(file_table, done=None, rows=None, b_dedupe_names=True):
+    """
+    Entries whose ZOSFT name is reused by a later entry are dropped, the later one would overwrite it anyway,
+    as are entries whose (ArchiveIndex, Offset, Hash) is in done. rows limits the selection to those table rows.
+    """
+    names = file_table.file_names()
+    keep = np.ones(len(names), dtype=bool)
+    if b_dedupe_names:
+        last_row = {}
+        for i, name in enumerate(names):
+            if name:
+                last_row[name] = i
+        keep = np.array([not name or last_row[name] == i for i, name in enumerate(names)], dtype=bool)
+    if rows is not None:
+        selected = np.zeros(len(file_table), dtype=bool)
+        selected[rows] = True
+        keep &= selected
+    if done:
+        keys = zip(file_table.column("ArchiveIndex").tolist(), file_table.column("Offset").tolist(),
+                   file_table.column("Hash").tolist())
+        keep &= np.array([key not in done for key in keys], dtype=bool)
+    return np.flatnonzero(keep)
+
+
+def chunk_rows(file_table, rows, chunk_size=2000):
+    names = file_table.file_names()
+    order = np.lexsort((file_table.column("Offset")[rows], file_table.column("ArchiveIndex")[rows]))
+    rows = rows[order]
+    archive_indices = file_table.column("ArchiveIndex")[rows]
+    boundaries = np.flatnonzero(np.diff(archive_indices)) + 1
+    chunks = []
+    for archive_rows in np.split(rows, boundaries):
+        for start in range(0, len(archive_rows), chunk_size):
+            chunk_rows = archive_rows[start:start+chunk_size]
+            chunks.append((file_table.records[chunk_rows], [names[i] for i in chunk_rows]))
+    return chunks
+
+
+def extract_files(file_table, workers=1, use_processes=False, output_dir=None, resume=False, rows=None, memory_limit=None,
+                  dedupe=None, metrics_path=None):
+    """
+    memory_limit caps the decompressed bytes in flight across all workers, split evenly between processes.
+    dedupe is one of content_store.LINK_MODES: entries with identical payloads are decompressed once and
+    the rest become hardlinks or reflinks into a content-addressed store, or are only listed in the manifest.
+    Per-stage metrics are kept in last_metrics and, with metrics_path, saved there on every progress line
+    (Prometheus text for .prom, JSON otherwise).
+    """
+    global memory_budget, last_metrics
+    if memory_limit is None:
+        memory_limit = default_memory_limit
+    memory_budget = decompression.MemoryBudget(memory_limit)
+    if output_dir is None:
+        output_dir = get_output_prefix()
+    b_game = get_output_prefix() == "game"
+    extraction_journal = journal.ExtractionJournal(f"{output_dir}/.extract_journal")
+    done = None
+    if resume:
+        done = journal.completed_keys(extraction_journal, output_dir)
+        print(f"Resuming, {len(done)} entries already extracted")
+    # Partial extractions add to the journal of the tree they write into
+    b_append = resume or rows is not None
+    extraction_journal.open(b_append)
+    start = time.perf_counter()
+    run_metrics = last_metrics = metrics.Metrics()
+    rows = select_rows(file_table, done, rows)
+    followers = {}
+    store = None
+    manifest_file = manifest = None
+    if dedupe:
+        rows, followers = plan_dedupe(file_table, rows)
+        store = content_store.ContentStore(output_dir, dedupe)
+        manifest_path = f"{output_dir}/.dedupe_manifest.csv"
+        b_new_manifest = not b_append or not os.path.exists(manifest_path)
+        manifest_file = open(manifest_path, "w" if b_new_manifest else "a", newline="")
+        manifest = csv.writer(manifest_file)
+        if b_new_manifest:
+            manifest.writerow(["FileName", "Size", "Digest", "Source"])
+    chunks = chunk_rows(file_table, rows)
+    total = sum(len(records) for records, _ in chunks) + sum(len(x) for x in followers.values())
+    names = file_table.file_names()
+    progress = metrics.ProgressReporter(total)
+    files = 0
+    written = 0
+    skipped = 0
+    duplicates = 0
+    saved = 0
+    journal_queue = drainer = None
+    if workers <= 1:
+        results = (extract_chunk(records, chunk_names, output_dir, b_game, bool(dedupe), extraction_journal)
+                   for records, chunk_names in chunks)
+        executor = None
+    else:
+        if use_processes:
+            # Workers can't share the journal, their records come back through a queue
+            journal_queue = multiprocessing.Queue()
+            drainer = threading.Thread(target=journal.drain, args=(journal_queue, extraction_journal), daemon=True)
+            drainer.start()
+            executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker,
+                                                           initargs=(path, max(memory_limit // workers, 1), journal_queue))
+            chunk_journal = None
         else:
-            savename = x.ZosftEntry.FileName.split('/')[-1]
-            savedir = x.ZosftEntry.FileName[:-len(savename)]
-            os.makedirs(f"{q}/" + savedir, exist_ok=True)
-            if x.ZosftEntry.FileName == "":
-                extension = guess_extension(data)
-                x.ZosftEntry.FileName = f"{gf.fill_hex_with_zeros(str(x.ArchiveIndex), 4)}/{gf.fill_hex_with_zeros(str(x.Index), 8)}.{extension}"
-                os.makedirs(f"{q}/{gf.fill_hex_with_zeros(str(x.ArchiveIndex), 4)}/", exist_ok=True)
-        with open(f"{q}/" + x.ZosftEntry.FileName, "wb") as f:
-            f.write(data)
-        a = 0
-    print(ignore1, ignore2)
+            executor = concurrent.futures.ThreadPoolExecutor(workers)
+            chunk_journal = extraction_journal
+        futures = {executor.submit(extract_chunk, records, chunk_names, output_dir, b_game, bool(dedupe), chunk_journal):
+                   len(records) for records, chunk_names in chunks}
+        results = (future.result() for future in concurrent.futures.as_completed(futures))
+    try:
+        for completed, chunk_skipped, chunk_metrics in results:
+            run_metrics.merge(chunk_metrics)
+            chunk_bytes = sum(x[4] for x in completed)
+            for index, archive_index, offset, hsh, size, name, digest, extension in completed:
+                written += size
+                if store is None:
+                    continue
+                with run_metrics.stage("link"):
+                    if store.add(f"{output_dir}/{name}", digest):
+                        saved += size
+                    manifest.writerow([name, size, digest, ""])
+                    for row in followers.get(index, ()):
+                        follower = file_table[row]
+                        follower_name = names[row] or f"{fallback_stem(follower)}.{extension}"
+                        if dedupe == "manifest" or store.materialize(digest, f"{output_dir}/{follower_name}"):
+                            saved += size
+                        manifest.writerow([follower_name, size, digest, name])
+                        extraction_journal.record(follower.ArchiveIndex, follower.Offset, follower.Hash, size, follower_name)
+                        duplicates += 1
+                        progress.update(1)
+            files += len(completed)
+            skipped += chunk_skipped
+            if progress.update(len(completed) + chunk_skipped, chunk_bytes) and metrics_path:
+                run_metrics.save(metrics_path)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        if drainer:
+            journal_queue.put(None)
+            drainer.join()
+        extraction_journal.close()
+        if manifest_file:
+            manifest_file.close()
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(f"Extracted {files} files ({written/1e6:.1f}MB) in {elapsed:.1f}s, "
+          f"{written/1e6/elapsed:.1f}MB/s, {files/elapsed:.0f} files/s, {skipped} skipped")
+    if store:
+        print(f"Deduplicated {duplicates} entries, saving {duplicates} decompressions and {saved/1e6:.1f}MB on disk"
+              + (f", {store.copies} links fell back to copies" if store.copies else ""))
+        files += duplicates
+        run_metrics.count("duplicates", duplicates)
+        run_metrics.count("bytes_saved", saved)
+    run_metrics.print_summary()
+    if metrics_path:
+        run_metrics.save(metrics_path)
+    if not use_processes:
+        print(f"Peak decompressed memory {memory_budget.peak/1e6:.1f}MB of {memory_limit/1e6:.1f}MB")
+    return files, written, skipped
 
 
-def guess_extension(data):
-    if data[:3] == b"DDS":
-        return "dds"
-    elif data[:8] == b"\x00\x01\x00\x00\x00\x0E\x00\x80" or data[:4] == b"OTTO" or data[11:11+5] == b"POS/2":
-        return "ttf"
-    elif data[:7] == b"\x1E\x0D\x0B\xCD\xCE\xFA\x11":
-        return "hk"
-    elif data[:4] == b"\x29\xDE\x6C\xC0" or data[:4] == b"\xE5\x9B\x49\x5E" or data[:4] == b"\x29\x75\x31\x82"\
-    or data[:4] == b"\x0E\x11\x95\xB5" or data[:4] == b"\x0E\x74\xA2\x0A" or data[:4] == b"\xE5\x2F\x4A\xE1"\
-    or data[:4] == b"\x31\x95\xD4\xE3" or data[:4] == b"\x31\xC2\x4E\x7C":
-        return "gr2"
-    elif data[:4] == b"\x1E\x0D\xB0\xCA":
-        return "hkx"
-    elif data[:4] == b"\xFA\xFA\xEB\xEB":
-        return "EsoFileData"
-    elif data[:4] == b"\xFB\xFB\xEC\xEC":
-        return "EsoIdData"
-    elif data[:4] == b"\x00\x00\x00\x02":
-        return "EsoIdData"
-    elif data[:3] == b"\xEF\xBB\xBF":
-        return "txt"
-    elif data[:3] == b"xV4":
-        return "xv4"
-    elif data[:5] == b"__ffx":
-        return "ffx"
-    elif data[:4] == b"RIFF":
-        return "riff"
-    elif data[:2] == b"; " or data[len(data)-4:len(data)] == b".lua":
-        return "txt"
-    elif data[0] == b"#" or data[:2] == b"//" or data[:3] == b"\r\n#" or data[:2] == b"/*":
-        return "fx"
-    elif data[:2] == b"--" or data[:5] == b"local" or data[:7] == b"function":
-        return "lua"
-    elif data[0] == b"<":
-        return "xml"
-    elif data[:5] == b"ZOSFT":
-        return "zosft"
-    elif data[len(data)-5:len(data)-2] == b"end" or data[len(data)-3:len(data)] == b"end" or\
-        data[len(data)-7:len(data)-4] == b"end" or data[len(data)-2:len(data)] == b"\r":
-        return "lua"
-    elif data[:4] == b"BKHD":
-        return "bnk"
+def remove_output(output_dir, archive_index, index, name):
+    if name:
+        paths = [f"{output_dir}/{name}"]
     else:
-        return "bin"
+        paths = glob.glob(f"{output_dir}/{gf.fill_hex_with_zeros(str(archive_index), 4)}/{gf.fill_hex_with_zeros(str(index), 8)}.*")
+    for file_path in paths:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        # Prune folders the removal left empty, stopping at the output root
+        folder = os.path.dirname(file_path)
+        while os.path.normpath(folder) != os.path.normpath(output_dir) and os.path.isdir(folder) and not os.listdir(folder):
+            os.rmdir(folder)
+            folder = os.path.dirname(folder)
+
+
+def extract_delta(file_table, old_patch, new_patch, workers=1, use_processes=False, output_dir=None, memory_limit=None,
+                  dedupe=None, metrics_path=None):
+    """
+    Updates an output tree extracted at old_patch to new_patch, both saved with pkg_db.save_mnf_table.
+    Only added and changed entries are extracted, removed entries are deleted.
+    """
+    if output_dir is None:
+        output_dir = get_output_prefix()
+    added, removed, changed = pkg_db.diff_mnf_tables("eso.mnf" in path, old_patch, new_patch)
+    print(f"{len(added)} added, {len(removed)} removed, {len(changed)} changed since {old_patch}")
+
+    # Named files still owned by a current entry are overwritten in place rather than deleted
+    current_names = set(file_table.file_names())
+    for archive_index, index, name in removed + [x[1:] for x in changed]:
+        if name not in current_names:
+            remove_output(output_dir, archive_index, index, name)
+
+    rows = np.array(added + [x[0] for x in changed], dtype=np.int64)
+    if len(rows):
+        return extract_files(file_table, workers, use_processes, output_dir, rows=rows, memory_limit=memory_limit, dedupe=dedupe,
+                             metrics_path=metrics_path)
+    return 0, 0, 0
+
+
+def guess_extension(data):
+    return sniff.guess_extension(data)
+
+
+def list_chunk(records, names, b_game):
+    archive_set = get_archives()
+    rows = []
+    entry = TableEntry()
+    for row, name in zip(records.tolist(), names):
+        for field, value in zip(MNF_TABLE_DTYPE.names, row):
+            setattr(entry, field, value)
+        error = ""
+        try:
+            extension = sniff.sniff_entry(entry, archive_set, b_game)
+        except OSError:
+            raise
+        except Exception as e:
+            # One broken entry is listed as unreadable like extract_entry counts it, the rest of the listing goes on
+            extension = None
+            error = type(e).__name__
+        rows.append((entry.Index, f"{entry.FileID:016X}", entry.ArchiveIndex, entry.Offset, entry.Size, extension or "", name, error))
+    return rows
+
+
+def list_files(file_table, output_path, workers=1):
+    """
+    Writes a CSV catalog with the sniffed type of every entry, reading only the head of each file where possible.
+    """
+    b_game = get_output_prefix() == "game"
+    chunks = plan_extraction(file_table, b_dedupe_names=False)
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max(workers, 1)) as executor:
+        results = executor.map(lambda chunk: list_chunk(chunk[0], chunk[1], b_game), chunks)
+        rows = sorted(row for chunk_rows in results for row in chunk_rows)
+    with open(output_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Index", "FileID", "ArchiveIndex", "Offset", "Size", "Extension", "FileName", "Error"])
+        writer.writerows(rows)
+    counts = collections.Counter(row[5] for row in rows)
+    print(f"Listed {len(rows)} entries in {time.perf_counter() - start:.1f}s to {output_path}")
+    print(", ".join(f"{extension or 'unreadable'}: {count}" for extension, count in counts.most_common()))
+    errors = collections.Counter(row[7] for row in rows if row[7])
+    if errors:
+        print("Unreadable by error: " + ", ".join(f"{error} {count}" for error, count in errors.most_common()))
+    return rows
+
 
 bpath = "F:/Other Games/Zenimax Online/The Elder Scrolls Online/"
 path1 = "/game/client/game.mnf"
 path2 = "/depot/eso.mnf"
 path = bpath + path1
-def main():
-    fb = open(path, "rb")
-    fb.seek(0, 2)
-    fb.seek(0, 0)
-    block3 = read_header(fb)
+archives = None
+# Write the decompressed MNF and ZOSFT streams under eso/ while parsing
+dump_debug = False
+# Decompressed bytes extraction may hold at once, across all workers
+default_memory_limit = 1024 * 1024 * 1024
+memory_budget = decompression.MemoryBudget(default_memory_limit)
+# Entries up to this size reuse a per-thread buffer when their codec can't stream
+scratch_limit = 4 * 1024 * 1024
+scratch = threading.local()
+# Metrics of the last extract_files run
+last_metrics = None
+# Where a worker process journals what it extracted, see init_worker
+worker_journal = None
+
+
+def build_file_table(mnf_path=None, archive_set=None):
+    if mnf_path is None:
+        mnf_path = path
+    owned_archive_set = None
+    if archive_set is None:
+        if mnf_path == path:
+            archive_set = get_archives()
+        else:
+            archive_set = owned_archive_set = dat_archive.ArchiveSet(mnf_path)
+    with open(mnf_path, "rb") as fb:
+        block3 = read_header(gf.BinaryView(fb.read()))
     if not block3:
         raise Exception("No block 3 found")
     file_table = parse_table(block3)
     file_hash_map, file_index_map, file_internal_index_map = create_file_maps(file_table)
     print("Loaded MNF files and table")
     print("Getting ZOSFT entry from MNF")
-    zosft_entry = find_zosft_entry(path, file_index_map)
-    zosft_file_index_map = load_zosft_file(zosft_entry)
-    link_to_zosft(file_table, zosft_file_index_map)
-    ## Duplicate protection?
-    a = 0
-    extract_files(file_table)
-main()
+    # Anything that isn't eso.mnf is game data, like get_output_prefix and MnfArchive decide
+    zosft_entry = find_zosft_entry("eso.mnf" not in mnf_path, file_table, file_index_map)
+    zosft_table = load_zosft_file(zosft_entry, archive_set)
+    link_to_zosft(file_table, zosft_table, mnf_path)
+    if owned_archive_set:
+        owned_archive_set.close()
+    return file_table
+
+
+def save_cached_file_table(file_table, cache_path, key):
+    zosft_table = file_table.zosft
+    arrays = {
+        "records": file_table.records,
+        "zosft_rows": file_table.zosft_rows,
+        "zosft_records": zosft_table.records,
+        "name_blob": np.frombuffer(zosft_table.name_blob, dtype=np.uint8),
+        "name_starts": zosft_table.name_starts,
+        "name_ends": zosft_table.name_ends,
+        "name_ids": zosft_table.name_ids,
+    }
+    manifest_cache.write_arrays(cache_path, {"key": key, "named_count": zosft_table.named_count}, arrays)
+
+
+CACHED_ARRAYS = {"records", "zosft_rows", "zosft_records", "name_blob", "name_starts", "name_ends", "name_ids"}
+
+
+def load_cached_file_table(cache_path, key):
+    cached = manifest_cache.read_arrays(cache_path)
+    if cached is None:
+        return None
+    meta, arrays = cached
+    if meta.get("key") != key or "named_count" not in meta or not CACHED_ARRAYS <= arrays.keys():
+        return None
+    if arrays["records"].dtype != MNF_TABLE_DTYPE or arrays["zosft_records"].dtype != ZOSFT_DTYPE:
+        return None
+    file_table = FileTable(arrays["records"])
+    file_table.zosft = ZosftTable(arrays["zosft_records"], meta["named_count"], arrays["name_blob"],
+                                  arrays["name_starts"], arrays["name_ends"], arrays["name_ids"])
+    file_table.zosft_rows = arrays["zosft_rows"]
+    return file_table
+
+
+def load_file_table(cache_dir="cache", use_cache=True, mnf_path=None, archive_set=None):
+    """
+    The parsed and ZOSFT-linked file table for mnf_path (path by default),
+    from the manifest cache when the .mnf hasn't changed.
+    Returns the table and whether it had to be parsed.
+    """
+    if mnf_path is None:
+        mnf_path = path
+    key = manifest_cache.source_key(mnf_path)
+    cache_path = manifest_cache.cache_path_for(cache_dir, mnf_path)
+    if use_cache:
+        file_table = load_cached_file_table(cache_path, key)
+        if file_table is not None:
+            print(f"Loaded {len(file_table)} MNF entries from {cache_path}")
+            return file_table, False
+    file_table = build_file_table(mnf_path, archive_set)
+    if use_cache:
+        save_cached_file_table(file_table, cache_path, key)
+    return file_table, True
+
+
+def main(workers=1, use_processes=False, resume=False, patch=None, delta_from=None, use_cache=True, list_path=None,
+         memory_limit=None, dedupe=None, metrics_path=None):
+    file_table, b_parsed = load_file_table(use_cache=use_cache)
+    b_is_eso = "eso.mnf" in path
+    # The db only needs refreshing when the table was parsed again, or for a new patch snapshot.
+    # The unversioned table is the one lookups and map extraction read, so it follows every snapshot too,
+    # together with the ZOSFT table it's joined to
+    if b_parsed or patch:
+        pkg_db.save_mnf_table(file_table, b_is_eso)
+        pkg_db.save_zosft_table(file_table.zosft, b_is_eso)
+    if patch:
+        pkg_db.save_mnf_table(file_table, b_is_eso, patch)
+    if list_path:
+        list_files(file_table, list_path, workers)
+    elif delta_from:
+        extract_delta(file_table, delta_from, patch, workers, use_processes, memory_limit=memory_limit, dedupe=dedupe,
+                      metrics_path=metrics_path)
+    else:
+        extract_files(file_table, workers, use_processes, resume=resume, memory_limit=memory_limit, dedupe=dedupe,
+                      metrics_path=metrics_path)
+    get_archives().close()
+    decompression.print_throughput()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract every file in an ESO .mnf")
+    parser.add_argument("mnf", nargs="?", default=path)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--processes", action="store_true", help="use worker processes instead of threads")
+    parser.add_argument("--resume", action="store_true", help="skip entries already recorded in the extraction journal")
+    parser.add_argument("--patch", help="keep this table in MNF.db as a snapshot for this patch")
+    parser.add_argument("--delta-from", help="only extract what changed since this patch snapshot, needs --patch")
+    parser.add_argument("--list", metavar="CSV", help="only catalog the type of every entry into this csv, nothing is extracted")
+    parser.add_argument("--memory-limit", type=int, metavar="MB", help="most decompressed data held at once across workers, default 1024")
+    parser.add_argument("--dedupe", choices=content_store.LINK_MODES,
+                        help="decompress identical entries once, the copies become links into a content store or manifest rows")
+    parser.add_argument("--metrics", metavar="PATH", help="keep per-stage metrics in PATH while extracting, Prometheus text for .prom, JSON otherwise")
+    parser.add_argument("--no-cache", action="store_true", help="parse the .mnf again instead of using the manifest cache")
+    parser.add_argument("--dump-debug", action="store_true", help="write the decompressed MNF and ZOSFT streams under eso/")
+    args = parser.parse_args()
+    if args.delta_from and not args.patch:
+        parser.error("--delta-from needs --patch")
+    path = args.mnf
+    dump_debug = args.dump_debug
+    main(args.workers, args.processes, args.resume, args.patch, args.delta_from, not args.no_cache, args.list,
+         args.memory_limit * 1024 * 1024 if args.memory_limit else None, args.dedupe, args.metrics)
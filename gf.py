@@ -1,3 +1,4 @@
+import functools
 import os
 import numpy as np
 import struct
@@ -126,3 +127,114 @@ def get_flipped_bin(h, length):
         print("Flipped bin length is not even.")
         return None
     return h[:length][::-1]
+
+
+def _field(code):
+    """
+    One precompiled field reader for BinaryView, code is a struct format character.
+    """
+    unpack_le = struct.Struct("<" + code).unpack_from
+    unpack_be = struct.Struct(">" + code).unpack_from
+    size = struct.calcsize("<" + code)
+
+    def read(self, offset=None, le=None):
+        if offset is None:
+            offset = self.pos
+            self.pos = offset + size
+        if le is None:
+            le = self.le
+        return (unpack_le if le else unpack_be)(self.data, offset)[0]
+    return read
+
+
+@functools.lru_cache(maxsize=None)
+def get_struct(fmt):
+    return struct.Struct(fmt)
+
+
+class BinaryView:
+    """
+    Zero-copy reader over bytes, bytearray, memoryview or mmap. Fields are unpacked in place by precompiled
+    structs rather than slicing a copy out first like get_uint32 and friends.
+
+    Every read takes an absolute offset, or with offset=None reads at the cursor and moves it on,
+    so a view can stand in for a file object with seek/tell/read. le picks the byte order per view or per read.
+    """
+
+    def __init__(self, data, offset=0, le=True):
+        self.data = data
+        self.view = memoryview(data)
+        self.pos = offset
+        self.le = le
+
+    def __len__(self):
+        return len(self.view)
+
+    def close(self):
+        """
+        Releases the view and closes the data if it's a mapping. Anything still pointing into it stops close.
+        """
+        self.view.release()
+        if hasattr(self.data, "close"):
+            self.data.close()
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += len(self.view)
+        self.pos = offset
+        return offset
+
+    def tell(self):
+        return self.pos
+
+    def skip(self, count):
+        self.pos += count
+
+    def read(self, length, offset=None):
+        """
+        A memoryview of length bytes, shorter at the end of the data like a file read.
+        """
+        if offset is None:
+            offset = self.pos
+            self.pos = min(offset + length, len(self.view))
+        return self.view[offset:offset+length]
+
+    uint8 = _field("B")
+    uint16 = _field("H")
+    uint32 = _field("I")
+    uint64 = _field("Q")
+    int16 = _field("h")
+    int32 = _field("i")
+    float32 = _field("f")
+
+    def unpack(self, fmt, offset=None, le=None):
+        """
+        A whole record in one call, fmt without the byte order prefix, e.g. "3f" or "IIH".
+        """
+        s = get_struct(("<" if (self.le if le is None else le) else ">") + fmt)
+        if offset is None:
+            offset = self.pos
+            self.pos = offset + s.size
+        return s.unpack_from(self.data, offset)
+
+    def iter_unpack(self, fmt, count, offset=None, le=None):
+        """
+        count back to back records of fmt.
+        """
+        s = get_struct(("<" if (self.le if le is None else le) else ">") + fmt)
+        if offset is None:
+            offset = self.pos
+            self.pos = offset + s.size * count
+        return s.iter_unpack(self.view[offset:offset+s.size*count])
+
+    def array(self, dtype, count, offset=None):
+        """
+        count items of a numpy dtype, sharing memory with the data.
+        """
+        dtype = np.dtype(dtype)
+        if offset is None:
+            offset = self.pos
+            self.pos = offset + dtype.itemsize * count
+        return np.frombuffer(self.data, dtype=dtype, count=count, offset=offset)
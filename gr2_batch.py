@@ -0,0 +1,307 @@
+import argparse
+import collections
+import csv
+import gr2_extract
+import metrics
+import multiprocessing as mp
+import multiprocessing.connection
+import os
+import sys
+import time
+
+"""
+Batch GR2 conversion over whole extracted trees, with a CSV manifest of what happened to every file.
+
+Files are handed out largest first, the small ones batched into chunks, one chunk at a time per worker process.
+Each worker reports every file as it finishes, so one that runs past the timeout is killed and replaced on its own
+and the rest of its chunk goes back in the queue. Workers retire after max_tasks files or once their memory passes
+max_rss, the FBX SDK especially never gives memory back.
+"""
+
+MANIFEST_FIELDS = ["Path", "Size", "Status", "Reason", "Seconds", "Output"]
+# Failure reasons that mean there's nothing to convert rather than a broken file
+SKIP_REASONS = ("not_eso_gr2", "no_model", "no_vertices")
+
+
+class BatchWorker:
+    def __init__(self, fmt, max_tasks, max_rss, b_verbose):
+        self.conn, child_conn = mp.Pipe()
+        self.process = mp.Process(target=worker_main, args=(child_conn, fmt, max_tasks, max_rss, b_verbose), daemon=True)
+        self.process.start()
+        child_conn.close()
+        # Set once the worker has started, b_ready only while it's asking for a chunk
+        self.b_started = False
+        self.b_ready = False
+        self.b_stopping = False
+        # (path, size, output_path) sent but not reported yet, the first one is being converted
+        self.tasks = collections.deque()
+        self.deadline = None
+
+    def send(self, chunk, timeout):
+        self.b_ready = False
+        self.tasks.extend(chunk)
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.conn.send([(path, output_path) for path, _, output_path in chunk])
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def worker_rss():
+    """
+    Resident bytes of this process, None where it can't be read.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current, in KB on linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def convert_file(path, output_path, fmt):
+    """
+    Returns (status, reason, seconds, metrics), status being ok, skipped or failed.
+    """
+    start = time.perf_counter()
+    raw = None
+    try:
+        raw = gr2_extract.extract_gr2(path, output_path, fmt)
+        reason = next(iter(raw["failures"]), "")
+    except Exception as e:
+        reason = f"error: {type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    if not reason:
+        status = "ok"
+    elif reason in SKIP_REASONS:
+        status = "skipped"
+    else:
+        status = "failed"
+    return status, reason, seconds, raw
+
+
+def worker_main(conn, fmt, max_tasks, max_rss, b_verbose):
+    if not b_verbose:
+        # Every outcome ends up in the manifest, the per file prints would only bury the progress lines
+        sys.stdout = open(os.devnull, "w")
+    conn.send("ready")
+    done = 0
+    while True:
+        chunk = conn.recv()
+        if chunk is None:
+            break
+        for path, output_path in chunk:
+            conn.send(convert_file(path, output_path, fmt))
+            done += 1
+        if max_tasks and done >= max_tasks:
+            break
+        if max_rss and (worker_rss() or 0) > max_rss:
+            break
+        # Only asks for the next chunk once it knows it isn't retiring, so nothing is sent to a worker on its way out
+        conn.send("ready")
+    # Retiring in place of the next ready, the pool starts a fresh worker
+    conn.send(None)
+    conn.close()
+
+
+def find_gr2s(roots):
+    """
+    (path, size, output_path) for every .gr2 under roots, which can be folders of GR2s or whole extracted trees.
+    output_path keeps each file's folder relative to its root's parent, so eso/0114/x.gr2 goes to models/eso/0114
+    and a root of eso/0114 to models/0114 like extract_folder always did.
+    """
+    files = []
+    for root in roots:
+        parent = os.path.dirname(os.path.abspath(root))
+        for folder, _, names in os.walk(root):
+            folder = folder.replace("\\", "/")
+            output_path = os.path.relpath(os.path.abspath(folder), parent).replace("\\", "/")
+            for name in names:
+                if name.lower().endswith(".gr2"):
+                    file_path = f"{folder}/{name}"
+                    files.append((file_path, os.path.getsize(file_path), output_path))
+    return files
+
+
+def plan_chunks(files, chunk_bytes=4 * 1024 * 1024, chunk_files=64):
+    """
+    Largest files first so the slow ones don't end up alone at the tail of the run, the small ones grouped into
+    chunks of up to chunk_bytes and chunk_files so handing them out doesn't cost more than converting them.
+    """
+    chunks = []
+    chunk = []
+    chunk_size = 0
+    for task in sorted(files, key=lambda x: x[1], reverse=True):
+        if chunk and (chunk_size + task[1] > chunk_bytes or len(chunk) >= chunk_files):
+            chunks.append(chunk)
+            chunk = []
+            chunk_size = 0
+        chunk.append(task)
+        chunk_size += task[1]
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def load_manifest(manifest_path):
+    """
+    {path: size} of the files an earlier run converted or skipped, the last row of a path winning.
+    """
+    done = {}
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row["Status"] in ("ok", "skipped"):
+                done[row["Path"]] = int(row["Size"])
+            else:
+                done.pop(row["Path"], None)
+    return done
+
+
+def convert(roots, manifest_path="gr2_manifest.csv", fmt=None, workers=None, timeout=120.0, max_tasks=1000,
+            max_rss=1024 * 1024 * 1024, resume=False, metrics_path=None, b_verbose=False):
+    """
+    Converts every .gr2 under roots to fmt (see GR2.extract) into models/, one row per file in manifest_path.
+    A file taking longer than timeout seconds is killed and recorded as failed with reason timeout, a worker dying
+    under one as crashed. resume skips files the manifest already has as ok or skipped, if they're the same size.
+    metrics_path keeps the merged per-stage metrics there, Prometheus text for .prom, JSON otherwise.
+    Returns the merged metrics.
+    """
+    fmt = fmt or gr2_extract.default_format()
+    if workers is None:
+        workers = os.cpu_count()
+    files = find_gr2s(roots)
+    b_append = resume and os.path.exists(manifest_path)
+    if resume:
+        done = load_manifest(manifest_path)
+        files = [x for x in files if done.get(x[0]) != x[1]]
+        print(f"Resuming, {len(done)} files already converted or skipped")
+    for output_path in set(x[2] for x in files):
+        os.makedirs(f"models/{output_path}", exist_ok=True)
+    pending = collections.deque(plan_chunks(files))
+    workers = max(min(workers, len(pending)), 1)
+
+    run_metrics = metrics.Metrics()
+    progress = metrics.ProgressReporter(len(files), "models")
+    statuses = collections.Counter()
+    slowest = []
+    manifest_file = open(manifest_path, "a" if b_append else "w", newline="")
+    manifest = csv.writer(manifest_file)
+    if not b_append:
+        manifest.writerow(MANIFEST_FIELDS)
+
+    def record(task, status, reason, seconds, raw):
+        path, size, output_path = task
+        name = path.split("/")[-1].split(".")[0]
+        manifest.writerow([path, size, status, reason, f"{seconds:.6f}",
+                           f"models/{output_path}/{name}.{fmt}" if status == "ok" else ""])
+        statuses[status] += 1
+        slowest.append((seconds, path))
+        if raw is not None:
+            run_metrics.merge(raw)
+        elif status == "failed":
+            run_metrics.fail(reason.split(":")[0])
+        if progress.update(1, size):
+            manifest_file.flush()
+            if metrics_path:
+                run_metrics.save(metrics_path)
+
+    def replace(worker, reason):
+        if not worker.b_started:
+            raise Exception(f"GR2 worker exited with code {worker.process.exitcode} before it started")
+        # Whatever the worker was on gets the blame, the rest of its chunk goes back to the front of the queue
+        worker.kill()
+        if worker.tasks:
+            task = worker.tasks.popleft()
+            record(task, "failed", reason, timeout if reason == "timeout" else 0.0, None)
+            if worker.tasks:
+                pending.appendleft(list(worker.tasks))
+        pool.remove(worker)
+        if pending:
+            pool.append(BatchWorker(fmt, max_tasks, max_rss, b_verbose))
+
+    pool = [BatchWorker(fmt, max_tasks, max_rss, b_verbose) for _ in range(workers)]
+    try:
+        while pool:
+            for worker in pool:
+                if worker.b_ready and not worker.b_stopping:
+                    if pending:
+                        worker.send(pending.popleft(), timeout)
+                    elif not any(x.tasks for x in pool):
+                        worker.conn.send(None)
+                        worker.b_ready = False
+                        worker.b_stopping = True
+            deadlines = [x.deadline for x in pool if x.tasks and x.deadline]
+            wait = max(min(deadlines) - time.monotonic(), 0.0) if deadlines else None
+            ready = mp.connection.wait([x.conn for x in pool] + [x.process.sentinel for x in pool], wait)
+            for worker in list(pool):
+                if worker.conn not in ready and worker.process.sentinel not in ready:
+                    continue
+                try:
+                    while worker.conn.poll():
+                        message = worker.conn.recv()
+                        if message == "ready":
+                            worker.b_started = True
+                            worker.b_ready = True
+                        elif message is None:
+                            # Retired after reporting its whole chunk, anything still listed goes back in the queue
+                            if worker.tasks:
+                                pending.appendleft(list(worker.tasks))
+                                worker.tasks.clear()
+                            worker.process.join()
+                            worker.conn.close()
+                            pool.remove(worker)
+                            if pending:
+                                pool.append(BatchWorker(fmt, max_tasks, max_rss, b_verbose))
+                            break
+                        else:
+                            record(worker.tasks.popleft(), *message)
+                            worker.deadline = time.monotonic() + timeout if timeout else None
+                    else:
+                        if not worker.process.is_alive():
+                            replace(worker, "crashed")
+                except (EOFError, OSError):
+                    replace(worker, "crashed")
+            now = time.monotonic()
+            for worker in list(pool):
+                if worker.tasks and worker.deadline and now >= worker.deadline:
+                    replace(worker, "timeout")
+    finally:
+        for worker in pool:
+            worker.kill()
+        manifest_file.close()
+
+    print(f"Converted {statuses['ok']} models, {statuses['skipped']} skipped, {statuses['failed']} failed, "
+          f"manifest in {manifest_path}")
+    for seconds, path in sorted(slowest, reverse=True)[:5]:
+        print(f"  {seconds:.2f}s {path}")
+    run_metrics.print_summary()
+    if metrics_path:
+        run_metrics.save(metrics_path)
+    return run_metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert every GR2 under some folders or extracted trees")
+    parser.add_argument("roots", nargs="+")
+    parser.add_argument("--format", choices=gr2_extract.FORMATS, help="fbx when the SDK is installed, glb otherwise")
+    parser.add_argument("--manifest", default="gr2_manifest.csv", help="CSV with the status, failure reason and time of every file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds one file may take before its worker is killed, 0 for none")
+    parser.add_argument("--max-tasks", type=int, default=1000, help="files a worker converts before it's replaced, 0 for no limit")
+    parser.add_argument("--max-rss", type=int, default=1024, metavar="MB", help="memory a worker may reach before it's replaced, 0 for no limit")
+    parser.add_argument("--resume", action="store_true", help="skip files the manifest already has as converted or skipped")
+    parser.add_argument("--metrics", metavar="PATH", help="keep per-stage metrics in PATH, Prometheus text for .prom, JSON otherwise")
+    parser.add_argument("--verbose", action="store_true", help="keep the workers' per file output")
+    args = parser.parse_args()
+    convert(args.roots, args.manifest, args.format, args.workers, args.timeout, args.max_tasks, args.max_rss * 1024 * 1024,
+            args.resume, args.metrics, args.verbose)
@@ -1,8 +1,18 @@
 import gf
-import fbx
-import pyfbx
+import gr2_structs
+import mesh_writer
+import metrics
+import mmap
+import numpy as np
 import os
-import multiprocessing as mp
+import struct
+try:
+    import fbx
+    import pyfbx
+except ImportError:
+    # The FBX SDK bindings are proprietary, without them models go out through mesh_writer
+    fbx = None
+    pyfbx = None
 
 """
 https://github.com/Norbyte/lslib/blob/master/LSLib/Granny/GR2/Reader.cs
@@ -15,6 +25,17 @@ Instead focusing on
 thats it.
 """
 
+INDEX_DTYPES = {2: "<u2", 4: "<u4"}
+# Computed strides whose vertices are really laid out with a different step, any other stride is the step itself
+VERTEX_STEPS = {35: 32}
+# Files at least this big are mapped rather than read into memory
+mmap_min_size = 8 * 1024 * 1024
+FORMATS = ("fbx",) + mesh_writer.FORMATS
+
+
+def default_format():
+    return "fbx" if fbx else "glb"
+
 
 class Header:
     def __init__(self):
@@ -42,213 +63,210 @@ class Section:
         self.relocations_count = -1
         self.marshalling_offset = -1
         self.marshalling_count = -1
-        self.marshallings = []
-        self.relocations = []
+        self.marshallings = np.zeros(0, dtype=gr2_structs.MARSHALL_DTYPE)
+        self.marshalling_offsets = np.zeros(0, dtype=np.int64)
+        self.relocations = np.zeros(0, dtype=gr2_structs.RELOCATION_DTYPE)
+        self.fixup_addresses = np.zeros(0, dtype=np.int64)
         self.mesh = False
 
     def read_relocations(self):
-        self.parent.fb.seek(self.relocations_offset, 0)
-        for i in range(self.relocations_count):
-            reloc = RelocationData()
-            reloc.offset_in_section = gf.get_uint32(self.parent.fb.read(4), 0)
-            reloc.section_ref = gf.get_uint32(self.parent.fb.read(4), 0)
-            reloc.section_ref_offset = gf.get_uint32(self.parent.fb.read(4), 0)
-            reloc.fixup_address = self.parent.sections[reloc.section_ref].offset + reloc.section_ref_offset
-            self.relocations.append(reloc)
+        self.relocations = self.parent.table(gr2_structs.RELOCATION_DTYPE, self.relocations_count, self.relocations_offset)
+        self.fixup_addresses = self.parent.section_offsets[self.relocations["section_ref"]] + self.relocations["section_ref_offset"]
 
     def read_marshalls(self):
-        self.parent.fb.seek(self.marshalling_offset, 0)
-        for i in range(self.marshalling_count):
-            marsh = Marshall()
-            marsh.count = gf.get_uint32(self.parent.fb.read(4), 0)
-            marsh.offset_in_section = gf.get_uint32(self.parent.fb.read(4), 0)
-            marsh.sector_ref = gf.get_uint32(self.parent.fb.read(4), 0)
-            marsh.section_ref_offset = gf.get_uint32(self.parent.fb.read(4), 0)
-            marsh.offset = self.parent.sections[marsh.sector_ref].offset + marsh.section_ref_offset
-            self.marshallings.append(marsh)
-
-
-class RelocationData:
-    def __init__(self):
-        self.offset_in_section = -1
-        self.section_ref = -1
-        self.section_ref_offset = -1
-        self.fixup_address = -1
+        self.marshallings = self.parent.table(gr2_structs.MARSHALL_DTYPE, self.marshalling_count, self.marshalling_offset)
+        self.marshalling_offsets = self.parent.section_offsets[self.marshallings["sector_ref"]] + self.marshallings["section_ref_offset"]
 
 
-class Marshall:
-    def __init__(self):
-        self.count = -1
-        self.offset_in_section = -1
-        self.sector_ref = -1
-        self.section_ref_offset = -1
-        self.offset = -1
-        self.data = b''
-
 class GR2:
-    def __init__(self, file_path, override_model=pyfbx.Model()):
+    """
+    The whole file is read (or mapped, from mmap_min_size or with b_mmap) up front and the handle closed straight away.
+    close() or a with block releases a mapping, everything parsed out of the file is a copy and outlives it.
+    """
+
+    def __init__(self, file_path, override_model=None, stats=None, b_mmap=None):
         self.header = Header()
         self.sections = []
+        self.section_table = np.zeros(0, dtype=gr2_structs.SECTION_DTYPE)
+        self.section_offsets = np.zeros(0, dtype=np.int64)
         self.mesh_sections = []
         self.mesh_count = -1
-        self.fb = open(file_path, "rb")
+        with open(file_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if b_mmap is None:
+                b_mmap = size >= mmap_min_size
+            if b_mmap and size:
+                self.fb = gf.BinaryView(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                self.fb = gf.BinaryView(f.read())
         self.meshes = []
         self.fbx_model = override_model
         self.name = file_path.split('/')[-1].split('.')[0]
+        self.stats = stats if stats is not None else metrics.Metrics()
+        # Why extract gave up, for the failure counts
+        self.failure = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.fb.close()
+
+    def table(self, dtype, count, offset):
+        """
+        count records of a structured dtype at offset, copied out of the file.
+        """
+        if offset + dtype.itemsize * count > len(self.fb):
+            raise struct.error(f"{count} records at {offset} run past the end of the file")
+        return self.fb.array(dtype, count, offset).copy()
+
+    def read_uint32s(self, offsets):
+        """
+        The uint32 at each offset, 0 for offsets past the end of the file.
+        """
+        data = np.frombuffer(self.fb.data, dtype=np.uint8)
+        values = np.zeros(len(offsets), dtype=np.uint32)
+        valid = (offsets >= 0) & (offsets + 4 <= len(data))
+        values[valid] = data[offsets[valid, None] + np.arange(4)].view("<u4").ravel()
+        return values
 
     def get_header(self):
-        self.header.magic32 = gf.get_uint32(self.fb.read(4), 0)
-        if self.header.magic32 != 1581882341:
+        # Header and section table
+        if len(self.fb) < gr2_structs.SECTION_OFFSET + gr2_structs.SECTION_COUNT * gr2_structs.SECTION_DTYPE.itemsize:
+            raise TypeError("File provided is not ESO GR2")
+        header = self.table(gr2_structs.HEADER_DTYPE, 1, 0)[0]
+        for name in gr2_structs.HEADER_DTYPE.names:
+            setattr(self.header, name, int(header[name]))  # unk1 6?
+        if self.header.magic32 != gr2_structs.GR2_MAGIC:
             raise TypeError("File provided is not ESO GR2")
-        self.fb.seek(0x1C, 1)
-        self.header.file_format = gf.get_uint32(self.fb.read(4), 0)
         if self.header.file_format != 7:
             raise TypeError("ESO GR2 given is not file version 7")
-        self.header.total_file_size = gf.get_uint32(self.fb.read(4), 0)
-        self.header.crc32 = gf.get_uint32(self.fb.read(4), 0)
-        self.header.header_size = gf.get_uint32(self.fb.read(4), 0)
-        self.header.section_count = gf.get_uint32(self.fb.read(4), 0)
-        if self.header.section_count != 8:
+        if self.header.section_count != gr2_structs.SECTION_COUNT:
             raise TypeError("Section != 8 found!")
-        self.header.unk1 = gf.get_uint32(self.fb.read(4), 0)  # 6?
-        self.header.unk2 = gf.get_uint32(self.fb.read(4), 0)
 
     def read_sections(self):
-        section_offset = 0x68
-        self.fb.seek(section_offset, 0)
-        for i in range(self.header.section_count):
+        self.section_table = self.table(gr2_structs.SECTION_DTYPE, self.header.section_count, gr2_structs.SECTION_OFFSET)
+        self.section_offsets = self.section_table["offset"].astype(np.int64)
+        for record in self.section_table:
             section = Section(self)
-            section.compression_flag = gf.get_uint32(self.fb.read(4), 0)
+            for name in gr2_structs.SECTION_DTYPE.names:
+                setattr(section, name, int(record[name]))
             if section.compression_flag != 0:
                 print(f"\nFILE IS COMPRESSED WITH FLAG {section.compression_flag}. SKIPPING...\n")
+                self.failure = "compressed_section"
                 return False
                 # raise Exception("Comp flag != 0")
-            section.offset = gf.get_uint32(self.fb.read(4), 0)
-            section.decomp_length = gf.get_uint32(self.fb.read(4), 0)
-            section.comp_length = gf.get_uint32(self.fb.read(4), 0)
-            section.alignment = gf.get_uint32(self.fb.read(4), 0)
-            section.first16bit = gf.get_uint32(self.fb.read(4), 0)
-            section.first8bit = gf.get_uint32(self.fb.read(4), 0)
-            section.relocations_offset = gf.get_uint32(self.fb.read(4), 0)
-            section.relocations_count = gf.get_uint32(self.fb.read(4), 0)
-            section.marshalling_offset = gf.get_uint32(self.fb.read(4), 0)
-            section.marshalling_count = gf.get_uint32(self.fb.read(4), 0)
             if section.relocations_count == 0 and section.marshalling_count != 0:
                 section.mesh = True
             self.sections.append(section)
         return True
 
-    def extract(self, mesh_only=True, output_path="", save=True):
-        self.get_header()
-        ret = self.read_sections()
-        if not ret:
+    def extract(self, mesh_only=True, output_path="", save=True, fmt=None):
+        """
+        fmt is one of FORMATS, fbx when the SDK is installed and glb otherwise by default.
+        Returns the FbxMeshes for fbx, the mesh_writer.Scene for the others.
+        """
+        if not self.parse(mesh_only):
             return
-        for section in self.sections:
-            section.read_marshalls()
-            section.read_relocations()
+        with self.stats.stage("export"):
+            return self.export(output_path, save, fmt)
+
+    def parse(self, mesh_only=True):
+        """
+        Reads the meshes without exporting them, returns False with self.failure set if the model can't be read.
+        """
+        with self.stats.stage("read"):
+            self.get_header()
+            try:
+                ret = self.read_sections()
+                if ret:
+                    for section in self.sections:
+                        section.read_marshalls()
+                        section.read_relocations()
+            except struct.error:
+                self.failure = "truncated"
+                ret = False
+            except IndexError:
+                # A relocation or marshall refers to a section that doesn't exist
+                self.failure = "bad_section_ref"
+                ret = False
+        if not ret:
+            self.stats.fail(self.failure)
+            return False
         if not mesh_only:
             raise Exception("Only mesh supported, do not use False for mesh_only")
         else:
             self.mesh_sections = [x for x in self.sections if x.mesh]
             self.mesh_count = sum([x.marshalling_count for x in self.mesh_sections])
-            ret = self.find_and_read_index_header()
-            if not ret:
-                return
-            ret = self.get_submeshes()
+            with self.stats.stage("parse"):
+                try:
+                    ret = self.find_and_read_index_header()
+                    if ret:
+                        ret = self.get_submeshes()
+                except struct.error:
+                    # An offset points past the end of the file
+                    self.failure = "truncated"
+                    ret = False
+                except IndexError:
+                    # The mesh structs need more relocations than section 0 has
+                    self.failure = "bad_relocations"
+                    ret = False
             if not ret:
-                return
-        return self.export(output_path, save)
+                self.stats.fail(self.failure)
+                return False
+        self.stats.count("models")
+        self.stats.count("meshes", len(self.meshes))
+        self.stats.count("vertices", sum(m.vertex_count for m in self.meshes))
+        self.stats.count("triangles", sum(s.tri_count for m in self.meshes for s in m.submeshes))
+        return True
 
     def get_submeshes(self):
         # Process data
         for i, m in enumerate(self.meshes):
             # Faces
             for j, s in enumerate(m.submeshes):
-                self.fb.seek(m.index_offset+s.tri_offset*m.index_stride*3, 0)
-                if m.index_stride == 2:
-                    for w in range(0, s.tri_count):
-                        s.faces.append([gf.get_uint16(self.fb.read(2), 0) for k in range(3)])
-                elif m.index_stride == 4:
-                    for w in range(0, s.tri_count):
-                        s.faces.append([gf.get_uint32(self.fb.read(4), 0) for k in range(3)])
-                else:
+                face_offset = m.index_offset+s.tri_offset*m.index_stride*3
+                if m.index_stride not in INDEX_DTYPES:
                     print("Stride broken vertex")
+                    self.failure = "index_stride"
                     return False
                     # raise Exception(f"New index stride {m.index_stride}")
+                if face_offset + s.tri_count*m.index_stride*3 > len(self.fb):
+                    self.failure = "truncated"
+                    return False
+                s.faces = self.fb.array(INDEX_DTYPES[m.index_stride], s.tri_count*3, face_offset).reshape(-1, 3).copy()
             # Verts
-            self.fb.seek(m.vertex_offset, 0)
-            if m.vertex_stride == 32:
-                for w in range(m.vertex_count):
-                    m.vert_pos.append([gf.get_float32(self.fb.read(4), 0) for k in range(3)])
-                    self.fb.seek(32-12, 1)
-            elif m.vertex_stride == 35:
-                for w in range(m.vertex_count):
-                    m.vert_pos.append([gf.get_float32(self.fb.read(4), 0) for k in range(3)])
-                    self.fb.seek(32-12, 1)
-                qb = 0
-            elif m.vertex_stride == 36:
-                for w in range(m.vertex_count):
-                    m.vert_pos.append([gf.get_float32(self.fb.read(4), 0) for k in range(3)])
-                    self.fb.seek(36-12, 1)
-            elif m.vertex_stride == 38:  # unchecked
-                for w in range(m.vertex_count):
-                    m.vert_pos.append([gf.get_float32(self.fb.read(4), 0) for k in range(3)])
-                    self.fb.seek(38-12, 1)
-                qb = 0
-            elif m.vertex_stride == 40:
-                for w in range(m.vertex_count):
-                    m.vert_pos.append([gf.get_float32(self.fb.read(4), 0) for k in range(3)])
-                    self.fb.seek(40-12, 1)
-                qb = 0
-            elif m.vertex_stride == 42:
-                for w in range(m.vertex_count):
-                    m.vert_pos.append([gf.get_float32(self.fb.read(4), 0) for k in range(3)])
-                    self.fb.seek(42-12, 1)
-                qb = 0
-            elif m.vertex_stride == 44:
-                for w in range(m.vertex_count):
-                    m.vert_pos.append([gf.get_float32(self.fb.read(4), 0) for k in range(3)])
-                    self.fb.seek(44 - 12, 1)
-            elif m.vertex_stride == 48:
-                for w in range(m.vertex_count):
-                    m.vert_pos.append([gf.get_float32(self.fb.read(4), 0) for k in range(3)])
-                    self.fb.seek(48 - 12, 1)
-            elif m.vertex_stride == 60:
-                for w in range(m.vertex_count):
-                    m.vert_pos.append([gf.get_float32(self.fb.read(4), 0) for k in range(3)])
-                    self.fb.seek(60 - 12, 1)
-            elif m.vertex_stride == 68:
-                for w in range(m.vertex_count):
-                    m.vert_pos.append([gf.get_float32(self.fb.read(4), 0) for k in range(3)])
-                    self.fb.seek(68 - 12, 1)
-            else:
-                # if m.vertex_stride == 0 or m.vertex_stride == 37 or m.vertex_stride == 41 or m.vertex_stride == 50:
+            step = VERTEX_STEPS.get(m.vertex_stride, m.vertex_stride)
+            if step < 12:
                 print("Stride broken vertex")
+                self.failure = "vertex_stride"
+                return False
+            if m.vertex_offset + (m.vertex_count-1)*step + 12 > len(self.fb):
+                self.failure = "truncated"
                 return False
-                # raise Exception(f"New vertex stride {m.vertex_stride}")
-            a = 0
+            # Copied out so the mesh doesn't keep the whole file alive
+            m.vert_pos = vertex_attribute(self.fb.data, m.vertex_offset, m.vertex_count, step).copy()
 
-            # I'm going to assume the min is in first and max in last vert for submeshes, if its not use dict method like in D2 stuff
             for j, s in enumerate(m.submeshes):
-                dsort = set()
-                for face in s.faces:
-                    for f in face:
-                        dsort.add(f)
-                dsort = sorted(dsort)
-
-                if not dsort:
+                if not len(s.faces):
                     continue
-
-                # Moves all the faces down to start at 0
-                d = dict(zip(dsort, range(max(dsort) + 1)))
-                for j in range(len(s.faces)):
-                    for k in range(3):
-                        s.faces[j][k] = d[s.faces[j][k]]
-
-                s.vert_pos = trim_verts_data(m.vert_pos, dsort)
+                if s.faces.max() >= m.vertex_count:
+                    self.failure = "index_range"
+                    return False
+                s.faces, s.vert_pos = remap_submesh(s.faces, m.vert_pos)
         return True
 
-    def export(self, output_path, save):
+    def export(self, output_path, save, fmt=None):
+        fmt = fmt or default_format()
+        if fmt != "fbx":
+            return self.export_scene(output_path, save, fmt)
+        if fbx is None:
+            raise Exception("FBX export needs the FBX SDK python bindings, use glb or obj instead")
+        if self.fbx_model is None:
+            self.fbx_model = pyfbx.Model()
         meshes = []
         for i, m in enumerate(self.meshes):
             for j, s in enumerate(m.submeshes):
@@ -264,82 +282,68 @@ class GR2:
             print(f'Written models/{output_path}/{self.name}.fbx')
         return meshes
 
+    def export_scene(self, output_path, save, fmt):
+        scene = mesh_writer.Scene()
+        for i, m in enumerate(self.meshes):
+            for j, s in enumerate(m.submeshes):
+                mesh = scene.add_mesh(f"{i}_{j}", s.vert_pos, s.faces)
+                scene.add_node(f"{i}_{j}", mesh, scale=(100, 100, 100))
+        if save:
+            scene.write(f'models/{output_path}/{self.name}.{fmt}')
+            print(f'Written models/{output_path}/{self.name}.{fmt}')
+        return scene
+
     def create_mesh(self, submesh, name):
-        mesh = fbx.FbxMesh.Create(self.fbx_model.scene, name)
-        controlpoints = [fbx.FbxVector4(x[0], x[1], x[2]) for x in submesh.vert_pos]
-        for i, p in enumerate(controlpoints):
-            mesh.SetControlPointAt(p, i)
-        for face in submesh.faces:
-            mesh.BeginPolygon()
-            mesh.AddPolygon(face[0])
-            mesh.AddPolygon(face[1])
-            mesh.AddPolygon(face[2])
-            mesh.EndPolygon()
-        return mesh
+        return create_fbx_mesh(self.fbx_model.scene, submesh, name)
 
     def find_and_read_index_header(self):
-        if self.name == '00151195':
-            a = 0
-        reloc_index = -1
-        relocations = self.sections[0].relocations
-        for i, x in enumerate(relocations):
-            self.fb.seek(x.fixup_address, 0)
-            if gf.get_uint32(self.fb.read(4), 0) == 10:
-                self.fb.seek(relocations[i+1].fixup_address, 0)
-                if gf.get_uint32(self.fb.read(4), 0) == 0:
-                    continue
-                self.fb.seek(relocations[i+2].fixup_address, 0)
-                if gf.get_uint32(self.fb.read(4), 0) != 0:
-                    continue
-
-                reloc_index = i
-                break
+        section_refs = self.sections[0].relocations["section_ref"]
+        fixups = self.sections[0].fixup_addresses
+        # The mesh list starts at the first type 10 whose next pointer is set and the one after empty
+        values = self.read_uint32s(fixups)
+        found = np.flatnonzero((values[:-2] == 10) & (values[1:-1] != 0) & (values[2:] == 0))
+        reloc_index = int(found[0]) if len(found) else -1
 
         if reloc_index == -1:
             print("Model could not be found... please fix this as there is a model here prob")
+            self.failure = "no_model"
             return False
-        q = 0
 
         for i in range(self.mesh_count):
             mesh = Mesh()
             reloc_index += 1  # Type 10
             # Vertex offset
-            mesh.vertex_offset = relocations[reloc_index].fixup_address
-            mesh.vertex_section = relocations[reloc_index].section_ref
+            mesh.vertex_offset = int(fixups[reloc_index])
+            mesh.vertex_section = int(section_refs[reloc_index])
             reloc_index += 1
             # Vertex count
-            self.fb.seek(relocations[reloc_index].fixup_address+8, 0)
-            mesh.vertex_count = gf.get_uint32(self.fb.read(4), 0)
+            mesh.vertex_count = self.fb.uint32(int(fixups[reloc_index])+8)
             if mesh.vertex_count == 0:
                 print("Model could not be found... please fix this as there is a model here prob")
+                self.failure = "no_vertices"
                 return False
             reloc_index += 1
             self.meshes.append(mesh)
         reloc_index += 1  # Empty
         for mesh in self.meshes:
             # Parts definition
-            part_def_offset = relocations[reloc_index].fixup_address
+            part_def_offset = int(fixups[reloc_index])
             reloc_index += 1
             # Index offset
-            mesh.index_offset = relocations[reloc_index].fixup_address
-            mesh.index_section = relocations[reloc_index].section_ref
+            mesh.index_offset = int(fixups[reloc_index])
+            mesh.index_section = int(section_refs[reloc_index])
             reloc_index += 1
             # Index count and part count
-            debug = self.fb.seek(relocations[reloc_index].fixup_address, 0)
-            mesh.submesh_count = gf.get_uint32(self.fb.read(4), 0)
-            self.fb.seek(8, 1)
-            mesh.index_count = gf.get_uint32(self.fb.read(4), 0)
+            count_offset = int(fixups[reloc_index])
+            mesh.submesh_count = self.fb.uint32(count_offset)
+            mesh.index_count = self.fb.uint32(count_offset+12)
             if mesh.index_count == 0:
-                self.fb.seek(8, 1)
-                mesh.index_count = gf.get_uint32(self.fb.read(4), 0)
+                mesh.index_count = self.fb.uint32(count_offset+24)
             reloc_index += 1
             # Processing data
-            self.fb.seek(part_def_offset, 0)
-            for j in range(mesh.submesh_count):
+            for part in self.fb.iter_unpack("III", mesh.submesh_count, part_def_offset):
                 submesh = Submesh()
-                submesh.material_index = gf.get_uint32(self.fb.read(4), 0)
-                submesh.tri_offset = gf.get_uint32(self.fb.read(4), 0)
-                submesh.tri_count = gf.get_uint32(self.fb.read(4), 0)
+                submesh.material_index, submesh.tri_offset, submesh.tri_count = part
                 mesh.submeshes.append(submesh)
         reloc_index += 1  # Empty
 
@@ -361,17 +365,48 @@ class GR2:
         return True
 
 
+def create_fbx_mesh(scene, submesh, name):
+    mesh = fbx.FbxMesh.Create(scene, name)
+    controlpoints = [fbx.FbxVector4(x[0], x[1], x[2]) for x in np.asarray(submesh.vert_pos).tolist()]
+    for i, p in enumerate(controlpoints):
+        mesh.SetControlPointAt(p, i)
+    for face in np.asarray(submesh.faces).tolist():
+        mesh.BeginPolygon()
+        mesh.AddPolygon(face[0])
+        mesh.AddPolygon(face[1])
+        mesh.AddPolygon(face[2])
+        mesh.EndPolygon()
+    return mesh
+
+
+def vertex_attribute(data, offset, count, stride, dtype="<f4", components=3, attribute_offset=0):
+    """
+    One attribute of count interleaved vertices as a (count, components) view over data, without copying.
+    Positions are the first 3 floats, normals or UVs would be the same call at their attribute_offset.
+    """
+    dtype = np.dtype(dtype)
+    return np.ndarray((count, components), dtype=dtype, buffer=data, offset=offset+attribute_offset,
+                      strides=(stride, dtype.itemsize))
+
+
+def remap_submesh(faces, verts):
+    """
+    Keeps only the vertices a submesh uses and renumbers its faces from 0, in the order of the old indices.
+    """
+    dsort, inverse = np.unique(faces, return_inverse=True)
+    return inverse.reshape(-1, 3).astype(np.uint32), trim_verts_data(verts, dsort)
+
+
 def trim_verts_data(verts, dsort, vc=False):
-    v_new = []
-    for i in dsort:
-        if vc:
-            if i >= len(verts):
-                v_new.append([0, 0, 0, 0])
-            else:
-                v_new.append(verts[i])
-        else:
-            v_new.append(verts[i])
-    return v_new
+    verts = np.asarray(verts)
+    dsort = np.asarray(dsort, dtype=np.int64)
+    if vc:
+        # Vertex colours past the end of the buffer come out black
+        v_new = np.zeros((len(dsort), 4), dtype=verts.dtype)
+        valid = dsort < len(verts)
+        v_new[valid] = verts[dsort[valid]]
+        return v_new
+    return verts[dsort]
 
 
 class Mesh:
@@ -388,31 +423,43 @@ class Mesh:
         self.index_section = -1
         self.vertex_stride = -1
         self.index_stride = -1
-        self.vert_pos = []
+        self.vert_pos = np.zeros((0, 3), dtype=np.float32)
 
 class Submesh:
     def __init__(self):
         self.tri_count = -1
         self.tri_offset = -1
         self.material_index = -1
-        self.vert_pos = []
-        self.faces = []
-
-
-def extract_gr2(path, output_path=""):
-    gr2 = GR2(path)
-    gr2.extract(mesh_only=True, output_path=output_path)
-
-
-def extract_folder(folder):
-    t_pool = mp.Pool(mp.cpu_count())
-
-    output = folder.split('/')[-1]
-    os.makedirs("models/" + output, exist_ok=True)
-    _args = [(f"{folder}/{file}", output) for file in os.listdir(folder) if ".gr2" in file]
-
-    t_pool.starmap(extract_gr2, _args)
-    t_pool.close()
+        self.vert_pos = np.zeros((0, 3), dtype=np.float32)
+        self.faces = np.zeros((0, 3), dtype=np.uint32)
+
+
+def extract_gr2(path, output_path="", fmt=None):
+    """
+    Returns the model's metrics for Metrics.merge.
+    """
+    stats = metrics.Metrics()
+    stats.count("bytes_in", os.path.getsize(path))
+    try:
+        with GR2(path, stats=stats) as gr2:
+            gr2.extract(mesh_only=True, output_path=output_path, fmt=fmt)
+    except TypeError:
+        # get_header rejects anything that isn't a version 7 ESO GR2 with 8 sections
+        stats.fail("not_eso_gr2")
+    return stats.raw()
+
+
+def extract_folder(folder, metrics_path=None, fmt=None, manifest_path=None):
+    """
+    Converts every .gr2 in folder to fmt (see GR2.extract) into models/{folder name}, see gr2_batch.convert.
+    manifest_path defaults to models/{folder name}/manifest.csv.
+    """
+    # gr2_batch imports this module
+    import gr2_batch
+    if manifest_path is None:
+        manifest_path = f"models/{os.path.basename(os.path.abspath(folder))}/manifest.csv"
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    return gr2_batch.convert([folder], manifest_path, fmt, metrics_path=metrics_path)
 
 
 if __name__ == "__main__":
@@ -20,4 +20,23 @@ mesh count of
     more unk ...
     bone names ...
     maybe resets after that?
-"""
\ No newline at end of file
+"""
+
+import numpy as np
+
+GR2_MAGIC = 1581882341
+SECTION_COUNT = 8
+SECTION_OFFSET = 0x68
+
+# The fields read out of the 0x68 byte file header, the bytes between them are skipped
+HEADER_DTYPE = np.dtype({
+    "names": ["magic32", "file_format", "total_file_size", "crc32", "header_size", "section_count", "unk1", "unk2"],
+    "formats": ["<u4"] * 8,
+    "offsets": [0, 0x20, 0x24, 0x28, 0x2C, 0x30, 0x34, 0x38],
+    "itemsize": SECTION_OFFSET,
+})
+SECTION_DTYPE = np.dtype([(x, "<u4") for x in (
+    "compression_flag", "offset", "decomp_length", "comp_length", "alignment", "first16bit", "first8bit",
+    "relocations_offset", "relocations_count", "marshalling_offset", "marshalling_count")])
+RELOCATION_DTYPE = np.dtype([("offset_in_section", "<u4"), ("section_ref", "<u4"), ("section_ref_offset", "<u4")])
+MARSHALL_DTYPE = np.dtype([("count", "<u4"), ("offset_in_section", "<u4"), ("sector_ref", "<u4"), ("section_ref_offset", "<u4")])
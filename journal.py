@@ -0,0 +1,125 @@
+import os
+import struct
+import threading
+import time
+
+"""
+Append-only journal of extracted MNF entries so an interrupted extraction can resume.
+Each record is (ArchiveIndex, Offset, Hash, Size) plus the output name, appended after the file is written.
+"""
+
+RECORD_HEADER = struct.Struct("<IIIIH")
+
+
+class JournalRecord:
+    def __init__(self, archive_index, offset, hsh, size, name):
+        self.archive_index = archive_index
+        self.offset = offset
+        self.hash = hsh
+        self.size = size
+        self.name = name
+
+    def key(self):
+        return self.archive_index, self.offset, self.hash
+
+
+class ExtractionJournal:
+    def __init__(self, journal_path, fsync_every=512, fsync_seconds=2.0):
+        self.journal_path = journal_path
+        self.fsync_every = fsync_every
+        self.fsync_seconds = fsync_seconds
+        self.lock = threading.Lock()
+        self.pending = []
+        self.last_sync = time.monotonic()
+        self.f = None
+
+    def load(self):
+        """
+        Reads every complete record, truncating a torn record left at the end by a crash.
+        """
+        records = []
+        if not os.path.exists(self.journal_path):
+            return records
+        with open(self.journal_path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            archive_index, entry_offset, hsh, size, name_length = RECORD_HEADER.unpack_from(data, offset)
+            end = offset + RECORD_HEADER.size + name_length
+            if end > len(data):
+                break
+            name = data[offset+RECORD_HEADER.size:end].decode("utf-8")
+            records.append(JournalRecord(archive_index, entry_offset, hsh, size, name))
+            offset = end
+        if offset != len(data):
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(offset)
+        return records
+
+    def open(self, resume):
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+        self.f = open(self.journal_path, "ab" if resume else "wb")
+
+    def record(self, archive_index, offset, hsh, size, name):
+        name = name.encode("utf-8")
+        with self.lock:
+            self.pending.append(RECORD_HEADER.pack(archive_index, offset, hsh, size, len(name)) + name)
+            if len(self.pending) >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_seconds:
+                self.sync()
+
+    def sync(self):
+        # Callers hold the lock
+        if self.pending:
+            self.f.write(b"".join(self.pending))
+            self.pending = []
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.f:
+                self.sync()
+                self.f.close()
+                self.f = None
+
+
+class QueueJournal:
+    """
+    Stands in for the ExtractionJournal in worker processes, records go through queue to the parent's journal.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def record(self, archive_index, offset, hsh, size, name):
+        self.queue.put((archive_index, offset, hsh, size, name))
+
+
+def drain(queue, journal):
+    """
+    Thread target in the parent, records what QueueJournals put on queue until it gets None.
+    """
+    for record in iter(queue.get, None):
+        journal.record(*record)
+
+
+def completed_keys(journal, output_dir, verify_tail=None):
+    """
+    Loads the journal and returns the set of finished (ArchiveIndex, Offset, Hash) keys.
+    Entries are journaled only after their file is closed, so a killed run just redoes the unjournaled ones.
+    The last verify_tail records (one fsync batch by default) are also checked against the files on disk,
+    in case the journal reached the disk before the file data did.
+    """
+    records = journal.load()
+    if verify_tail is None:
+        verify_tail = journal.fsync_every
+    done = set()
+    tail_start = max(len(records) - verify_tail, 0)
+    for i, record in enumerate(records):
+        if i >= tail_start:
+            file_path = f"{output_dir}/{record.name}"
+            if not os.path.exists(file_path) or os.path.getsize(file_path) != record.size:
+                continue
+        done.add(record.key())
+    return done
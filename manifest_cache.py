@@ -0,0 +1,104 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import numpy as np
+
+"""
+Single-file cache of named NumPy arrays, memory-mapped on load.
+Layout: magic, u32 header length, JSON header (meta + dtype/shape/offset per array), then the arrays 64-byte aligned.
+"""
+
+CACHE_MAGIC = b"ESOMC1\0\0"
+ALIGNMENT = 64
+
+
+def source_key(file_path):
+    """
+    Identity of a source file, the cache is stale as soon as any of these change.
+    """
+    stat = os.stat(file_path)
+    return {"path": os.path.abspath(file_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def cache_path_for(cache_dir, file_path):
+    digest = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:16]
+    return f"{cache_dir}/{os.path.basename(file_path)}.{digest}.cache"
+
+
+def encode_dtype(dtype):
+    if dtype.names:
+        return [[name, dtype.fields[name][0].str] for name in dtype.names]
+    return dtype.str
+
+
+def decode_dtype(descr):
+    if isinstance(descr, list):
+        return np.dtype([(name, x) for name, x in descr])
+    return np.dtype(descr)
+
+
+def write_arrays(file_path, meta, arrays):
+    header = {"meta": meta, "arrays": {}}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        header["arrays"][name] = {"dtype": encode_dtype(array.dtype), "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = -(-(len(CACHE_MAGIC) + 4 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    # Write to a temporary name and swap it in, so a crash never leaves a half-written cache behind
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CACHE_MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, file_path)
+
+
+def read_arrays(file_path, b_mmap=True):
+    """
+    Returns (meta, arrays), with every array a read-only view over one shared mmap, or None if there's no valid cache.
+    A truncated or corrupt file counts as no cache, the caller rebuilds it.
+    Each mapping holds a file descriptor for as long as its arrays live, so caches loaded by the thousand
+    use b_mmap=False and get their arrays over the file read into memory instead.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < len(CACHE_MAGIC) + 4:
+                return None
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if b_mmap else f.read()
+    except OSError:
+        return None
+    arrays = {}
+    try:
+        if mm[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+            raise ValueError("not a manifest cache")
+        header_length = struct.unpack_from("<I", mm, len(CACHE_MAGIC))[0]
+        header_start = len(CACHE_MAGIC) + 4
+        header = json.loads(bytes(mm[header_start:header_start+header_length]))
+        data_start = -(-(header_start + header_length) // ALIGNMENT) * ALIGNMENT
+        for name, info in header["arrays"].items():
+            dtype = decode_dtype(info["dtype"])
+            shape = tuple(info["shape"])
+            count = int(np.prod(shape)) if shape else 1
+            # frombuffer raises ValueError when the file was cut off before the array's end
+            arrays[name] = np.frombuffer(mm, dtype=dtype, count=count, offset=data_start + info["offset"]).reshape(shape)
+        meta = header["meta"]
+        if not isinstance(meta, dict):
+            raise ValueError("meta is not an object")
+    except (ValueError, KeyError, TypeError, AttributeError):
+        if b_mmap:
+            arrays.clear()
+            try:
+                mm.close()
+            except BufferError:
+                pass
+        return None
+    return meta, arrays
@@ -1,9 +1,11 @@
 import gf
 import pkg_db
 import gr2_extract
-import pyfbx
-import fbx
+import mesh_cache
+import mesh_writer
+import metrics
 import numpy as np
+from gr2_extract import fbx, pyfbx
 
 
 class Model:
@@ -14,37 +16,80 @@ class Model:
         self.path = ""
 
 
-def extract_map(file_path):
-    fb = open(file_path, "rb").read()
-    count = gf.get_uint32(fb, 0x4)
+def extract_map(file_path, base_path, cache=None, workers=None, fmt=None):
+    """
+    cache is the MeshCache models come from, by default the shared one so repeated maps reuse parsed models.
+    The map's unique models are decoded across workers processes (MeshCache.get_many picks by default, 1 for serial),
+    the scene is only ever built here since FBX objects can't cross processes.
+    fmt is one of gr2_extract.FORMATS, by default fbx if the SDK is installed and glb otherwise.
+    """
+    if cache is None:
+        cache = mesh_cache.get_cache()
+    fmt = fmt or gr2_extract.default_format()
+    b_fbx = fmt == "fbx"
+    with open(file_path, "rb") as f:
+        fb = gf.BinaryView(f.read())
+    count = fb.uint32(0x4)
 
     # Reading data
     models = []
     for i in range(0x8, 0x8+count*0x60, 0x60):
         model = Model()
-        model.euler_rot = [gf.get_float32(fb, i+0x10+j*4) for j in range(3)]
-        model.position = [gf.get_float32(fb, i+0x1C+j*4) for j in range(3)]
-        model.ref = fb[i+0x44:i+0x44+8].hex().upper()
-        if model.ref in fileid_path_map.keys():
-            model.path = fileid_path_map[model.ref] + ".gr2"
+        model.euler_rot = list(fb.unpack("3f", i+0x10))
+        model.position = list(fb.unpack("3f", i+0x1C))
+        model.ref = fb.uint64(i+0x44)
+        models.append(model)
+
+    # Only the referenced FileIDs are looked up, through the catalog index
+    entries = pkg_db.lookup_many([m.ref for m in models], 'ArchiveIndex, Indexx')
+    for model in models:
+        if model.ref in entries.keys():
+            archive_index, index = entries[model.ref]
+            model.path = f"{base_path}/{gf.fill_hex_with_zeros(str(archive_index), 4)}/{gf.fill_hex_with_zeros(str(index), 8)}.gr2"
         else:
             print("Model missing...")
-        models.append(model)
+
+    # Decoding every distinct model up front, in parallel
+    decoded = cache.get_many(list(dict.fromkeys(m.path for m in models if m.path)), workers)
 
     # Extracting models and appending to a single thing like my static map stuff
-    fbx_model = pyfbx.Model()
+    if b_fbx:
+        fbx_model = pyfbx.Model()
+    else:
+        scene = mesh_writer.Scene()
+    # Every placement of a model shares its meshes, only the nodes carrying the transforms are per placement
+    instances = {}
+    progress = metrics.ProgressReporter(len(models), "placements")
     for i, m in enumerate(models):
-        print(f"{i+1}/{len(models)}   {round(i*100/len(models), 1)}%")
+        progress.update(1)
         # Extract as usual
         if not m.path:
             continue
-        gr2 = gr2_extract.GR2(m.path, override_model=fbx_model)
-        fbxmeshes = gr2.extract(mesh_only=True, save=False)
+        # Each distinct model is only built once, every placement after that is an instance of it
+        digest = cache.digest(m.path)
+        meshes = instances.get(digest)
+        if meshes is None:
+            cached = decoded[digest]
+            names = [f"{cached.name}_{mesh_index}_{submesh_index}" for mesh_index, submesh_index, _ in cached.submeshes]
+            if b_fbx:
+                meshes = [gr2_extract.create_fbx_mesh(fbx_model.scene, submesh, name)
+                          for name, (_, _, submesh) in zip(names, cached.submeshes)]
+            else:
+                meshes = [scene.add_mesh(name, submesh.vert_pos, submesh.faces)
+                          for name, (_, _, submesh) in zip(names, cached.submeshes)]
+                meshes = [x for x in meshes if x is not None]
+            instances[digest] = meshes
         euler_rot_deg = [x*180/np.pi for x in m.euler_rot]
         translation = m.position
-        if not fbxmeshes:
+        if not meshes:
+            continue
+        if not b_fbx:
+            # The same transform as the FBX nodes below, geometric rotation and translation under a 100x local scale
+            rotation = mesh_writer.euler_to_quaternion(*m.euler_rot)
+            for mesh in meshes:
+                scene.add_node(m.path.split('/')[-1], mesh, [x*100 for x in translation], rotation, (100, 100, 100))
             continue
-        for fbxmesh in fbxmeshes:
+        for fbxmesh in meshes:
             node = fbx.FbxNode.Create(fbx_model.scene, m.path.split('/')[-1])
             node.SetNodeAttribute(fbxmesh)
             node.SetGeometricRotation(fbx.FbxNode.eSourcePivot, fbx.FbxVector4(euler_rot_deg[0], euler_rot_deg[1], euler_rot_deg[2]))
@@ -54,15 +99,18 @@ def extract_map(file_path):
                                           fbx.FbxVector4(1, 1, 1))
             node.LclScaling.Set(fbx.FbxDouble3(100, 100, 100))
             fbx_model.scene.GetRootNode().AddChild(node)
-    fbx_model.export(save_path=f"maps/{file_path.split('/')[-1]}.fbx", ascii_format=False)
-    print(f"Written map out to maps/{file_path.split('/')[-1]}.fbx")
+    if b_fbx:
+        fbx_model.export(save_path=f"maps/{file_path.split('/')[-1]}.fbx", ascii_format=False)
+    else:
+        scene.write(f"maps/{file_path.split('/')[-1]}.{fmt}")
+    print(f"Written map out to maps/{file_path.split('/')[-1]}.{fmt}")
+    print(f"{sum(1 for m in models if m.path)} placements of {len(instances)} unique models")
+    cache.print_summary()
     a = 0
 
 
 if __name__ == "__main__":
     base_path = "P:/ESO/Tools/Extractor/eso"
     pkg_db.start_mnf_connection()
-    fileid_path_map = {x[0]: f"{base_path}/{gf.fill_hex_with_zeros(str(x[1]), 4)}/{gf.fill_hex_with_zeros(str(x[2]), 8)}" for x in
-                     pkg_db.get_entries_from_mnf('FileID, ArchiveIndex, Indexx')}
 
-    extract_map(base_path + "/0076/00754523.bin")
\ No newline at end of file
+    extract_map(base_path + "/0076/00754523.bin", base_path)
\ No newline at end of file
@@ -0,0 +1,242 @@
+import gr2_extract
+import hashlib
+import manifest_cache
+import multiprocessing as mp
+import numpy as np
+import os
+import threading
+from collections import OrderedDict
+
+"""
+Cache of decoded GR2 meshes so a model placed hundreds of times in a map is parsed once.
+
+Models are keyed by a hash of the file's contents, in memory (LRU bounded by bytes) and on disk under
+{cache_dir}/<digest[:2]>/<digest>.mesh as manifest_cache array files, so an unchanged model is parsed once per patch.
+Paths are only hashed the first time they're seen in a run, or again if their size or mtime changes.
+"""
+
+# Bump whenever the parser's output changes, older cache files are then ignored and rewritten
+MESH_CACHE_VERSION = 1
+
+# Pool size when get_many isn't given one, past this the workers mostly wait on the parent unpickling their arrays
+MAX_WORKERS = 8
+# GR2 bytes each pool worker should get at least, below that a pool's startup and the arrays coming back cost more
+# than decoding serially (~100MB/s on one core)
+PARALLEL_BYTES = 16 * 1024 * 1024
+
+# One row per submesh, indexing into the concatenated positions and faces
+SUBMESH_DTYPE = np.dtype([("mesh", "<u4"), ("submesh", "<u4"), ("material_index", "<u4"), ("vertex_start", "<u8"),
+                          ("vertex_count", "<u8"), ("face_start", "<u8"), ("face_count", "<u8")])
+
+
+class CachedModel:
+    """
+    The decoded submeshes of one GR2, or none with failure set if it couldn't be read.
+    """
+
+    def __init__(self, name, positions, faces, submesh_table, failure=None):
+        self.name = name
+        self.positions = positions
+        self.faces = faces
+        self.submesh_table = submesh_table
+        self.failure = failure
+        self.submeshes = []
+        for row in submesh_table:
+            submesh = gr2_extract.Submesh()
+            submesh.material_index = int(row["material_index"])
+            submesh.tri_count = int(row["face_count"])
+            submesh.vert_pos = positions[row["vertex_start"]:row["vertex_start"]+row["vertex_count"]]
+            submesh.faces = faces[row["face_start"]:row["face_start"]+row["face_count"]]
+            self.submeshes.append((int(row["mesh"]), int(row["submesh"]), submesh))
+
+    def __reduce__(self):
+        # Only the arrays cross to another process, the submesh views are rebuilt on the other side
+        return CachedModel, (self.name, self.positions, self.faces, self.submesh_table, self.failure)
+
+    @property
+    def nbytes(self):
+        return self.positions.nbytes + self.faces.nbytes + self.submesh_table.nbytes
+
+    @classmethod
+    def from_gr2(cls, gr2):
+        rows = []
+        positions = []
+        faces = []
+        vertex_start = 0
+        face_start = 0
+        for i, m in enumerate(gr2.meshes):
+            for j, s in enumerate(m.submeshes):
+                rows.append((i, j, s.material_index, vertex_start, len(s.vert_pos), face_start, len(s.faces)))
+                positions.append(np.asarray(s.vert_pos, dtype=np.float32).reshape(-1, 3))
+                faces.append(np.asarray(s.faces, dtype=np.uint32).reshape(-1, 3))
+                vertex_start += len(s.vert_pos)
+                face_start += len(s.faces)
+        return cls(gr2.name, np.concatenate(positions) if positions else np.zeros((0, 3), dtype=np.float32),
+                   np.concatenate(faces) if faces else np.zeros((0, 3), dtype=np.uint32),
+                   np.array(rows, dtype=SUBMESH_DTYPE))
+
+    @classmethod
+    def failed(cls, name, failure):
+        return cls(name, np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.uint32),
+                   np.zeros(0, dtype=SUBMESH_DTYPE), failure)
+
+
+class MeshCache:
+    def __init__(self, cache_dir="cache/meshes", max_bytes=512 * 1024 * 1024, b_disk=True, parallel_bytes=PARALLEL_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.b_disk = b_disk
+        self.parallel_bytes = parallel_bytes
+        self.size = 0
+        # digest: CachedModel
+        self.models = OrderedDict()
+        # abspath: ((size, mtime_ns), digest)
+        self.digests = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.parses = 0
+
+    def digest(self, file_path):
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        known = self.digests.get(file_path)
+        if known and known[0] == key:
+            return known[1]
+        with open(file_path, "rb") as f:
+            digest = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+        self.digests[file_path] = (key, digest)
+        return digest
+
+    def disk_path(self, digest):
+        return f"{self.cache_dir}/{digest[:2]}/{digest}.mesh"
+
+    def get(self, file_path, stats=None):
+        """
+        The CachedModel for a GR2, parsing it only if neither memory nor disk have it.
+        stats, a metrics.Metrics, gets the parse stages and failures of models that do get parsed.
+        """
+        digest = self.digest(file_path)
+        with self.lock:
+            model = self.models.get(digest)
+            if model is not None:
+                self.models.move_to_end(digest)
+                self.hits += 1
+                return model
+        model = self.load(digest) if self.b_disk else None
+        if model is not None:
+            self.disk_hits += 1
+        else:
+            model = self.parse(file_path, stats)
+            self.parses += 1
+            if self.b_disk:
+                self.save(digest, model)
+        self.put(digest, model)
+        return model
+
+    def put(self, digest, model):
+        if model.nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if digest in self.models:
+                return
+            self.models[digest] = model
+            self.size += model.nbytes
+            while self.size > self.max_bytes:
+                _, evicted = self.models.popitem(last=False)
+                self.size -= evicted.nbytes
+
+    def parse(self, file_path, stats=None):
+        name = file_path.replace("\\", "/").split("/")[-1].split(".")[0]
+        try:
+            with gr2_extract.GR2(file_path, stats=stats) as gr2:
+                if not gr2.parse(mesh_only=True):
+                    return CachedModel.failed(name, gr2.failure)
+                return CachedModel.from_gr2(gr2)
+        except TypeError:
+            return CachedModel.failed(name, "not_eso_gr2")
+
+    def load(self, digest):
+        # Read rather than mapped, a mapping per cached model would run the process out of file descriptors
+        loaded = manifest_cache.read_arrays(self.disk_path(digest), b_mmap=False)
+        if loaded is None:
+            return None
+        meta, arrays = loaded
+        if meta.get("version") != MESH_CACHE_VERSION or meta.get("digest") != digest or "name" not in meta:
+            return None
+        if not {"positions", "faces", "submeshes"} <= arrays.keys() or arrays["submeshes"].dtype != SUBMESH_DTYPE:
+            return None
+        return CachedModel(meta["name"], arrays["positions"], arrays["faces"], arrays["submeshes"], meta.get("failure"))
+
+    def save(self, digest, model):
+        meta = {"version": MESH_CACHE_VERSION, "digest": digest, "name": model.name, "failure": model.failure}
+        manifest_cache.write_arrays(self.disk_path(digest), meta, {
+            "positions": model.positions, "faces": model.faces, "submeshes": model.submesh_table})
+
+    def get_many(self, file_paths, workers=None):
+        """
+        {digest: CachedModel} for every path, decoding the ones not in memory across a process pool.
+        Workers go through their own MeshCache on the same cache_dir and hand back plain arrays.
+        Only as many workers as there are parallel_bytes of files to decode are started, so a few small models
+        are decoded serially. workers defaults to the cores up to MAX_WORKERS.
+        """
+        digests = {file_path: self.digest(file_path) for file_path in file_paths}
+        models = {}
+        missing = {}
+        for file_path, digest in digests.items():
+            with self.lock:
+                model = self.models.get(digest)
+            if model is not None:
+                self.hits += 1
+                models[digest] = model
+            elif digest not in missing:
+                missing[digest] = file_path
+        if workers is None:
+            workers = min(os.cpu_count() or 1, MAX_WORKERS)
+        if workers > 1 and missing:
+            total = sum(os.path.getsize(file_path) for file_path in missing.values())
+            workers = min(workers, len(missing), total // max(self.parallel_bytes, 1))
+        if workers > 1:
+            with mp.Pool(workers, initializer=init_worker, initargs=(self.cache_dir, self.max_bytes, self.b_disk)) as pool:
+                for digest, model, b_parsed in pool.imap_unordered(decode_worker, missing.values()):
+                    if b_parsed:
+                        self.parses += 1
+                    else:
+                        self.disk_hits += 1
+                    self.put(digest, model)
+                    models[digest] = model
+        else:
+            for digest, file_path in missing.items():
+                models[digest] = self.get(file_path)
+        return models
+
+    def print_summary(self):
+        print(f"Mesh cache: {self.hits} memory hits, {self.disk_hits} disk hits, {self.parses} parsed, "
+              f"{len(self.models)} models ({self.size/1e6:.1f}MB) in memory")
+
+
+cache = None
+# The cache of a pool worker, see get_many
+worker_cache = None
+
+
+def get_cache():
+    """
+    The shared mesh cache, so every map extracted in one run reuses the same models.
+    """
+    global cache
+    if cache is None:
+        cache = MeshCache()
+    return cache
+
+
+def init_worker(cache_dir, max_bytes, b_disk):
+    global worker_cache
+    worker_cache = MeshCache(cache_dir, max_bytes, b_disk)
+
+
+def decode_worker(file_path):
+    parses = worker_cache.parses
+    model = worker_cache.get(file_path)
+    return worker_cache.digest(file_path), model, worker_cache.parses > parses
@@ -0,0 +1,170 @@
+import json
+import math
+import os
+import struct
+import numpy as np
+
+"""
+Dependency-free mesh export, binary glTF (.glb) and Wavefront .obj written straight from float32 positions and
+uint32 faces. A Scene holds each mesh once and nodes that place it, nodes sharing a mesh are instances of it.
+GLB keeps the instancing, OBJ has no such thing so every node's vertices are written out transformed.
+"""
+
+FORMATS = ("glb", "obj")
+
+GLB_MAGIC = 0x46546C67
+GLB_VERSION = 2
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+FLOAT = 5126
+UNSIGNED_SHORT = 5123
+UNSIGNED_INT = 5125
+TRIANGLES = 4
+
+
+class Scene:
+    def __init__(self):
+        # (name, positions, faces)
+        self.meshes = []
+        # (name, mesh index, translation, rotation quaternion xyzw, scale)
+        self.nodes = []
+
+    def add_mesh(self, name, positions, faces):
+        """
+        Returns the mesh's index for add_node, or None for a mesh without triangles, which formats can't hold.
+        """
+        positions = np.ascontiguousarray(positions, dtype="<f4").reshape(-1, 3)
+        faces = np.ascontiguousarray(faces, dtype="<u4").reshape(-1, 3)
+        if not len(faces) or not len(positions):
+            return None
+        self.meshes.append((name, positions, faces))
+        return len(self.meshes) - 1
+
+    def add_node(self, name, mesh, translation=None, rotation=None, scale=None):
+        if mesh is None:
+            return
+        self.nodes.append((name, mesh, translation, rotation, scale))
+
+    def write(self, file_path):
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        extension = file_path.rsplit(".", 1)[-1].lower()
+        if extension == "glb":
+            write_glb(self, file_path)
+        elif extension == "obj":
+            write_obj(self, file_path)
+        else:
+            raise Exception(f"Unknown mesh format {extension}, expected one of {', '.join(FORMATS)}")
+
+
+def euler_to_quaternion(x, y, z):
+    """
+    Euler angles in radians, X applied first then Y then Z like FBX's default eEulerXYZ, as an (x, y, z, w) quaternion.
+    """
+    qx = (math.sin(x/2), 0.0, 0.0, math.cos(x/2))
+    qy = (0.0, math.sin(y/2), 0.0, math.cos(y/2))
+    qz = (0.0, 0.0, math.sin(z/2), math.cos(z/2))
+    return quaternion_multiply(quaternion_multiply(qz, qy), qx)
+
+
+def quaternion_multiply(a, b):
+    ax, ay, az, aw = a
+    bx, by, bz, bw = b
+    return (aw*bx + ax*bw + ay*bz - az*by,
+            aw*by - ax*bz + ay*bw + az*bx,
+            aw*bz + ax*by - ay*bx + az*bw,
+            aw*bw - ax*bx - ay*by - az*bz)
+
+
+def quaternion_to_matrix(q):
+    x, y, z, w = q
+    return np.array([[1 - 2*(y*y + z*z), 2*(x*y - z*w), 2*(x*z + y*w)],
+                     [2*(x*y + z*w), 1 - 2*(x*x + z*z), 2*(y*z - x*w)],
+                     [2*(x*z - y*w), 2*(y*z + x*w), 1 - 2*(x*x + y*y)]])
+
+
+def transform_positions(positions, translation=None, rotation=None, scale=None):
+    """
+    positions scaled, then rotated, then translated, the same order glTF applies a node's TRS in.
+    """
+    positions = positions.astype(np.float64)
+    if scale is not None:
+        positions = positions * np.asarray(scale, dtype=np.float64)
+    if rotation is not None:
+        positions = positions @ quaternion_to_matrix(rotation).T
+    if translation is not None:
+        positions = positions + np.asarray(translation, dtype=np.float64)
+    return positions
+
+
+def write_glb(scene, file_path):
+    chunks = []
+    offset = 0
+    buffer_views = []
+    accessors = []
+    meshes = []
+
+    def add_view(data, target):
+        nonlocal offset
+        buffer_views.append({"buffer": 0, "byteOffset": offset, "byteLength": len(data), "target": target})
+        padded = data + b"\0" * (-len(data) % 4)
+        chunks.append(padded)
+        offset += len(padded)
+        return len(buffer_views) - 1
+
+    for name, positions, faces in scene.meshes:
+        finite = positions[np.isfinite(positions).all(axis=1)]
+        bounds = finite if len(finite) else np.zeros((1, 3), dtype=np.float32)
+        accessors.append({"bufferView": add_view(positions.tobytes(), ARRAY_BUFFER), "componentType": FLOAT,
+                          "count": len(positions), "type": "VEC3",
+                          "min": bounds.min(axis=0).tolist(), "max": bounds.max(axis=0).tolist()})
+        # 16 bit indices whenever they fit, halving the index data of most game meshes
+        if len(positions) <= 0xFFFF:
+            indices, component_type = faces.astype("<u2"), UNSIGNED_SHORT
+        else:
+            indices, component_type = faces, UNSIGNED_INT
+        accessors.append({"bufferView": add_view(indices.tobytes(), ELEMENT_ARRAY_BUFFER), "componentType": component_type,
+                          "count": faces.size, "type": "SCALAR"})
+        meshes.append({"name": name, "primitives": [{"attributes": {"POSITION": len(accessors) - 2},
+                                                     "indices": len(accessors) - 1, "mode": TRIANGLES}]})
+
+    nodes = []
+    for name, mesh, translation, rotation, scale in scene.nodes:
+        node = {"name": name, "mesh": mesh}
+        if translation is not None:
+            node["translation"] = [float(x) for x in translation]
+        if rotation is not None:
+            node["rotation"] = [float(x) for x in rotation]
+        if scale is not None:
+            node["scale"] = [float(x) for x in scale]
+        nodes.append(node)
+
+    gltf = {"asset": {"version": "2.0", "generator": "ESOExtractor"}, "scene": 0,
+            "scenes": [{"nodes": list(range(len(nodes)))}], "nodes": nodes, "meshes": meshes,
+            "accessors": accessors, "bufferViews": buffer_views}
+    if offset:
+        gltf["buffers"] = [{"byteLength": offset}]
+    json_bytes = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    json_bytes += b" " * (-len(json_bytes) % 4)
+    total = 12 + 8 + len(json_bytes) + (8 + offset if offset else 0)
+    with open(file_path, "wb") as f:
+        f.write(struct.pack("<III", GLB_MAGIC, GLB_VERSION, total))
+        f.write(struct.pack("<II", len(json_bytes), CHUNK_JSON) + json_bytes)
+        if offset:
+            f.write(struct.pack("<II", offset, CHUNK_BIN))
+            for chunk in chunks:
+                f.write(chunk)
+
+
+def write_obj(scene, file_path):
+    with open(file_path, "w") as f:
+        f.write("# ESOExtractor\n")
+        vertex_base = 1
+        for name, mesh, translation, rotation, scale in scene.nodes:
+            mesh_name, positions, faces = scene.meshes[mesh]
+            positions = transform_positions(positions, translation, rotation, scale)
+            f.write(f"o {name}_{mesh_name}\n")
+            f.write(("v %.6f %.6f %.6f\n" * len(positions)) % tuple(positions.ravel().tolist()))
+            f.write(("f %d %d %d\n" * len(faces)) % tuple((faces.astype(np.int64) + vertex_base).ravel().tolist()))
+            vertex_base += len(positions)
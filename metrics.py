@@ -0,0 +1,203 @@
+import json
+import time
+from collections import Counter
+
+"""
+Per-stage timings and throughput counters for the extractors.
+Each worker fills its own Metrics without locking and hands back raw(), which the main process merges,
+so the same code works for threads and processes.
+
+Comparing a stage's wall and CPU time is what tells a disk-bound run (read wall >> CPU) from a CPU-bound one.
+"""
+
+
+class Metrics:
+    def __init__(self):
+        # stage: [calls, wall seconds, cpu seconds]
+        self.stages = {}
+        self.counters = Counter()
+        self.failures = Counter()
+        # name: [entries, bytes in, bytes out, seconds]
+        self.codecs = {}
+        self.archives = {}
+        self.start = time.perf_counter()
+
+    def stage(self, name):
+        return StageTimer(self, name)
+
+    def add_stage(self, name, wall, cpu, calls=1):
+        stage = self.stages.setdefault(name, [0, 0.0, 0.0])
+        stage[0] += calls
+        stage[1] += wall
+        stage[2] += cpu
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def fail(self, reason):
+        self.failures[reason] += 1
+
+    def throughput(self, group, name, bytes_in, bytes_out, seconds):
+        totals = getattr(self, group).setdefault(name, [0, 0, 0, 0.0])
+        totals[0] += 1
+        totals[1] += bytes_in
+        totals[2] += bytes_out
+        totals[3] += seconds
+
+    def raw(self):
+        """
+        Picklable state for merge().
+        """
+        return {"stages": self.stages, "counters": dict(self.counters), "failures": dict(self.failures),
+                "codecs": self.codecs, "archives": self.archives}
+
+    def merge(self, raw):
+        for name, (calls, wall, cpu) in raw["stages"].items():
+            self.add_stage(name, wall, cpu, calls)
+        self.counters.update(raw["counters"])
+        self.failures.update(raw["failures"])
+        for group in ("codecs", "archives"):
+            for name, (entries, bytes_in, bytes_out, seconds) in raw[group].items():
+                totals = getattr(self, group).setdefault(name, [0, 0, 0, 0.0])
+                totals[0] += entries
+                totals[1] += bytes_in
+                totals[2] += bytes_out
+                totals[3] += seconds
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.start
+        stages = {name: {"calls": calls, "wall_seconds": round(wall, 6), "cpu_seconds": round(cpu, 6),
+                         "cpu_ratio": round(cpu / wall, 3) if wall else 0.0}
+                  for name, (calls, wall, cpu) in self.stages.items()}
+        return {
+            "elapsed_seconds": round(elapsed, 6),
+            "stages": stages,
+            "counters": dict(self.counters),
+            "failures": dict(self.failures),
+            "codecs": {name: throughput_stats(*x) for name, x in self.codecs.items()},
+            "archives": {str(name): throughput_stats(*x) for name, x in sorted(self.archives.items())},
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix="eso_extract"):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+        metric("elapsed_seconds", "gauge", "Wall time since the run started", [({}, time.perf_counter() - self.start)])
+        metric("stage_calls_total", "counter", "Entries through each stage", [({"stage": k}, v[0]) for k, v in self.stages.items()])
+        metric("stage_wall_seconds_total", "counter", "Wall time per stage", [({"stage": k}, v[1]) for k, v in self.stages.items()])
+        metric("stage_cpu_seconds_total", "counter", "CPU time per stage", [({"stage": k}, v[2]) for k, v in self.stages.items()])
+        metric("count_total", "counter", "Event and byte counters", [({"name": k}, v) for k, v in self.counters.items()])
+        metric("failures_total", "counter", "Entries that failed, by reason", [({"reason": k}, v) for k, v in self.failures.items()])
+        for group, label in (("codecs", "codec"), ("archives", "archive")):
+            totals = sorted(getattr(self, group).items())
+            metric(f"{label}_entries_total", "counter", f"Entries per {label}", [({label: k}, v[0]) for k, v in totals])
+            metric(f"{label}_bytes_in_total", "counter", f"Compressed bytes per {label}", [({label: k}, v[1]) for k, v in totals])
+            metric(f"{label}_bytes_out_total", "counter", f"Decompressed bytes per {label}", [({label: k}, v[2]) for k, v in totals])
+            metric(f"{label}_seconds_total", "counter", f"Time spent per {label}", [({label: k}, v[3]) for k, v in totals])
+        return "\n".join(lines) + "\n"
+
+    def save(self, file_path):
+        """
+        Prometheus text format for .prom files, JSON otherwise.
+        """
+        with open(file_path, "w") as f:
+            f.write(self.to_prometheus() if file_path.endswith(".prom") else self.to_json())
+
+    def print_summary(self):
+        snapshot = self.snapshot()
+        for name, stage in snapshot["stages"].items():
+            print(f"  {name}: {stage['wall_seconds']:.2f}s wall, {stage['cpu_seconds']:.2f}s cpu ({stage['cpu_ratio']:.0%}) over {stage['calls']} calls")
+        for group in ("codecs", "archives"):
+            for name, stats in snapshot[group].items():
+                print(f"  {group[:-1]} {name}: {stats['entries']} entries, {stats['bytes_in']/1e6:.1f}MB -> {stats['bytes_out']/1e6:.1f}MB, {stats['mb_per_s']}MB/s")
+        if snapshot["failures"]:
+            print("  failures: " + ", ".join(f"{reason} {count}" for reason, count in snapshot["failures"].items()))
+
+
+def throughput_stats(entries, bytes_in, bytes_out, seconds):
+    return {"entries": entries, "bytes_in": bytes_in, "bytes_out": bytes_out, "seconds": round(seconds, 6),
+            "mb_per_s": round(bytes_out / seconds / 1e6, 2) if seconds else 0.0}
+
+
+def clock():
+    return time.perf_counter(), time.thread_time()
+
+
+def elapsed(start):
+    """
+    Wall and CPU seconds since a clock() reading.
+    """
+    return time.perf_counter() - start[0], time.thread_time() - start[1]
+
+
+class StageTimer:
+    """
+    with metrics.stage("write"): ... adds the wall and CPU time of the block. CPU time is the calling thread's.
+    """
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = time.thread_time() - self.cpu
+        self.metrics.add_stage(self.name, self.wall, self.cpu)
+
+
+class ProgressReporter:
+    """
+    Live progress line with rates and ETA, printed at most every interval seconds.
+    """
+
+    def __init__(self, total, unit="files", interval=2.0):
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last_print = 0.0
+        self.done = 0
+        self.bytes = 0
+
+    def update(self, done=0, byte_count=0):
+        """
+        Returns True when it printed.
+        """
+        self.done += done
+        self.bytes += byte_count
+        now = time.perf_counter()
+        if now - self.last_print >= self.interval or self.done >= self.total:
+            self.last_print = now
+            print(self.line(now))
+            return True
+        return False
+
+    def line(self, now=None):
+        elapsed = max((now or time.perf_counter()) - self.start, 1e-9)
+        rate = self.done / elapsed
+        eta = (self.total - self.done) / rate if rate else 0.0
+        return (f"{self.done}/{self.total} {self.unit} ({self.done*100/max(self.total, 1):.1f}%), "
+                f"{rate:.0f} {self.unit}/s, {self.bytes/1e6/elapsed:.1f}MB/s, ETA {format_seconds(eta)}")
+
+
+def format_seconds(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02}s"
+    return f"{seconds}s"
@@ -0,0 +1,141 @@
+import dat_archive
+import game_mnf
+import io
+import threading
+from collections import OrderedDict
+import numpy as np
+
+"""
+Read assets straight out of the .dat archives by ZOSFT path, FileID or table Index, no extraction step needed.
+
+    with mnf_archive.MnfArchive("F:/.../depot/eso.mnf") as archive:
+        data = archive.read("art/maps/tamriel/tamriel_base.dds")
+"""
+
+
+class BlobCache:
+    """
+    LRU of decompressed blobs bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.blobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            blob = self.blobs.get(key)
+            if blob is None:
+                self.misses += 1
+                return None
+            self.blobs.move_to_end(key)
+            self.hits += 1
+            return blob
+
+    def put(self, key, blob):
+        if len(blob) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.blobs:
+                return
+            self.blobs[key] = blob
+            self.size += len(blob)
+            while self.size > self.max_bytes:
+                _, evicted = self.blobs.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class MnfArchive:
+    def __init__(self, mnf_path, cache_bytes=256 * 1024 * 1024, cache_dir="cache", use_cache=True):
+        self.mnf_path = mnf_path
+        # Same test as game_mnf.get_output_prefix, anything that isn't eso.mnf is read as game data
+        self.b_game = "eso.mnf" not in mnf_path
+        self.archive_set = dat_archive.ArchiveSet(mnf_path)
+        try:
+            self.file_table, _ = game_mnf.load_file_table(cache_dir, use_cache, mnf_path, self.archive_set)
+        except Exception:
+            self.archive_set.close()
+            raise
+        self.blobs = BlobCache(cache_bytes)
+        self.path_rows = None
+        self.file_ids = None
+        self.file_id_rows = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.file_table)
+
+    def find(self, path):
+        """
+        Table row for a ZOSFT path, or None. Paths are matched case-insensitively with / separators.
+        """
+        if self.path_rows is None:
+            with self.lock:
+                if self.path_rows is None:
+                    names = self.file_table.file_names()
+                    self.path_rows = {name.lower(): i for i, name in enumerate(names) if name}
+        return self.path_rows.get(path.replace("\\", "/").lower())
+
+    def find_by_id(self, file_id):
+        if self.file_ids is None:
+            with self.lock:
+                if self.file_ids is None:
+                    file_ids = self.file_table.column("FileID")
+                    self.file_id_rows = np.argsort(file_ids, kind="stable")
+                    self.file_ids = file_ids[self.file_id_rows]
+        pos = np.searchsorted(self.file_ids, np.uint64(file_id))
+        if pos >= len(self.file_ids) or self.file_ids[pos] != file_id:
+            return None
+        return int(self.file_id_rows[pos])
+
+    def entry(self, row):
+        return self.file_table[row]
+
+    def read_row(self, row):
+        blob = self.blobs.get(row)
+        if blob is not None:
+            return blob
+        entry = self.file_table[row]
+        if self.b_game:
+            data = game_mnf.read_game_data_file(entry, self.archive_set)
+        else:
+            data = game_mnf.read_data_file(entry, self.archive_set)
+        if data is None:
+            return None
+        # Raw entries come back as views into the archive map, the cache must own its bytes
+        blob = bytes(data)
+        self.blobs.put(row, blob)
+        return blob
+
+    def read(self, path):
+        row = self.find(path)
+        if row is None:
+            raise FileNotFoundError(path)
+        return self.read_row(row)
+
+    def read_by_id(self, file_id):
+        row = self.find_by_id(file_id)
+        if row is None:
+            raise FileNotFoundError(f"FileID {file_id:016X}")
+        return self.read_row(row)
+
+    def read_by_index(self, index):
+        if not 0 <= index < len(self.file_table):
+            raise FileNotFoundError(f"Index {index}")
+        return self.read_row(index)
+
+    def open(self, path):
+        return io.BytesIO(self.read(path))
+
+    def close(self):
+        self.archive_set.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
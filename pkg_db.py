@@ -1,5 +1,6 @@
 import sqlite3 as sq
 import gf
+import numpy as np
 
 
 def drop_table(pkg_str_to_drop):
@@ -7,42 +8,153 @@ def drop_table(pkg_str_to_drop):
     c.execute(f'DROP TABLE IF EXISTS {pkg_str_to_drop}')
 
 
-def save_mnf_table(file_table, b_is_eso):
-    con = sq.connect(f'MNF.db')
-    c = con.cursor()
+def mnf_table_name(b_is_eso, patch=None):
     if b_is_eso:
         name = "eso"
     else:
         name = "game"
-    c.execute(f'DROP TABLE IF EXISTS {name}')
-    entries = [(x.Index, (gf.get_flipped_hex(gf.fill_hex_with_zeros(hex(x.FileID)[2:], 16), 16).upper()), x.FileIndex, x.ID1, x.Unk1, x.Size, x.CompressedSize, x.Hash, x.Offset, x.CompressType, x.ArchiveIndex, x.Unk2) for x in file_table]
-    c.execute(f'CREATE TABLE IF NOT EXISTS {name} ( Indexx INTEGER, FileID TEXT, FileIndex INTEGER, ID1 INTEGER, Unk1 INTEGER, Size INTEGER, CompressedSize INTEGER, Hash INTEGER, Offset INTEGER, CompressType INTEGER, ArchiveIndex INTEGER, Unk2 INTEGER)')
-    c.executemany(f'INSERT INTO {name} (Indexx, FileID, FileIndex, ID1, Unk1, Size, CompressedSize, Hash, Offset, CompressType, ArchiveIndex, Unk2) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);',
-              entries)
-    con.commit()
-    print(f"Added {len(entries)} entries to MNF db")
+    if patch:
+        name += "_" + "".join(x if x.isalnum() else "_" for x in patch)
+    return name
 
 
-def save_zosft_table(file_table, b_is_eso):
-    con = sq.connect(f'ZOSFT.db')
+MNF_COLUMNS = ["Indexx", "FileID", "FileIndex", "ID1", "Unk1", "Size", "CompressedSize", "Hash", "Offset", "CompressType", "ArchiveIndex", "Unk2", "FileName"]
+MNF_SCHEMA = "(Indexx INTEGER, FileID INTEGER, FileIndex INTEGER, ID1 INTEGER, Unk1 INTEGER, Size INTEGER, CompressedSize INTEGER, Hash INTEGER, Offset INTEGER, CompressType INTEGER, ArchiveIndex INTEGER, Unk2 INTEGER, FileName TEXT)"
+MNF_INDEXES = ["FileID", "Hash", "FileIndex", "ArchiveIndex"]
+
+
+def to_sql_id(file_id):
+    # FileID is a uint64, SQLite integers are signed
+    if file_id >= 1 << 63:
+        return file_id - (1 << 64)
+    return file_id
+
+
+def from_sql_id(file_id):
+    if file_id < 0:
+        return file_id + (1 << 64)
+    return file_id
+
+
+def connect():
+    con = sq.connect(f'MNF.db')
+    con.execute('PRAGMA journal_mode=WAL')
+    con.execute('PRAGMA synchronous=NORMAL')
+    return con
+
+
+def save_mnf_table(file_table, b_is_eso, patch=None):
+    """
+    Saves the table as eso/game, or as its own eso_<patch>/game_<patch> snapshot when a patch is given.
+    FileName is the linked ZOSFT name, empty for entries without one.
+    """
+    con = connect()
+    name = mnf_table_name(b_is_eso, patch)
+    columns = [file_table.column(x) for x in ["Index", "FileID", "FileIndex", "ID1", "Unk1", "Size", "CompressedSize", "Hash", "Offset", "CompressType", "ArchiveIndex", "Unk2"]]
+    columns[1] = columns[1].astype(np.int64)
+    columns = [x.tolist() for x in columns]
+    columns.append(file_table.file_names())
+    entries = zip(*columns)
+    with con:
+        con.execute(f'DROP TABLE IF EXISTS {name}')
+        con.execute(f'CREATE TABLE {name} {MNF_SCHEMA}')
+        con.executemany(f'INSERT INTO {name} ({", ".join(MNF_COLUMNS)}) VALUES({", ".join("?" * len(MNF_COLUMNS))});', entries)
+        # Indexes after the bulk insert, building them once is far cheaper than keeping them updated per row
+        for column in MNF_INDEXES:
+            con.execute(f'CREATE INDEX {name}_{column} ON {name} ({column})')
+    con.close()
+    print(f"Added {len(file_table)} entries to MNF db")
+
+
+def old_file_id(file_id):
+    # Tables saved before FileID was an INTEGER column hold it as the little-endian bytes in upper case hex
+    return to_sql_id(int.from_bytes(bytes.fromhex(file_id), "little"))
+
+
+def upgrade_mnf_table(con, name):
+    """
+    Rewrites a snapshot that still stores FileID as hex TEXT in the current layout, since those ids never equal
+    the INTEGER ones. Returns whether it had to. Tables older than the patch snapshots themselves are refused.
+    """
+    columns = [x[1] for x in con.execute(f'PRAGMA table_info({name})')]
+    if not columns:
+        raise Exception(f"No MNF table {name} in MNF.db")
+    if "FileName" not in columns:
+        raise Exception(f"MNF table {name} predates patch snapshots, save it again with save_mnf_table")
+    kind = con.execute(f'SELECT typeof(FileID) FROM {name} LIMIT 1').fetchone()
+    if kind is None or kind[0] != "text":
+        return False
+    con.create_function("old_file_id", 1, old_file_id, deterministic=True)
+    with con:
+        con.execute(f'ALTER TABLE {name} RENAME TO {name}_text')
+        con.execute(f'CREATE TABLE {name} {MNF_SCHEMA}')
+        select = ", ".join("old_file_id(FileID)" if x == "FileID" else x for x in MNF_COLUMNS)
+        con.execute(f'INSERT INTO {name} ({", ".join(MNF_COLUMNS)}) SELECT {select} FROM {name}_text')
+        # Dropping the old table first frees its index names
+        con.execute(f'DROP TABLE {name}_text')
+        for column in MNF_INDEXES:
+            con.execute(f'CREATE INDEX {name}_{column} ON {name} ({column})')
+    print(f"Upgraded MNF table {name} to integer FileIDs")
+    return True
+
+
+def diff_mnf_tables(b_is_eso, old_patch, new_patch):
+    """
+    Compares two patch snapshots by FileID.
+    Returns the new Indexx of added entries, the old (ArchiveIndex, Indexx, FileName) of removed entries,
+    and (new Indexx, old ArchiveIndex, old Indexx, old FileName) for changed ones.
+    FileIDs aren't unique, entries sharing one are paired in Indexx order, so every entry is matched at most once.
+    Unnamed entries count as changed when they move, since their output name comes from ArchiveIndex and Indexx.
+    Snapshots with the old TEXT FileIDs are upgraded first.
+    """
+    con = connect()
     c = con.cursor()
-    if b_is_eso:
-        name = "eso"
-    else:
-        name = "game"
-    c.execute(f'DROP TABLE IF EXISTS {name}')
-    entries = [(x.FileIndex, x.FileName, x.FilenameOffset, x.FileID, x.UserData, x.Index, x.Index11, x.Index13, x.Index21) for x in file_table]
-    c.execute(f'CREATE TABLE IF NOT EXISTS {name} (FileIndex INTEGER, FileName TEXT, FilenameOffset INTEGER, FileID INTEGER, UserData INTEGER, Indexx INTEGER, Index11 INTEGER, Index13 INTEGER, Index21 INTEGER)')
-    c.executemany(f'INSERT INTO {name} (FileIndex, FileName, FilenameOffset, FileID, UserData, Indexx, Index11, Index13, Index21) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?);',
-              entries)
-    con.commit()
-    print(f"Added {len(entries)} entries to ZOSFT db")
+    old = mnf_table_name(b_is_eso, old_patch)
+    new = mnf_table_name(b_is_eso, new_patch)
+    for name in (old, new):
+        upgrade_mnf_table(con, name)
+    for alias, name in (("o", old), ("n", new)):
+        c.execute(f'CREATE TEMP TABLE diff_{alias} AS SELECT Indexx, FileID, Hash, Size, FileName, ArchiveIndex, '
+                  f'ROW_NUMBER() OVER (PARTITION BY FileID ORDER BY Indexx) AS Dup FROM {name}')
+        c.execute(f'CREATE INDEX temp.diff_{alias}_FileID ON diff_{alias} (FileID, Dup)')
+    c.execute('SELECT n.Indexx FROM diff_n n LEFT JOIN diff_o o ON n.FileID = o.FileID AND n.Dup = o.Dup WHERE o.FileID IS NULL')
+    added = [x[0] for x in c.fetchall()]
+    c.execute('SELECT o.ArchiveIndex, o.Indexx, o.FileName FROM diff_o o LEFT JOIN diff_n n ON n.FileID = o.FileID AND n.Dup = o.Dup '
+              'WHERE n.FileID IS NULL')
+    removed = c.fetchall()
+    c.execute('SELECT n.Indexx, o.ArchiveIndex, o.Indexx, o.FileName FROM diff_n n JOIN diff_o o ON n.FileID = o.FileID AND n.Dup = o.Dup '
+              'WHERE n.Hash != o.Hash OR n.Size != o.Size OR n.FileName != o.FileName '
+              "OR (n.FileName = '' AND (n.Indexx != o.Indexx OR n.ArchiveIndex != o.ArchiveIndex))")
+    changed = c.fetchall()
+    con.close()
+    return added, removed, changed
+
+
+def save_zosft_table(file_table, b_is_eso):
+    """
+    ZOSFT names live next to the MNF table as eso_zosft/game_zosft so the two can be joined on FileIndex.
+    """
+    con = connect()
+    name = mnf_table_name(b_is_eso) + "_zosft"
+    columns = [file_table.column(x).tolist() for x in ["FileIndex", "FilenameOffset", "FileID", "UserData", "Index", "Index11", "Index13", "Index21"]]
+    for x in columns[:3]:
+        x[file_table.named_count:] = [None] * (len(x) - file_table.named_count)
+    columns.insert(1, file_table.names())
+    entries = zip(*columns)
+    with con:
+        con.execute(f'DROP TABLE IF EXISTS {name}')
+        con.execute(f'CREATE TABLE {name} (FileIndex INTEGER, FileName TEXT, FilenameOffset INTEGER, FileID INTEGER, UserData INTEGER, Indexx INTEGER, Index11 INTEGER, Index13 INTEGER, Index21 INTEGER)')
+        con.executemany(f'INSERT INTO {name} (FileIndex, FileName, FilenameOffset, FileID, UserData, Indexx, Index11, Index13, Index21) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?);',
+                        entries)
+        con.execute(f'CREATE INDEX {name}_FileIndex ON {name} (FileIndex)')
+    con.close()
+    print(f"Added {len(file_table)} entries to ZOSFT db")
 
 
 def start_mnf_connection():
     global mnfcon
     global mnfc
-    mnfcon = sq.connect(f'MNF.db')
+    mnfcon = connect()
     mnfc = mnfcon.cursor()
 
 
@@ -50,4 +162,65 @@ def get_entries_from_mnf(column_select='*'):
     global mnfc
     mnfc.execute("SELECT " + column_select + " from eso")
     rows = mnfc.fetchall()
-    return rows
\ No newline at end of file
+    return rows
+
+
+def lookup(file_id, column_select='*', b_is_eso=True):
+    """
+    One entry by FileID through the FileID index, or None.
+    """
+    global mnfc
+    mnfc.execute(f"SELECT {column_select} FROM {mnf_table_name(b_is_eso)} WHERE FileID = ?", (to_sql_id(file_id),))
+    return mnfc.fetchone()
+
+
+def lookup_many(file_ids, column_select='*', b_is_eso=True, batch_size=900):
+    """
+    Entries for many FileIDs at once as {FileID: row}, missing ids are left out.
+    Goes through the FileID index in batches that stay under SQLite's bound parameter limit.
+    """
+    global mnfc
+    name = mnf_table_name(b_is_eso)
+    file_ids = sorted(set(to_sql_id(x) for x in file_ids))
+    rows = {}
+    for start in range(0, len(file_ids), batch_size):
+        batch = file_ids[start:start+batch_size]
+        mnfc.execute(f"SELECT FileID, {column_select} FROM {name} WHERE FileID IN ({', '.join('?' * len(batch))})", batch)
+        for row in mnfc.fetchall():
+            rows[from_sql_id(row[0])] = row[1:]
+    return rows
+
+
+def lookup_names(file_indices, b_is_eso=True, batch_size=900):
+    """
+    ZOSFT FileName for each FileIndex as {FileIndex: FileName}.
+    """
+    global mnfc
+    name = mnf_table_name(b_is_eso) + "_zosft"
+    file_indices = sorted(set(file_indices))
+    names = {}
+    for start in range(0, len(file_indices), batch_size):
+        batch = file_indices[start:start+batch_size]
+        mnfc.execute(f"SELECT FileIndex, FileName FROM {name} WHERE FileIndex IN ({', '.join('?' * len(batch))})", batch)
+        names.update(mnfc.fetchall())
+    return names
+
+
+def lookup_names_by_id(file_ids, b_is_eso=True, batch_size=900):
+    """
+    ZOSFT FileName for each FileID as {FileID: FileName}, in one query joining the MNF table to its ZOSFT table.
+    Matches game_mnf.link_to_zosft: the last ZOSFT row of a FileIndex wins and eso.mnf entries with Unk1 set have no name.
+    Both sides go through their indexes, FileID on the MNF table and FileIndex on the ZOSFT one.
+    """
+    global mnfc
+    name = mnf_table_name(b_is_eso)
+    file_ids = sorted(set(to_sql_id(x) for x in file_ids))
+    names = {}
+    for start in range(0, len(file_ids), batch_size):
+        batch = file_ids[start:start+batch_size]
+        mnfc.execute(f"SELECT m.FileID, z.FileName FROM {name} m JOIN {name}_zosft z "
+                     f"ON z.rowid = (SELECT MAX(rowid) FROM {name}_zosft WHERE FileIndex = m.FileIndex) "
+                     f"WHERE m.FileID IN ({', '.join('?' * len(batch))})" + (" AND m.Unk1 = 0" if b_is_eso else ""), batch)
+        for file_id, file_name in mnfc.fetchall():
+            names[from_sql_id(file_id)] = file_name
+    return names
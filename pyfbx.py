@@ -1,4 +1,5 @@
 import fbx
+import numpy as np
 import sys
 
 class Model:
@@ -59,10 +60,10 @@ class Model:
 
     def create_mesh(self, submesh):
         mesh = fbx.FbxMesh.Create(self.scene, submesh.name)
-        controlpoints = [fbx.FbxVector4(-x[0]*100, x[2]*100, x[1]*100) for x in submesh.vert_pos]
+        controlpoints = [fbx.FbxVector4(-x[0]*100, x[2]*100, x[1]*100) for x in np.asarray(submesh.vert_pos).tolist()]
         for i, p in enumerate(controlpoints):
             mesh.SetControlPointAt(p, i)
-        for face in submesh.faces:
+        for face in np.asarray(submesh.faces).tolist():
             mesh.BeginPolygon()
             mesh.AddPolygon(face[0])
             mesh.AddPolygon(face[1])
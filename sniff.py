@@ -0,0 +1,175 @@
+import decompression
+import gf
+import zlib
+
+"""
+Table-driven file type sniffing on the first HEAD_SIZE decompressed bytes of an entry.
+The tail of the file is only produced when no earlier rule matched on the head and a tail rule has to decide.
+"""
+
+HEAD_SIZE = 64
+TAIL_SIZE = 8
+
+# In priority order: extension, head rules as (offset, magic), tail rules as (a, b, magic) for data[len-a:len-b]
+MAGIC_RULES = [
+    ("dds", [(0, b"DDS")], []),
+    ("ttf", [(0, b"\x00\x01\x00\x00\x00\x0E\x00\x80"), (0, b"OTTO"), (11, b"POS/2")], []),
+    ("hk", [(0, b"\x1E\x0D\x0B\xCD\xCE\xFA\x11")], []),
+    ("gr2", [(0, b"\x29\xDE\x6C\xC0"), (0, b"\xE5\x9B\x49\x5E"), (0, b"\x29\x75\x31\x82"), (0, b"\x0E\x11\x95\xB5"),
+             (0, b"\x0E\x74\xA2\x0A"), (0, b"\xE5\x2F\x4A\xE1"), (0, b"\x31\x95\xD4\xE3"), (0, b"\x31\xC2\x4E\x7C")], []),
+    ("hkx", [(0, b"\x1E\x0D\xB0\xCA")], []),
+    ("EsoFileData", [(0, b"\xFA\xFA\xEB\xEB")], []),
+    ("EsoIdData", [(0, b"\xFB\xFB\xEC\xEC"), (0, b"\x00\x00\x00\x02")], []),
+    ("txt", [(0, b"\xEF\xBB\xBF")], []),
+    ("xv4", [(0, b"xV4")], []),
+    ("ffx", [(0, b"__ffx")], []),
+    ("riff", [(0, b"RIFF")], []),
+    ("txt", [(0, b"; ")], [(4, 0, b".lua")]),
+    ("fx", [(0, b"#"), (0, b"//"), (0, b"\r\n#"), (0, b"/*")], []),
+    ("lua", [(0, b"--"), (0, b"local"), (0, b"function")], []),
+    ("xml", [(0, b"<")], []),
+    ("zosft", [(0, b"ZOSFT")], []),
+    ("lua", [], [(5, 2, b"end"), (3, 0, b"end"), (7, 4, b"end"), (2, 0, b"\r")]),
+    ("bnk", [(0, b"BKHD")], []),
+]
+
+
+def classify(head, get_tail):
+    """
+    head is the first HEAD_SIZE bytes (or all of a shorter file), get_tail returns the last TAIL_SIZE bytes.
+    get_tail is only called when a tail rule is reached before any head rule matched.
+    """
+    tail = None
+    for extension, head_rules, tail_rules in MAGIC_RULES:
+        for offset, magic in head_rules:
+            if head[offset:offset+len(magic)] == magic:
+                return extension
+        if tail_rules:
+            if tail is None:
+                tail = get_tail()
+            for a, b, magic in tail_rules:
+                if tail[len(tail)-a:len(tail)-b] == magic:
+                    return extension
+    return "bin"
+
+
+def guess_extension(data):
+    return classify(data[:HEAD_SIZE], lambda: data[-TAIL_SIZE:])
+
+
+class DecompressedStream:
+    """
+    Lazily decompressed view of one entry. zlib entries are inflated only as far as asked,
+    everything else is decompressed in one go on first use.
+    Game entries pick their codec by magic like read_game_data_file and extract_entry, the rest by CompressType.
+    """
+
+    def __init__(self, entry, raw_data, b_game=False):
+        self.entry = entry
+        self.raw_data = raw_data
+        if b_game:
+            self.codec = decompression.codec_for_magic(raw_data)
+        else:
+            self.codec = decompression.codec_for_entry(entry.CompressType, raw_data)
+        self.data = b""
+        self.eof = False
+        self.inflater = None
+        self.pending = b""
+        self.position = 0
+        self.length = None
+        self.tail_data = None
+        if self.codec is decompression.get_codec("zlib"):
+            self.inflater = zlib.decompressobj()
+            self.raw_data = memoryview(raw_data)
+        elif self.codec is decompression.get_codec("raw"):
+            self.data = raw_data
+            self.eof = True
+            self.length = len(raw_data)
+
+    def inflate(self, max_length):
+        """
+        Next piece of at most max_length bytes, or b"" at the end. Input goes in by slices so
+        unconsumed_tail never copies the whole payload. Raises zlib.error if the payload ends before the stream.
+        """
+        while not self.pending and self.position < len(self.raw_data) and not self.inflater.eof:
+            self.pending = self.raw_data[self.position:self.position+decompression.stream_chunk_size]
+            self.position += len(self.pending)
+        if not self.pending:
+            if self.inflater.eof:
+                return b""
+            # All input is in, flush gives whatever zlib still holds and a stream that hasn't ended was cut off
+            data = self.inflater.flush()
+            if not self.inflater.eof:
+                raise zlib.error("Error -5 while decompressing data: incomplete or truncated stream")
+            return data
+        data = self.inflater.decompress(self.pending, max_length)
+        self.pending = self.inflater.unconsumed_tail
+        return data
+
+    def inflating(self):
+        # Until the stream itself ends, running out of input is an error for inflate to raise
+        return bool(self.pending) or not self.inflater.eof
+
+    def prefix(self, n):
+        if len(self.data) < n and not self.eof:
+            if self.inflater:
+                chunks = [self.data]
+                have = len(self.data)
+                while have < n and self.inflating():
+                    chunk = self.inflate(n - have)
+                    chunks.append(chunk)
+                    have += len(chunk)
+                self.data = b"".join(chunks)
+                self.eof = not self.inflating()
+                if self.eof:
+                    self.length = len(self.data)
+            else:
+                self.data = bytes(self.codec.decompress(self.raw_data, self.entry.Size))
+                self.eof = True
+                self.length = len(self.data)
+        return self.data[:n]
+
+    def tail(self, n):
+        """
+        The last n bytes. For zlib this inflates the rest in chunks, keeping only a tail window in memory.
+        """
+        if self.eof:
+            return self.data[-n:]
+        if self.tail_data is None:
+            # Only the prefix stays in self.data, the rest is inflated and dropped
+            window = self.data
+            length = len(self.data)
+            while self.inflating():
+                chunk = self.inflate(decompression.stream_chunk_size)
+                length += len(chunk)
+                window = (window + chunk[-n:])[-n:]
+            self.tail_data = window
+            self.length = length
+        return self.tail_data[-n:]
+
+
+def sniff_entry(entry, archive_set, b_game=False):
+    """
+    The extension of one entry, without decompressing more of it than the rules need.
+    Returns None if the entry can't be read.
+    """
+    raw_data = archive_set.read_entry(entry)
+    if raw_data is None:
+        return None
+    stream = DecompressedStream(entry, raw_data, b_game)
+    if stream.codec is None:
+        return None
+    start = 0
+    if b_game and stream.prefix(5) != b"ZOSFT":
+        # Game entries carry a header in front of the real file, see read_game_data_file
+        header_offset1 = gf.get_uint16(stream.prefix(8), 6, le=False) + 8
+        start = gf.get_uint32(stream.prefix(header_offset1 + 4), header_offset1, le=False) + 4 + header_offset1
+    head = stream.prefix(start + HEAD_SIZE)[start:]
+    if not head:
+        return None
+
+    def get_tail():
+        tail = stream.tail(TAIL_SIZE)
+        # A file shorter than the tail window must not see the header in front of it
+        return tail[max(len(tail) - (stream.length - start), 0):]
+    return classify(head, get_tail)
@@ -0,0 +1,327 @@
+import argparse
+import game_mnf
+import gf
+import gr2_structs
+import numpy as np
+import os
+import struct
+import zlib
+
+"""
+Structurally valid synthetic ESO data for benchmarks: an eso.mnf (MES2, block 3) with its ZOSFT and .dat archives,
+ESO GR2 v7 models and map placement files, at any scale and without a game install.
+
+    python synth.py synthetic --count 100000 --models 300 --maps 4 --placements 5000
+"""
+
+ZOSFT_FILE_INDEX = 0x00FFFFFF
+MAP_RECORD_SIZE = 0x60
+# Vertex strides seen in game models
+VERTEX_STRIDES = (32, 36, 40, 44, 48, 60, 68)
+# Heads of the loose assets, so the sniffer sees a realistic mix of types
+ASSET_HEADS = [("dds", b"DDS |\0\0\0"), ("riff", b"RIFF\0\0\0\0WAVE"), ("lua", b"-- generated\n"), ("xml", b"<GuiXml>"),
+               ("txt", b"\xEF\xBB\xBF"), ("bnk", b"BKHD")]
+
+
+def make_block3(count, seed=0):
+    """
+    An in-memory MNF block 3 of count random entries, for parsing benchmarks.
+    """
+    rng = np.random.default_rng(seed)
+    block3 = game_mnf.MnfBlock()
+    block3.type = 3
+    block3.record1a_count = count
+    block3.record1b_count = count
+    block3.record23_count = count
+
+    # Every entry gets one 0x80 record, some are preceded by continuation records
+    continuations = rng.integers(0, 3, count)
+    block1 = np.zeros(count + int(continuations.sum()), dtype="<u4")
+    marker_positions = np.arange(count) + np.cumsum(continuations)
+    block1[:] = rng.integers(0, 0x00FFFFFF, len(block1))
+    block1[marker_positions] |= 0x80000000
+    block3.data.append(block1.tobytes())
+
+    block2 = np.zeros(count, dtype=game_mnf.MNF_BLOCK2_DTYPE)
+    block2["FileIndex"] = rng.permutation(count)
+    block2["Unk1"] = rng.integers(0, 2, count)
+    block3.data.append(block2.tobytes())
+
+    records = np.zeros(count, dtype=game_mnf.MNF_BLOCK3_DTYPE)
+    records["Size"] = rng.integers(16, 1 << 20, count)
+    records["CompressedSize"] = records["Size"] // 2
+    records["Hash"] = rng.integers(0, 0xFFFFFFFF, count, dtype=np.uint32)
+    records["Offset"] = rng.integers(0, 0x7FFFFFFF, count)
+    records["ArchiveIndex"] = rng.integers(0, 40, count)
+    records["CompressType"] = rng.integers(0, 3, count)
+    block3.data.append(records.tobytes())
+    return block3
+
+
+def pack_zosft_block(streams, record_count):
+    block = struct.pack("<HIIII", 3, 0, record_count, record_count, record_count)
+    for data in streams:
+        comp_data = zlib.compress(data)
+        block += struct.pack("<II", len(data), len(comp_data)) + comp_data
+    return block
+
+
+def make_zosft(names, file_indices, seed=0):
+    """
+    A ZOSFT naming file_indices[i] names[i].
+    """
+    rng = np.random.default_rng(seed)
+    count = len(names)
+    name_blob = b"\0".join(x.encode() for x in names) + b"\0"
+    name_offsets = np.cumsum([0] + [len(x) + 1 for x in names[:-1]])
+
+    ids = rng.integers(0, 0x00FFFFFF, count, dtype=np.uint32) | np.uint32(0x80000000)
+    block0 = pack_zosft_block([ids.tobytes(), b"", np.arange(count, dtype="<u4").tobytes()], count)
+    file_records = np.zeros(count, dtype=game_mnf.ZOSFT_RECORD_DTYPE)
+    file_records["FileIndex"] = file_indices
+    file_records["FilenameOffset"] = name_offsets
+    file_records["FileID"] = rng.integers(0, 0xFFFFFFFF, count, dtype=np.uint32)
+    block1 = pack_zosft_block([ids.tobytes(), b"", file_records.tobytes()], count)
+    empty_block = struct.pack("<HIIII", 3, 0, 0, 0, 0)
+
+    header = b"ZOSFT".ljust(0xF, b"\0") + struct.pack("<I", count)
+    return header + block0 + block1 + empty_block + struct.pack("<I", len(name_blob)) + name_blob
+
+
+def make_random_zosft(count, seed=0):
+    rng = np.random.default_rng(seed)
+    folders = ["art/fx/texture", "art/models/architecture/dwemer", "esoui/art/icons", "art/maps/tamriel", "sounds/ambient"]
+    names = [f"{folders[i % len(folders)]}/asset_{i}_{rng.integers(1 << 30)}.{['dds', 'gr2', 'xml', 'lua'][i % 4]}" for i in range(count)]
+    return make_zosft(names, rng.permutation(count), seed)
+
+
+def write_mnf(directory, payloads, file_indices, archive_count=4, seed=0, name="eso"):
+    """
+    Writes {name}.mnf and its {name}000N.dat archives. payloads[i] is stored zlib compressed (CompressType 1)
+    under FileIndex file_indices[i], spread over the archives. Returns the MNF_BLOCK3_DTYPE records.
+    """
+    rng = np.random.default_rng(seed)
+    count = len(payloads)
+    records = np.zeros(count, dtype=game_mnf.MNF_BLOCK3_DTYPE)
+    records["ArchiveIndex"] = rng.integers(0, archive_count, count)
+    archives = [open(f"{directory}/{name}{gf.fill_hex_with_zeros(str(i), 4)}.dat", "wb") for i in range(archive_count)]
+    offsets = [0] * archive_count
+    try:
+        for i, payload in enumerate(payloads):
+            archive_index = int(records["ArchiveIndex"][i])
+            comp_data = zlib.compress(payload, 6)
+            archives[archive_index].write(comp_data)
+            records[i]["Size"] = len(payload)
+            records[i]["CompressedSize"] = len(comp_data)
+            records[i]["Hash"] = zlib.crc32(payload)
+            records[i]["Offset"] = offsets[archive_index]
+            records[i]["CompressType"] = 1
+            offsets[archive_index] += len(comp_data)
+    finally:
+        for f in archives:
+            f.close()
+
+    block1 = (np.arange(count, dtype="<u4") | np.uint32(0x80000000)).tobytes()
+    block2 = np.zeros(count, dtype=game_mnf.MNF_BLOCK2_DTYPE)
+    block2["FileIndex"] = file_indices
+    out = b"MES2" + struct.pack("<HH", 3, archive_count) + b"\0\0" * archive_count
+    out += b"\0" * 4 + struct.pack("<I", 0) + struct.pack(">H", 3)
+    out += struct.pack("<I", 0) + struct.pack(">III", count, count, count)
+    for data in (block1, block2.tobytes(), records.tobytes()):
+        comp_data = zlib.compress(data)
+        out += struct.pack(">II", len(data), len(comp_data)) + comp_data
+    with open(f"{directory}/{name}.mnf", "wb") as f:
+        f.write(out)
+    return records
+
+
+def make_asset(rng, size):
+    extension, head = ASSET_HEADS[int(rng.integers(len(ASSET_HEADS)))]
+    # Half random, half zeros, so zlib has something to do without the data being trivial
+    noise = size // 2
+    return extension, head + rng.bytes(noise) + b"\0" * max(size - noise - len(head), 0)
+
+
+def make_gr2(rng, mesh_count=1, vertex_count=1000, submesh_count=2, tri_count=1500, vertex_stride=32):
+    """
+    An ESO GR2 v7 laid out the way GR2.find_and_read_index_header expects:
+    section 0 holds the structs the relocations point at, section 1 the vertices of every mesh
+    (its marshalls count the meshes), section 2 the indices, sections 3-7 are empty.
+    """
+    index_stride = 2 if vertex_count <= 0xFFFF else 4
+    index_dtype = "<u2" if index_stride == 2 else "<u4"
+
+    vertices = []
+    indices = []
+    submeshes = []
+    for k in range(mesh_count):
+        vertex_data = np.frombuffer(rng.bytes(vertex_count * vertex_stride), dtype=np.uint8).reshape(vertex_count, vertex_stride).copy()
+        positions = rng.uniform(-10, 10, (vertex_count, 3)).astype("<f4")
+        # The mesh search wants a non-zero first word at the vertex data
+        positions[0, 0] = 1.0
+        vertex_data[:, :12] = positions.view(np.uint8).reshape(vertex_count, 12)
+        vertices.append(vertex_data.tobytes())
+
+        mesh_submeshes = []
+        mesh_indices = []
+        bounds = np.linspace(0, vertex_count, submesh_count + 1).astype(int)
+        tri_bounds = np.linspace(0, tri_count, submesh_count + 1).astype(int)
+        for j in range(submesh_count):
+            first, last = bounds[j], max(bounds[j+1], bounds[j] + 1)
+            count = tri_bounds[j+1] - tri_bounds[j]
+            mesh_indices.append(rng.integers(first, min(last, vertex_count), count * 3))
+            mesh_submeshes.append((j, tri_bounds[j], count))
+        indices.append(np.concatenate(mesh_indices).astype(index_dtype).tobytes())
+        submeshes.append(mesh_submeshes)
+
+    # Section 0: type 10 marker, per mesh a vertex count struct, part definitions and an index count struct
+    section0 = bytearray(struct.pack("<IIII", 10, 0, 0, 0))
+    count_offsets = []
+    for k in range(mesh_count):
+        count_offsets.append(len(section0))
+        section0 += struct.pack("<IIII", 0, 0, vertex_count, 0)
+    part_offsets = []
+    for k in range(mesh_count):
+        part_offsets.append(len(section0))
+        for material_index, tri_offset, count in submeshes[k]:
+            section0 += struct.pack("<III", material_index, tri_offset, count)
+    index_struct_offsets = []
+    for k in range(mesh_count):
+        index_struct_offsets.append(len(section0))
+        section0 += struct.pack("<IIII", submesh_count, 0, 0, tri_count * 3)
+
+    vertex_offsets = np.cumsum([0] + [len(x) for x in vertices[:-1]]).tolist()
+    index_offsets = np.cumsum([0] + [len(x) for x in indices[:-1]]).tolist()
+    # [type 10, vertices, vertex count] per mesh, an empty one, [parts, indices, index count] per mesh, an empty one
+    targets = []
+    for k in range(mesh_count):
+        targets += [(0, 0), (1, vertex_offsets[k]), (0, count_offsets[k])]
+    targets.append((0, 0))
+    for k in range(mesh_count):
+        targets += [(0, part_offsets[k]), (2, index_offsets[k]), (0, index_struct_offsets[k])]
+    targets.append((0, 0))
+    relocations = np.zeros(len(targets), dtype=gr2_structs.RELOCATION_DTYPE)
+    relocations["offset_in_section"] = np.arange(len(targets)) * 8
+    relocations["section_ref"] = [x[0] for x in targets]
+    relocations["section_ref_offset"] = [x[1] for x in targets]
+    marshalls = np.zeros(mesh_count, dtype=gr2_structs.MARSHALL_DTYPE)
+    marshalls["count"] = vertex_count
+    marshalls["offset_in_section"] = vertex_offsets
+    marshalls["sector_ref"] = 1
+    marshalls["section_ref_offset"] = vertex_offsets
+
+    header_size = gr2_structs.SECTION_OFFSET + gr2_structs.SECTION_COUNT * gr2_structs.SECTION_DTYPE.itemsize
+    section_data = [bytes(section0), b"".join(vertices), b"".join(indices)]
+    sections = np.zeros(gr2_structs.SECTION_COUNT, dtype=gr2_structs.SECTION_DTYPE)
+    offset = header_size
+    for i in range(gr2_structs.SECTION_COUNT):
+        length = len(section_data[i]) if i < len(section_data) else 0
+        sections[i]["offset"] = offset
+        sections[i]["decomp_length"] = length
+        sections[i]["comp_length"] = length
+        sections[i]["alignment"] = 4
+        offset += length
+    sections[0]["relocations_offset"] = offset
+    sections[0]["relocations_count"] = len(relocations)
+    offset += relocations.nbytes
+    sections[1]["marshalling_offset"] = offset
+    sections[1]["marshalling_count"] = mesh_count
+    for i in range(gr2_structs.SECTION_COUNT):
+        if not sections[i]["relocations_offset"]:
+            sections[i]["relocations_offset"] = offset
+        if not sections[i]["marshalling_offset"]:
+            sections[i]["marshalling_offset"] = offset
+    total_size = offset + marshalls.nbytes
+
+    body = b"".join(section_data) + relocations.tobytes() + marshalls.tobytes()
+    header = struct.pack("<I", gr2_structs.GR2_MAGIC).ljust(0x20, b"\0")
+    header += struct.pack("<IIIIIII", 7, total_size, zlib.crc32(body), header_size, gr2_structs.SECTION_COUNT, 6, 0)
+    header = header.ljust(gr2_structs.SECTION_OFFSET, b"\0") + sections.tobytes()
+    return header + body
+
+
+def make_map(rng, refs, placements):
+    """
+    A map placement file with placements records, each a random rotation and position and one of refs.
+    """
+    records = np.zeros((placements, MAP_RECORD_SIZE), dtype=np.uint8)
+    rotations = rng.uniform(-np.pi, np.pi, (placements, 3)).astype("<f4")
+    positions = rng.uniform(-5000, 5000, (placements, 3)).astype("<f4")
+    model_refs = np.array(refs, dtype="<u8")[rng.integers(0, len(refs), placements)]
+    records[:, 0x10:0x1C] = rotations.view(np.uint8).reshape(placements, 12)
+    records[:, 0x1C:0x28] = positions.view(np.uint8).reshape(placements, 12)
+    records[:, 0x44:0x4C] = model_refs.view(np.uint8).reshape(placements, 8)
+    return struct.pack("<II", 0, placements) + records.tobytes()
+
+
+def generate(directory, count=10000, archive_count=4, models=50, maps=2, placements=2000, named_fraction=0.5,
+             asset_size=(256, 64 * 1024), vertex_count=1000, tri_count=1500, seed=0):
+    """
+    Writes a synthetic depot to directory: eso.mnf, eso000N.dat and nothing else.
+    count loose assets are mixed with models GR2s and maps placement files, with named_fraction of the assets named
+    in the ZOSFT. Models and maps stay unnamed, map_extraction finds them by the ArchiveIndex/Index output path.
+    Returns {"mnf": path, "models": [table rows], "maps": [table rows], "model_ids": [FileIDs]}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    payloads = []
+    names = []
+    kinds = []
+    for i in range(count):
+        extension, payload = make_asset(rng, int(rng.integers(*asset_size)))
+        payloads.append(payload)
+        names.append(f"art/synthetic/{i % 97:02}/asset_{i}.{extension}" if rng.random() < named_fraction else "")
+        kinds.append("asset")
+    for i in range(models):
+        stride = VERTEX_STRIDES[int(rng.integers(len(VERTEX_STRIDES)))]
+        payloads.append(make_gr2(rng, int(rng.integers(1, 3)), vertex_count, int(rng.integers(1, 4)), tri_count, stride))
+        names.append("")
+        kinds.append("model")
+
+    # FileIndex is the row, so every entry has FileID == its row and the maps can refer to models up front
+    model_rows = [i for i, kind in enumerate(kinds) if kind == "model"]
+    map_rows = []
+    for i in range(maps):
+        if model_rows:
+            payloads.append(make_map(rng, model_rows, placements))
+            map_rows.append(len(payloads) - 1)
+            names.append("")
+            kinds.append("map")
+    # Shuffle so archives mix every kind of file, then append the ZOSFT last
+    order = rng.permutation(len(payloads))
+    file_indices = np.zeros(len(payloads) + 1, dtype="<u4")
+    file_indices[:len(payloads)] = order
+    payloads = [payloads[i] for i in order]
+    names = [names[i] for i in order]
+    named = [i for i, x in enumerate(names) if x]
+    zosft = make_zosft([names[i] for i in named], file_indices[named], seed)
+    payloads.append(zosft)
+    file_indices[-1] = ZOSFT_FILE_INDEX
+    write_mnf(directory, payloads, file_indices, archive_count, seed)
+
+    rows = np.argsort(file_indices[:-1])
+    return {
+        "mnf": f"{directory}/eso.mnf",
+        "models": [int(rows[x]) for x in model_rows],
+        "maps": [int(rows[x]) for x in map_rows],
+        "model_ids": model_rows,
+        "bytes": sum(len(x) for x in payloads),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic ESO depot for benchmarks")
+    parser.add_argument("directory")
+    parser.add_argument("--count", type=int, default=10000, help="loose assets")
+    parser.add_argument("--archives", type=int, default=4)
+    parser.add_argument("--models", type=int, default=50)
+    parser.add_argument("--maps", type=int, default=2)
+    parser.add_argument("--placements", type=int, default=2000, help="records per map")
+    parser.add_argument("--vertices", type=int, default=1000, help="vertices per GR2 mesh")
+    parser.add_argument("--triangles", type=int, default=1500, help="triangles per GR2 mesh")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    summary = generate(args.directory, args.count, args.archives, args.models, args.maps, args.placements,
+                       vertex_count=args.vertices, tri_count=args.triangles, seed=args.seed)
+    print(f"Wrote {summary['mnf']}, {args.count + len(summary['models']) + len(summary['maps'])} entries, "
+          f"{summary['bytes']/1e6:.1f}MB before compression")
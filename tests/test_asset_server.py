@@ -0,0 +1,55 @@
+import threading
+import urllib.error
+import zlib
+import pytest
+import asset_server
+import synth
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # The file table cache is written relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    depot = synth.generate(str(tmp_path / "depot"), count=40, models=1, maps=1, placements=4, vertex_count=16, tri_count=8)
+    server = asset_server.serve([depot["mnf"]], port=0, verbose=False)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield asset_server.AssetClient(f"http://127.0.0.1:{server.server_address[1]}"), server.archives["eso"]
+    server.shutdown()
+    server.server_close()
+    for archive in server.archives.values():
+        archive.close()
+
+
+def test_lookup_read_and_stats(client):
+    client, archive = client
+    names = archive.file_table.file_names()
+    row = next(i for i, name in enumerate(names) if name)
+
+    entry = client.lookup(path=names[row])
+    assert entry["index"] == archive.entry(row).Index
+    assert entry["name"] == names[row]
+    assert client.lookup(id=entry["file_id"])["index"] == entry["index"]
+    assert client.read(path=names[row]) == archive.read_row(row)
+    assert client.last_elapsed_ms is not None
+
+    with pytest.raises(FileNotFoundError):
+        client.read(path="no/such/file.dds")
+    stats = client.stats()
+    assert stats["latency"]["/lookup"]["requests"] == 2
+    assert stats["latency"]["/read"]["requests"] == 2
+    assert stats["cache"]["eso"]["blobs"] == 1
+
+
+def test_read_error_is_500(client, monkeypatch):
+    client, archive = client
+
+    def broken(row):
+        raise zlib.error("Error -3 while decompressing data")
+    monkeypatch.setattr(archive, "read_row", broken)
+    with pytest.raises(urllib.error.HTTPError) as e:
+        client.read(index=0)
+    assert e.value.code == 500
+    assert "Error -3 while decompressing data" in e.value.read().decode()
+    # The failed request still counts towards the latency stats
+    assert client.stats()["latency"]["/read"]["requests"] == 1
@@ -0,0 +1,190 @@
+import ctypes
+import shutil
+import subprocess
+import sys
+import zlib
+import pytest
+import decompression
+import sniff
+
+# Same signature as the real OodleLZ_Decompress, the "compressed" data is just every byte xored with 0x5A
+STUB_SOURCE = r"""
+#include <string.h>
+long long calls = 0;
+long long OodleLZ_Decompress(const unsigned char *src, long long src_size, unsigned char *dst, long long dst_size,
+                             int fuzz, int crc, int verbose, void *dst_base, long long dst_base_size, void *callback,
+                             void *callback_data, void *memory, long long memory_size, int thread_phase) {
+    long long i;
+    calls++;
+    if (src_size != dst_size)
+        return -1;
+    for (i = 0; i < src_size; i++)
+        dst[i] = src[i] ^ 0x5A;
+    return dst_size;
+}
+"""
+
+
+@pytest.fixture
+def oodle_stub(tmp_path, monkeypatch):
+    compiler = shutil.which("cc") or shutil.which("gcc")
+    if compiler is None or sys.platform == "win32":
+        pytest.skip("needs a C compiler to build the stub library")
+    source = tmp_path / "oodle_stub.c"
+    source.write_text(STUB_SOURCE)
+    library = tmp_path / "liboodle_stub.so"
+    subprocess.run([compiler, "-shared", "-fPIC", "-o", str(library), str(source)], check=True)
+    monkeypatch.setattr(decompression, "oodle_library_path", str(library))
+    return library
+
+
+def test_oodle_loads_once_and_decompresses_into_out(oodle_stub, monkeypatch):
+    loads = []
+    load_library = decompression.cdll.LoadLibrary
+
+    def counted(path):
+        loads.append(path)
+        return load_library(path)
+    monkeypatch.setattr(decompression.cdll, "LoadLibrary", counted)
+
+    codec = decompression.OodleCodec()
+    for i in range(5):
+        expected = bytes(range(i, i + 100))
+        payload = bytes(x ^ 0x5A for x in expected)
+        out = bytearray(len(expected))
+        data = codec.decompress(payload, len(expected), out)
+        assert bytes(out) == expected
+        # A view over the caller's buffer, not a copy
+        assert data.obj is out
+    assert loads == [str(oodle_stub)]
+    assert ctypes.c_longlong.in_dll(codec.decompressor.handle, "calls").value == 5
+    assert codec.calls == 5 and codec.bytes_out == 500
+
+    with pytest.raises(Exception, match="Oodle decompression failed"):
+        codec.decompress(b"\x00" * 10, 20, bytearray(20))
+    assert len(loads) == 1
+
+
+class Entry:
+    def __init__(self, compress_type, size):
+        self.CompressType = compress_type
+        self.Size = size
+
+
+def zlib_payload():
+    data = bytes(range(256)) * 4000 + b"-- the end\r\nend"
+    return data, zlib.compress(data)
+
+
+def test_zlib_stream_rejects_truncated_payload(monkeypatch):
+    monkeypatch.setattr(decompression, "stream_chunk_size", 4096)
+    data, payload = zlib_payload()
+    codec = decompression.get_codec("zlib")
+    chunks = []
+    assert codec.decompress_stream(payload, len(data), chunks.append) == len(data)
+    assert b"".join(chunks) == data
+    with pytest.raises(zlib.error, match="truncated"):
+        codec.decompress_stream(payload[:len(payload) // 2], len(data), chunks.append)
+
+
+def test_decompressed_stream_rejects_truncated_payload(monkeypatch):
+    monkeypatch.setattr(decompression, "stream_chunk_size", 4096)
+    data, payload = zlib_payload()
+    stream = sniff.DecompressedStream(Entry(1, len(data)), payload)
+    assert stream.prefix(16) == data[:16]
+    assert stream.tail(8) == data[-8:] and stream.length == len(data)
+
+    stream = sniff.DecompressedStream(Entry(1, len(data)), payload[:len(payload) // 2])
+    # The head is there, only reading up to the missing end fails
+    assert stream.prefix(16) == data[:16]
+    with pytest.raises(zlib.error, match="truncated"):
+        stream.tail(8)
+
+
+def varint(n):
+    out = bytearray()
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def literal(data):
+    n = len(data) - 1
+    if n < 60:
+        return bytes([n << 2]) + data
+    extra = (n.bit_length() + 7) // 8
+    return bytes([(59 + extra) << 2]) + n.to_bytes(extra, "little") + data
+
+
+def copy1(length, offset):
+    return bytes([1 | (length - 4) << 2 | (offset >> 8) << 5, offset & 0xFF])
+
+
+def copy2(length, offset):
+    return bytes([2 | (length - 1) << 2]) + offset.to_bytes(2, "little")
+
+
+def copy4(length, offset):
+    return bytes([3 | (length - 1) << 2]) + offset.to_bytes(4, "little")
+
+
+def snappy_stream(*parts):
+    """
+    Raw snappy from (literal bytes) and (copy function, length, offset) parts, with the output alongside.
+    """
+    body = b""
+    data = bytearray()
+    for part in parts:
+        if isinstance(part, bytes):
+            body += literal(part)
+            data += part
+        else:
+            make, length, offset = part
+            body += make(length, offset)
+            for _ in range(length):
+                data.append(data[-offset])
+    return varint(len(data)) + body, bytes(data)
+
+
+SNAPPY_STREAMS = {
+    "short_literal": (b"hello snappy",),
+    "literal_1_byte_length": (bytes(range(200)),),
+    "literal_2_byte_length": (bytes(range(256)) * 20,),
+    "copy1": (b"abcdefghij" * 250, (copy1, 11, 2000), (copy1, 4, 7)),
+    "copy2": (bytes(range(256)) * 300, (copy2, 64, 60000), (copy2, 1, 1)),
+    "copy4": (bytes(range(256)) * 300, (copy4, 64, 70000), (copy4, 33, 5)),
+    "overlapping_copy": (b"ab", (copy2, 40, 2), (copy1, 9, 3)),
+}
+
+
+@pytest.mark.parametrize("name", SNAPPY_STREAMS)
+def test_snappy_round_trip(name):
+    payload, data = snappy_stream(*SNAPPY_STREAMS[name])
+    assert bytes(decompression.snappy_decompress(payload)) == data
+    out = bytearray(len(data))
+    assert bytes(decompression.snappy_decompress(payload, out)) == data and bytes(out) == data
+
+
+def test_snappy_codec_falls_back_to_the_python_decoder(monkeypatch):
+    payload, data = snappy_stream(*SNAPPY_STREAMS["copy1"])
+    codec = decompression.SnappyCodec()
+    monkeypatch.setattr(codec, "load", lambda: None)
+    assert bytes(codec.decompress(payload, len(data))) == data
+    assert codec.native is None and codec.calls == 1
+
+
+@pytest.mark.parametrize("name", SNAPPY_STREAMS)
+def test_snappy_rejects_truncated_input(name):
+    payload, _ = snappy_stream(*SNAPPY_STREAMS[name])
+    for cut in range(len(payload)):
+        with pytest.raises(Exception, match="Snappy"):
+            decompression.snappy_decompress(payload[:cut])
+
+
+def test_snappy_rejects_bad_offsets_and_overruns():
+    with pytest.raises(Exception, match="offset is out of range"):
+        decompression.snappy_decompress(varint(8) + literal(b"abc") + copy1(5, 4))
+    with pytest.raises(Exception, match="past its"):
+        decompression.snappy_decompress(varint(4) + literal(b"abcdef"))
@@ -0,0 +1,73 @@
+import csv
+import pytest
+import game_mnf
+import journal
+import synth
+
+
+def test_listing_survives_a_broken_entry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    depot = synth.generate("depot", count=40, models=1, maps=1, placements=4, vertex_count=16, tri_count=8)
+    monkeypatch.setattr(game_mnf, "path", depot["mnf"])
+    file_table, _ = game_mnf.load_file_table(mnf_path=depot["mnf"])
+    # Garbage after the zlib magic of one entry
+    entry = file_table[5]
+    with open(game_mnf.get_archives().archive_path(entry.ArchiveIndex), "r+b") as f:
+        f.seek(entry.Offset + 2)
+        f.write(b"\xFF" * (entry.CompressedSize - 2))
+    game_mnf.get_archives().close()
+
+    rows = game_mnf.list_files(file_table, "list.csv")
+    game_mnf.get_archives().close()
+    assert len(rows) == len(file_table)
+    with open("list.csv", newline="") as f:
+        listed = {int(row["Index"]): row for row in csv.DictReader(f)}
+    assert listed[entry.Index]["Extension"] == "" and listed[entry.Index]["Error"] == "error"
+    assert sum(1 for row in listed.values() if row["Error"]) == 1
+
+
+def journaled(output_dir):
+    return journal.ExtractionJournal(f"{output_dir}/.extract_journal").load()
+
+
+def test_interrupted_chunk_keeps_its_journaled_entries(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    depot = synth.generate("depot", count=40, models=1, maps=1, placements=4, vertex_count=16, tri_count=8)
+    monkeypatch.setattr(game_mnf, "path", depot["mnf"])
+    file_table, _ = game_mnf.load_file_table(mnf_path=depot["mnf"])
+    output_dir = str(tmp_path / "out")
+    extract_entry = game_mnf.extract_entry
+    calls = []
+
+    def interrupted(*args):
+        if len(calls) == 10:
+            raise KeyboardInterrupt
+        calls.append(args)
+        return extract_entry(*args)
+    monkeypatch.setattr(game_mnf, "extract_entry", interrupted)
+    # Everything in one chunk, which used to be journaled only once the whole chunk was done
+    with pytest.raises(KeyboardInterrupt):
+        game_mnf.extract_files(file_table, output_dir=output_dir)
+    records = journaled(output_dir)
+    assert len(records) == 10
+    done = journal.completed_keys(journal.ExtractionJournal(f"{output_dir}/.extract_journal"), output_dir)
+    assert len(done) == 10
+
+    monkeypatch.setattr(game_mnf, "extract_entry", extract_entry)
+    files, _, _ = game_mnf.extract_files(file_table, output_dir=output_dir, resume=True)
+    assert files + 10 == len(journaled(output_dir))
+    game_mnf.get_archives().close()
+
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_pool_workers_journal_every_entry(tmp_path, monkeypatch, use_processes):
+    monkeypatch.chdir(tmp_path)
+    depot = synth.generate("depot", count=40, models=1, maps=1, placements=4, vertex_count=16, tri_count=8)
+    monkeypatch.setattr(game_mnf, "path", depot["mnf"])
+    file_table, _ = game_mnf.load_file_table(mnf_path=depot["mnf"])
+    output_dir = str(tmp_path / "out")
+    files, _, _ = game_mnf.extract_files(file_table, workers=2, use_processes=use_processes, output_dir=output_dir)
+    records = journaled(output_dir)
+    assert files and len(records) == files
+    assert len(set(x.key() for x in records)) == files
+    game_mnf.get_archives().close()
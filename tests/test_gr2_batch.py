@@ -0,0 +1,22 @@
+import csv
+import functools
+import gr2_batch
+
+
+def test_every_file_recorded_under_worker_recycling(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # One file per chunk, so every file goes to a fresh worker
+    monkeypatch.setattr(gr2_batch, "plan_chunks", functools.partial(gr2_batch.plan_chunks, chunk_files=1))
+    (tmp_path / "junk").mkdir()
+    paths = set()
+    for i in range(200):
+        (tmp_path / "junk" / f"{i:04}.gr2").write_bytes(f"junk{i}".encode())
+        paths.add(f"junk/{i:04}.gr2")
+
+    gr2_batch.convert(["junk"], "manifest.csv", fmt="obj", workers=2, max_tasks=1)
+
+    with open("manifest.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 200
+    assert set(row["Path"] for row in rows) == paths
+    assert all(row["Status"] == "skipped" and row["Reason"] == "not_eso_gr2" for row in rows)
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import manifest_cache
+
+
+def write_cache(tmp_path):
+    file_path = str(tmp_path / "table.cache")
+    arrays = {"a": np.arange(1000, dtype=np.uint32), "b": np.ones((100, 3), dtype=np.float32)}
+    manifest_cache.write_arrays(file_path, {"key": 1}, dict(arrays))
+    return file_path, arrays
+
+
+@pytest.mark.parametrize("b_mmap", [True, False])
+def test_round_trip(tmp_path, b_mmap):
+    file_path, arrays = write_cache(tmp_path)
+    meta, loaded = manifest_cache.read_arrays(file_path, b_mmap)
+    assert meta == {"key": 1}
+    for name, array in arrays.items():
+        assert np.array_equal(loaded[name], array)
+
+
+@pytest.mark.parametrize("b_mmap", [True, False])
+def test_truncated_or_corrupt_cache_reads_as_none(tmp_path, b_mmap):
+    file_path, _ = write_cache(tmp_path)
+    with open(file_path, "rb") as f:
+        data = f.read()
+    header_end = data.index(b"}}") + 2
+    # Cut inside the header, right after it and inside the last array, then a header that isn't JSON
+    for broken in [data[:20], data[:header_end], data[:len(data) - 100],
+                   data[:12] + b"\xFF" * (header_end - 12) + data[header_end:]]:
+        with open(file_path, "wb") as f:
+            f.write(broken)
+        assert manifest_cache.read_arrays(file_path, b_mmap) is None
+    assert manifest_cache.read_arrays(str(tmp_path / "missing.cache"), b_mmap) is None
@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import pytest
+import mesh_cache
+import synth
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="counts open descriptors through /proc")
+def test_disk_loads_keep_no_descriptors_open(tmp_path):
+    paths = []
+    for i in range(50):
+        file_path = tmp_path / f"{i:08}.gr2"
+        file_path.write_bytes(synth.make_gr2(np.random.default_rng(i), vertex_count=64, tri_count=32))
+        paths.append(str(file_path))
+    cache_dir = str(tmp_path / "meshes")
+    parsed = [mesh_cache.MeshCache(cache_dir).get(x) for x in paths]
+
+    fds = len(os.listdir("/proc/self/fd"))
+    cache = mesh_cache.MeshCache(cache_dir)
+    loaded = [cache.get(x) for x in paths]
+    assert cache.disk_hits == 50 and cache.parses == 0
+    assert len(os.listdir("/proc/self/fd")) <= fds
+    for a, b in zip(parsed, loaded):
+        assert np.array_equal(a.positions, b.positions)
+        assert np.array_equal(a.faces, b.faces)
+
+
+def write_models(tmp_path, count, vertex_count=64, tri_count=32):
+    paths = []
+    for i in range(count):
+        file_path = tmp_path / f"{i:08}.gr2"
+        file_path.write_bytes(synth.make_gr2(np.random.default_rng(i), vertex_count=vertex_count, tri_count=tri_count))
+        paths.append(str(file_path))
+    return paths
+
+
+def test_few_small_models_decode_without_a_pool(tmp_path, monkeypatch):
+    paths = write_models(tmp_path, 8)
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("pool started for a few small models")
+    monkeypatch.setattr(mesh_cache.mp, "Pool", no_pool)
+    models = mesh_cache.MeshCache(b_disk=False).get_many(paths, workers=4)
+    assert len(models) == 8 and all(x.failure is None for x in models.values())
+
+
+def test_pool_decodes_the_same_models(tmp_path):
+    paths = write_models(tmp_path, 8)
+    serial = mesh_cache.MeshCache(b_disk=False).get_many(paths, workers=1)
+    cache = mesh_cache.MeshCache(b_disk=False, parallel_bytes=1)
+    parallel = cache.get_many(paths, workers=2)
+    assert cache.parses == 8
+    assert serial.keys() == parallel.keys()
+    for digest, model in serial.items():
+        assert np.array_equal(model.positions, parallel[digest].positions)
+        assert np.array_equal(model.faces, parallel[digest].faces)
+
+
+def test_truncated_disk_cache_is_parsed_again(tmp_path):
+    paths = write_models(tmp_path, 1)
+    cache_dir = str(tmp_path / "meshes")
+    cache = mesh_cache.MeshCache(cache_dir)
+    parsed = cache.get(paths[0])
+    disk_path = cache.disk_path(cache.digest(paths[0]))
+    with open(disk_path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 64)
+
+    cache = mesh_cache.MeshCache(cache_dir)
+    model = cache.get(paths[0])
+    assert cache.parses == 1 and cache.disk_hits == 0
+    assert np.array_equal(model.positions, parsed.positions)
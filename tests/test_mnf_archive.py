@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+import mnf_archive
+import synth
+
+# Smallest header read_game_data_file strips: no first block, then a zero length second one
+GAME_HEADER = b"\0" * 12
+
+
+def write_game_depot(directory, name, b_zosft=True):
+    payloads = [GAME_HEADER + f"<xml>{i}</xml>".encode() for i in range(8)]
+    names = [f"data/file{i}.xml" for i in range(8)]
+    file_indices = list(range(1, 9))
+    if b_zosft:
+        payloads.append(synth.make_zosft(names, np.array(file_indices, dtype="<u4")))
+        file_indices.append(0)
+    synth.write_mnf(str(directory), payloads, np.array(file_indices, dtype="<u4"), archive_count=2, name=name)
+    return f"{directory}/{name}.mnf"
+
+
+def test_renamed_game_manifest_opens(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with mnf_archive.MnfArchive(write_game_depot(tmp_path, "client")) as archive:
+        assert archive.b_game
+        assert archive.read("data/file3.xml") == b"<xml>3</xml>"
+
+
+def test_manifest_without_zosft_is_a_clear_error(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError, match="No ZOSFT entry"):
+        mnf_archive.MnfArchive(write_game_depot(tmp_path, "client", b_zosft=False))
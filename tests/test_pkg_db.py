@@ -0,0 +1,108 @@
+import sqlite3
+import numpy as np
+import pytest
+import game_mnf
+import pkg_db
+import synth
+
+COLUMNS = ["Index", "FileID", "FileIndex", "ID1", "Unk1", "Size", "CompressedSize", "Hash", "Offset", "CompressType", "ArchiveIndex", "Unk2"]
+
+
+class Table:
+    """
+    Just the parts of game_mnf.FileTable that save_mnf_table reads.
+    """
+
+    def __init__(self, file_ids, hashes, names=None):
+        count = len(file_ids)
+        self.columns = {x: np.zeros(count, dtype=np.int64) for x in COLUMNS}
+        self.columns["Index"] = np.arange(count)
+        self.columns["FileID"] = np.array(file_ids, dtype=np.uint64)
+        self.columns["Hash"] = np.array(hashes)
+        self.columns["Size"] = np.full(count, 100)
+        self.names = names or [f"file{i}.dds" for i in range(count)]
+
+    def __len__(self):
+        return len(self.names)
+
+    def column(self, name):
+        return self.columns[name]
+
+    def file_names(self):
+        return self.names
+
+
+@pytest.fixture(autouse=True)
+def in_tmp(tmp_path, monkeypatch):
+    # MNF.db lives in the working directory
+    monkeypatch.chdir(tmp_path)
+
+
+def test_duplicate_file_ids_pair_up_once():
+    big = (1 << 64) - 5
+    pkg_db.save_mnf_table(Table([7, 7, 7, big], [1, 2, 3, 4], ["a", "b", "c", "d"]), True, "old")
+    pkg_db.save_mnf_table(Table([7, 7, 7, 7, big], [1, 9, 3, 5, 4], ["a", "b", "c", "e", "d"]), True, "new")
+    added, removed, changed = pkg_db.diff_mnf_tables(True, "old", "new")
+    assert added == [3]
+    assert removed == []
+    assert [x[0] for x in changed] == [1]
+
+
+def test_text_snapshot_is_upgraded():
+    big = (1 << 64) - 5
+    file_ids = [7, 1234567, big]
+    con = sqlite3.connect("MNF.db")
+    con.execute('CREATE TABLE eso_old (Indexx INTEGER, FileID TEXT, FileIndex INTEGER, ID1 INTEGER, Unk1 INTEGER, Size INTEGER, CompressedSize INTEGER, Hash INTEGER, Offset INTEGER, CompressType INTEGER, ArchiveIndex INTEGER, Unk2 INTEGER, FileName TEXT)')
+    con.executemany('INSERT INTO eso_old VALUES(?, ?, 0, 0, 0, 100, 0, ?, 0, 0, 0, 0, ?)',
+                    [(i, x.to_bytes(8, 'little').hex().upper(), i + 1, f"file{i}.dds") for i, x in enumerate(file_ids)])
+    con.commit()
+    con.close()
+    pkg_db.save_mnf_table(Table(file_ids, [1, 2, 30]), True, "new")
+
+    added, removed, changed = pkg_db.diff_mnf_tables(True, "old", "new")
+    assert added == [] and removed == []
+    assert [x[0] for x in changed] == [2]
+    con = sqlite3.connect("MNF.db")
+    assert con.execute("SELECT DISTINCT typeof(FileID) FROM eso_old").fetchall() == [("integer",)]
+    assert [pkg_db.from_sql_id(x[0]) for x in con.execute("SELECT FileID FROM eso_old ORDER BY Indexx")] == file_ids
+    con.close()
+
+
+def test_pre_snapshot_table_is_refused():
+    con = sqlite3.connect("MNF.db")
+    con.execute('CREATE TABLE eso_old (Indexx INTEGER, FileID TEXT, Hash INTEGER)')
+    con.close()
+    pkg_db.save_mnf_table(Table([7], [1]), True, "new")
+    with pytest.raises(Exception, match="predates patch snapshots"):
+        pkg_db.diff_mnf_tables(True, "old", "new")
+
+
+def test_names_by_id_join_matches_the_linked_table():
+    depot = synth.generate("depot", count=200, models=1, maps=1, placements=4, vertex_count=16, tri_count=8)
+    file_table, _ = game_mnf.load_file_table(use_cache=False, mnf_path=depot["mnf"])
+    pkg_db.save_mnf_table(file_table, True)
+    pkg_db.save_zosft_table(file_table.zosft, True)
+    pkg_db.start_mnf_connection()
+    expected = {file_id: name for file_id, name in zip(file_table.column("FileID").tolist(), file_table.file_names()) if name}
+    names = pkg_db.lookup_names_by_id(file_table.column("FileID").tolist())
+    pkg_db.mnfcon.close()
+    assert expected and names == expected
+
+
+def test_patched_run_keeps_the_lookup_tables_current(monkeypatch):
+    depot = synth.generate("depot", count=60, models=1, maps=1, placements=4, vertex_count=16, tri_count=8)
+    monkeypatch.setattr(game_mnf, "path", depot["mnf"])
+    game_mnf.main(patch="p1", list_path="list.csv")
+    file_table, _ = game_mnf.load_file_table(mnf_path=depot["mnf"])
+
+    con = sqlite3.connect("MNF.db")
+    tables = {x[0] for x in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"eso", "eso_p1", "eso_zosft"} <= tables
+    assert con.execute("SELECT COUNT(*) FROM eso").fetchone()[0] == len(file_table)
+    con.close()
+    pkg_db.start_mnf_connection()
+    row = next(i for i, name in enumerate(file_table.file_names()) if name)
+    file_id = int(file_table.column("FileID")[row])
+    assert pkg_db.lookup(file_id, "Indexx") == (int(file_table.column("Index")[row]),)
+    assert pkg_db.lookup_names_by_id([file_id]) == {file_id: file_table.file_names()[row]}
+    pkg_db.mnfcon.close()
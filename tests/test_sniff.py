@@ -0,0 +1,24 @@
+import zlib
+import sniff
+
+
+class Entry:
+    def __init__(self, compress_type, size):
+        self.CompressType = compress_type
+        self.Size = size
+
+
+class Archives:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def read_entry(self, entry):
+        return self.payload
+
+
+def test_game_entries_use_the_codec_extraction_uses():
+    data = b"\0" * 12 + b"<xml>game</xml>"
+    # Game data is decoded by its magic, whatever CompressType claims
+    entry = Entry(3, len(data))
+    assert sniff.sniff_entry(entry, Archives(zlib.compress(data)), b_game=True) == "xml"
+    assert sniff.sniff_entry(entry, Archives(zlib.compress(data)), b_game=False) is None